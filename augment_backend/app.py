@@ -8,9 +8,16 @@ from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 
 from config import Config
-from database import init_db
+from controllers.backends import configure_backends
+from database import get_log_collection, init_db
+from log_archive import start_archiver
 from routes.auth_routes import auth_bp
 from routes.augmentation_routes import augmentation_bp
+from routes.batch_routes import batch_bp
+from routes.metrics_routes import metrics_bp
+from routes.profile_routes import profile_bp
+from routes.result_routes import result_bp
+from routes.upload_routes import upload_bp
 
 
 # Load environment variables (dotenv handled in config.py)
@@ -22,10 +29,29 @@ jwt = JWTManager()
 bcrypt = Bcrypt()
 
 
-def create_app():
-    """Create and configure the Flask application"""
+def create_app(config_overrides=None, mongo_client=None):
+    """Create and configure the Flask application
+
+    ``config_overrides`` is applied on top of :class:`Config`, and
+    ``mongo_client`` replaces the real MongoDB connection; both are used
+    by the load-test harness to run the app without external services.
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    # Select compute backends for the image operations
+    configure_backends(
+        app.config["COMPUTE_BACKEND"], app.config["COMPUTE_CALIBRATION"]
+    )
+
+    if app.config["PROCESS_WORKERS"] and app.config["STAGE_CACHE_BYTES"]:
+        logger.warning(
+            "PROCESS_WORKERS only offloads random renders while the "
+            "stage cache is enabled; set STAGE_CACHE_BYTES=0 to offload "
+            "basic, advanced and pipeline renders too"
+        )
 
     # Initialize extensions
     CORS(app, origins=["http://localhost:5173"], supports_credentials=True)
@@ -34,7 +60,10 @@ def create_app():
     jwt.init_app(app)
 
     # Initialize database
-    init_db(app)
+    init_db(app, mongo_client)
+
+    # Move old request logs out of MongoDB in the background (opt-in)
+    start_archiver(app.config, get_log_collection)
 
     # Initialize Bcrypt
     bcrypt.init_app(app)
@@ -45,6 +74,11 @@ def create_app():
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/')
     app.register_blueprint(augmentation_bp, url_prefix='/')
+    app.register_blueprint(batch_bp, url_prefix='/')
+    app.register_blueprint(metrics_bp, url_prefix='/')
+    app.register_blueprint(profile_bp, url_prefix='/')
+    app.register_blueprint(result_bp, url_prefix='/')
+    app.register_blueprint(upload_bp, url_prefix='/')
 
     return app
 
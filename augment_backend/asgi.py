@@ -0,0 +1,307 @@
+"""ASGI entry point that keeps client I/O off the augmentation workers.
+
+The Flask app stays a WSGI app; :class:`ASGIBridge` serves it from an
+event loop. A request body is received by the loop and spooled (to
+memory, then to disk past ``ASGI_SPOOL_BYTES``) before the request is
+dispatched, so a client uploading slowly holds no worker thread. The
+Flask view then runs on a bounded pool of ``ASGI_WORKERS`` threads, and
+response chunks are produced there but sent by the loop: a worker is
+handed back between chunks while the client drains the previous one. If
+the client disconnects, a streamed response stops at the next chunk.
+
+Run it with any ASGI server, for example::
+
+    uvicorn --factory asgi:create_asgi_app --port 5001
+"""
+import asyncio
+import contextvars
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Response bytes a worker collects per hand-off to the event loop
+SEND_CHUNK_BYTES = 64 * 1024
+
+
+class _BodyTooLarge(Exception):
+    """A request body exceeded the largest size any route accepts."""
+
+
+class _StartResponse:
+    """WSGI ``start_response`` callable recording status and headers."""
+
+    def __init__(self):
+        self.status = None
+        self.headers = None
+        self.written = []
+
+    def __call__(self, status, headers, exc_info=None):
+        if exc_info is not None and self.status is not None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        self.status = int(status.split(" ", 1)[0])
+        self.headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+        # Legacy write() callable; its data goes out before the body
+        return self.written.append
+
+
+def _latin1(path):
+    """
+    WSGI form of an ASGI path: its UTF-8 bytes read as latin-1.
+    """
+    return path.encode("utf-8").decode("latin-1")
+
+
+def _environ(scope, body, length):
+    """
+    Build the WSGI environ of an ASGI HTTP request with a spooled body.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": _latin1(scope.get("root_path", "")),
+        "PATH_INFO": _latin1(scope["path"]),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(length),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name == "CONTENT_LENGTH":
+            continue
+        if name != "CONTENT_TYPE":
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        if name in environ:
+            value = f"{environ[name]},{value}"
+        environ[name] = value
+    return environ
+
+
+def _pull(iterator, limit=SEND_CHUNK_BYTES):
+    """
+    Collect response chunks until ``limit`` bytes or the end.
+
+    Returns:
+        tuple: The collected bytes and whether the response is complete.
+    """
+    chunks = []
+    size = 0
+    for chunk in iterator:
+        if chunk:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= limit:
+                return b"".join(chunks), False
+    return b"".join(chunks), True
+
+
+def _start(app, environ, start_response):
+    """
+    Call the WSGI app and pull its first chunk, by which time
+    ``start_response`` has been called.
+
+    Returns:
+        tuple: The response iterable, its iterator, the first bytes and
+        whether the response is complete.
+    """
+    iterable = app(environ, start_response)
+    try:
+        iterator = iter(iterable)
+        data, done = _pull(iterator)
+    except BaseException:
+        if hasattr(iterable, "close"):
+            iterable.close()
+        raise
+    return iterable, iterator, data, done
+
+
+class ASGIBridge:
+    """Serve a WSGI app over ASGI with a bounded pool of workers."""
+
+    def __init__(self, app, workers, max_body_bytes,
+                 spool_bytes=1024 * 1024):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.spool_bytes = spool_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="asgi-worker"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        """
+        Acknowledge startup and shut the worker pool down on shutdown.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._executor.shutdown
+                )
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_body(self, scope, receive):
+        """
+        Receive the request body into a spooled temporary file.
+
+        Returns:
+            tuple: The file and its length, or None when the client
+            disconnected first.
+
+        Raises:
+            _BodyTooLarge: If the body exceeds ``max_body_bytes``.
+        """
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit():
+                if int(value) > self.max_body_bytes:
+                    raise _BodyTooLarge()
+
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        length = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            chunk = message.get("body", b"")
+            length += len(chunk)
+            if length > self.max_body_bytes:
+                body.close()
+                raise _BodyTooLarge()
+            # Writes past the spool size go to disk; keep them off the loop
+            if chunk and length > self.spool_bytes:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, body.write, chunk
+                )
+            elif chunk:
+                body.write(chunk)
+            more_body = message.get("more_body", False)
+        body.seek(0)
+        return body, length
+
+    async def _http(self, scope, receive, send):
+        """
+        Serve one HTTP request through the WSGI app.
+        """
+        try:
+            spooled = await self._read_body(scope, receive)
+        except _BodyTooLarge:
+            await send({
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json")],
+            })
+            await send({
+                "type": "http.response.body",
+                "body": b'{"error": "Request body is too large"}',
+            })
+            return
+        if spooled is None:
+            return
+        body, length = spooled
+
+        disconnected = asyncio.Event()
+
+        async def watch():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch())
+        loop = asyncio.get_running_loop()
+        # Every call for this request runs in one context, so Flask's
+        # context variables survive between chunks on different threads
+        context = contextvars.copy_context()
+        start_response = _StartResponse()
+        iterable = None
+        try:
+            iterable, iterator, data, done = await loop.run_in_executor(
+                self._executor, context.run, _start,
+                self.app, _environ(scope, body, length), start_response,
+            )
+            await send({
+                "type": "http.response.start",
+                "status": start_response.status,
+                "headers": start_response.headers,
+            })
+            for written in start_response.written:
+                await send({
+                    "type": "http.response.body",
+                    "body": written,
+                    "more_body": True,
+                })
+            while True:
+                await send({
+                    "type": "http.response.body",
+                    "body": data,
+                    "more_body": not done,
+                })
+                if done or disconnected.is_set():
+                    break
+                data, done = await loop.run_in_executor(
+                    self._executor, context.run, _pull, iterator
+                )
+        finally:
+            watcher.cancel()
+            if hasattr(iterable, "close"):
+                await loop.run_in_executor(
+                    self._executor, context.run, iterable.close
+                )
+            body.close()
+
+
+def _max_body_bytes(config):
+    """
+    Largest request body any route accepts.
+    """
+    return max(
+        config["MAX_CONTENT_LENGTH"],
+        config["BATCH_MAX_CONTENT_LENGTH"],
+        config["UPLOAD_CHUNK_SIZE"],
+    )
+
+
+def create_asgi_app(config_overrides=None, mongo_client=None):
+    """
+    Create the Flask app and wrap it for an ASGI server.
+
+    Takes the same arguments as :func:`app.create_app`.
+    """
+    # Imported here so that importing this module creates no app
+    # pylint: disable=import-outside-toplevel
+    from app import create_app
+
+    app = create_app(config_overrides, mongo_client)
+    return ASGIBridge(
+        app,
+        workers=app.config["ASGI_WORKERS"],
+        max_body_bytes=_max_body_bytes(app.config),
+        spool_bytes=app.config["ASGI_SPOOL_BYTES"],
+    )
+
@@ -0,0 +1 @@
+"""Python client for the augmentation API."""
@@ -0,0 +1,403 @@
+"""Client for the authentication and augmentation routes.
+
+One :class:`AugmentClient` holds a pool of keep-alive connections and the
+current access token, and is safe to share between threads. The token is
+obtained with the client's credentials on first use and renewed shortly
+before it expires or when the server rejects it, so long-running jobs do
+not log in per image.
+
+Usage::
+
+    from augment_client.client import AugmentClient
+
+    with AugmentClient("http://localhost:5001", email, password) as api:
+        api.advanced("cat.png", brightness=1.2, output="cat_bright.png")
+        for job in api.augment_many("random", ["a.png", "b.png"]):
+            print(job.image, job.error or len(job.result))
+"""
+import base64
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from augment_client.transport import (
+    APIError, ConnectionPool, RetryPolicy, encode_multipart, send,
+)
+
+
+# Seconds before its expiry at which a token is renewed
+REFRESH_MARGIN = 60
+
+# Augmentation methods the batch helpers can call, with the extension of
+# the file each returns
+AUGMENT_METHODS = {
+    "random": ".png",
+    "rotate": ".zip",
+    "basic": ".png",
+    "advanced": ".png",
+    "pipeline": ".png",
+}
+
+# Outcome of one image of a batch: the result is the response body, or
+# the output path when written to disk
+BatchResult = namedtuple("BatchResult", ["image", "result", "error"])
+
+
+def _token_expiry(token):
+    """
+    Expiry time of a JWT from its (unverified) ``exp`` claim, or None.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _image_part(image):
+    """
+    Filename and bytes of an image given as a path, bytes, a binary
+    file or a ``(filename, data)`` tuple.
+    """
+    if isinstance(image, tuple):
+        filename, data = image
+        return filename, _image_part(data)[1]
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return "image.png", bytes(image)
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as handle:
+            return os.path.basename(image), handle.read()
+    name = os.path.basename(getattr(image, "name", "") or "image.png")
+    return name, image.read()
+
+
+def _form_value(value):
+    """
+    Form field text of a parameter value.
+    """
+    if isinstance(value, bool):
+        return "on" if value else "off"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+class AugmentClient:
+    """Pooled, token-caching client for the augmentation API."""
+
+    def __init__(self, base_url, email=None, password=None, token=None,
+                 max_connections=8, timeout=120, retry=RetryPolicy()):
+        self.email = email
+        self.password = password
+        self.max_connections = max_connections
+        self.retry = retry
+        self._pool = ConnectionPool(base_url, max_connections, timeout)
+        self._token = token
+        self._token_lock = threading.Lock()
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Authentication
+
+    def _post_json(self, path, payload):
+        _, _, body = send(
+            self._pool, self.retry, "POST", path,
+            body=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        return json.loads(body)
+
+    def register(self, email, password):
+        """
+        Register an account; the server mails a one-time code.
+        """
+        payload = {"email": email, "password": password}
+        return self._post_json("/register", payload)["message"]
+
+    def verify_otp(self, email, otp):
+        """
+        Verify an account with the code mailed on registration.
+        """
+        payload = {"email": email, "otp": str(otp)}
+        return self._post_json("/verify-otp", payload)["message"]
+
+    def login(self, email=None, password=None):
+        """
+        Log in and keep the access token for later requests.
+
+        ``email`` and ``password`` default to the client's credentials;
+        when given they replace them, so later renewals use them too.
+        """
+        if email is not None:
+            self.email, self.password = email, password
+        if not self.email or not self.password:
+            raise ValueError("Logging in needs an email and a password")
+        with self._token_lock:
+            self._token = self._fetch_token()
+            return self._token
+
+    def _fetch_token(self):
+        payload = {"email": self.email, "password": self.password}
+        return self._post_json("/login", payload)["access_token"]
+
+    def _current_token(self, rejected=None):
+        """
+        Return a usable access token, logging in when there is none, it
+        is about to expire or it is the ``rejected`` one.
+
+        Threads that need a new token at the same time log in once.
+        """
+        with self._token_lock:
+            token = self._token
+            if token is not None and token != rejected:
+                expiry = _token_expiry(token)
+                if expiry is None or expiry - time.time() > REFRESH_MARGIN:
+                    return token
+            if not self.email or not self.password:
+                if token is None or token == rejected:
+                    raise ValueError(
+                        "No valid access token and no credentials to log in"
+                    )
+                return token
+            self._token = self._fetch_token()
+            return self._token
+
+    def _authorized(self, method, path, body, headers, output=None):
+        """
+        Send an authenticated request, logging in again once if the
+        server rejects the token.
+
+        With ``output`` the response is streamed to that path (through a
+        temporary file renamed into place) and the path is returned;
+        otherwise the response body is.
+        """
+        token = self._current_token()
+        for renewed in (False, True):
+            request_headers = dict(headers, Authorization=f"Bearer {token}")
+            try:
+                if output is None:
+                    return send(
+                        self._pool, self.retry, method, path, body,
+                        request_headers,
+                    )[2]
+                return self._download(
+                    method, path, body, request_headers, output
+                )
+            except APIError as error:
+                if error.status not in (401, 422) or renewed or (
+                    not self.email or not self.password
+                ):
+                    raise
+                token = self._current_token(rejected=token)
+        raise AssertionError("unreachable")
+
+    def _download(self, method, path, body, headers, output):
+        """
+        Stream a response straight to ``output``.
+        """
+        directory = os.path.dirname(os.path.abspath(output))
+        os.makedirs(directory, exist_ok=True)
+        partial = f"{output}.part"
+        try:
+            with open(partial, "wb") as sink:
+                send(
+                    self._pool, self.retry, method, path, body, headers,
+                    sink=sink,
+                )
+            os.replace(partial, output)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return output
+
+    def _augment(self, path, image, fields, output=None):
+        """
+        Upload ``image`` with form ``fields`` (None values are left out).
+        """
+        form = {
+            name: _form_value(value)
+            for name, value in fields.items() if value is not None
+        }
+        filename, data = _image_part(image)
+        body, content_type = encode_multipart(
+            form, [("image", filename, data)]
+        )
+        return self._authorized(
+            "POST", path, body, {"Content-Type": content_type}, output
+        )
+
+    # Augmentation routes
+
+    def random(self, image, policy=None, quality=None, output=None):
+        """
+        Random augmentation (``/augment/random``), optionally with a
+        RandAugment, TrivialAugment or AutoAugment-style ``policy`` dict.
+
+        Returns:
+            The PNG bytes, or ``output`` once written there.
+        """
+        fields = {"policy": policy, "quality": quality}
+        return self._augment("/augment/random", image, fields, output)
+
+    def rotate(self, image, num_images=36, quality=None, format=None,
+               frame_quality=None, frame_duration=None, long_edge=None,
+               output=None):
+        """
+        ``num_images`` evenly spaced rotations (``/augment/rotate``), as a
+        ZIP of JPEGs or, with ``format`` ``webp``, ``gif`` or ``apng``,
+        one looping animation.
+
+        Returns:
+            The response bytes, or ``output`` once written there.
+        """
+        # pylint: disable=redefined-builtin
+        fields = {
+            "num_images": num_images,
+            "quality": quality,
+            "format": format,
+            "frame_quality": frame_quality,
+            "frame_duration": frame_duration,
+            "long_edge": long_edge,
+        }
+        return self._augment("/augment/rotate", image, fields, output)
+
+    def basic(self, image, operation, angle=None, scale_factor=None,
+              direction=None, quality=None, output=None):
+        """
+        One ``rotate``, ``scale`` or ``flip`` (``/augment/basic``).
+
+        Returns:
+            The PNG bytes, or ``output`` once written there.
+        """
+        fields = {
+            "operation": operation,
+            "angle": angle,
+            "scale_factor": scale_factor,
+            "direction": direction,
+            "quality": quality,
+        }
+        return self._augment("/augment/basic", image, fields, output)
+
+    def advanced(self, image, brightness=None, contrast=None,
+                 saturation=None, blur=None, blur_radius=None,
+                 grayscale=None, output=None):
+        """
+        Colour, blur and grayscale adjustments (``/augment/advanced``).
+
+        Returns:
+            The PNG bytes, or ``output`` once written there.
+        """
+        fields = {
+            "brightness": brightness,
+            "contrast": contrast,
+            "saturation": saturation,
+            "blur": blur,
+            "blur_radius": blur_radius,
+            "grayscale": grayscale,
+        }
+        return self._augment("/augment/advanced", image, fields, output)
+
+    def pipeline(self, image, operations, quality=None, output=None):
+        """
+        An ordered list of operations (``/augment/pipeline``).
+
+        Returns:
+            The PNG bytes, or ``output`` once written there.
+        """
+        fields = {"operations": operations, "quality": quality}
+        return self._augment("/augment/pipeline", image, fields, output)
+
+    # Batch helpers
+
+    def augment_many(self, method, images, workers=None, outputs=None,
+                     **params):
+        """
+        Call an augmentation method for many images concurrently.
+
+        ``method`` is a key of :data:`AUGMENT_METHODS` and ``params`` are
+        its keyword arguments. With ``outputs`` (one path per image) the
+        results are streamed to disk. At most ``workers`` requests
+        (default: the connection pool size) are in flight, and at most
+        twice that many images are read ahead.
+
+        Yields:
+            BatchResult: One per image, in input order; failures are
+            reported in ``error`` rather than raised.
+        """
+        if method not in AUGMENT_METHODS:
+            allowed = ", ".join(AUGMENT_METHODS)
+            raise ValueError(f"Method must be one of {allowed}")
+        func = getattr(self, method)
+        workers = workers or self.max_connections
+        outputs = iter(outputs) if outputs is not None else None
+        images = iter(images)
+        pending = deque()
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="augment-client"
+        ) as executor:
+            def submit_next():
+                for image in images:
+                    output = next(outputs) if outputs is not None else None
+                    pending.append((image, executor.submit(
+                        func, image, output=output, **params
+                    )))
+                    return True
+                return False
+
+            while len(pending) < 2 * workers and submit_next():
+                pass
+
+            while pending:
+                image, future = pending.popleft()
+                submit_next()
+                try:
+                    yield BatchResult(image, future.result(), None)
+                # pylint: disable=broad-exception-caught
+                except Exception as exc:
+                    yield BatchResult(image, None, exc)
+                # pylint: enable=broad-exception-caught
+
+    def augment_directory(self, method, source_dir, output_dir,
+                          workers=None, **params):
+        """
+        Augment every PNG/JPG/JPEG file in ``source_dir`` into
+        ``output_dir``, named ``<stem>_<method>.png`` (``.zip``, or the
+        animation format, for rotate).
+
+        Returns:
+            list: The :class:`BatchResult` of every file.
+        """
+        names = sorted(
+            name for name in os.listdir(source_dir)
+            if name.lower().endswith((".png", ".jpg", ".jpeg"))
+        )
+        extension = AUGMENT_METHODS.get(method, ".png")
+        if method == "rotate" and params.get("format"):
+            extension = f".{params['format']}"
+        outputs = [
+            os.path.join(
+                output_dir,
+                f"{os.path.splitext(name)[0]}_{method}{extension}",
+            )
+            for name in names
+        ]
+        sources = [os.path.join(source_dir, name) for name in names]
+        return list(self.augment_many(
+            method, sources, workers, outputs, **params
+        ))
@@ -0,0 +1,261 @@
+"""Pooled keep-alive HTTP connections with retries.
+
+Built on :mod:`http.client`, so the client needs nothing beyond the
+standard library. Every request checks a connection out of a
+:class:`ConnectionPool` and puts it back once its response has been read,
+so consecutive requests reuse the same sockets instead of opening one per
+image.
+"""
+import email.utils
+import http.client
+import json
+import queue
+import random
+import time
+import uuid
+from collections import namedtuple
+from urllib.parse import urlencode, urlsplit
+
+
+# Statuses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Bytes read per step when streaming a response to disk
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Retry schedule: up to ``attempts`` tries per request, waiting
+# ``backoff * 2 ** n`` seconds (with jitter, at most ``max_backoff``)
+# before try n + 1, or as long as a Retry-After header asks
+RetryPolicy = namedtuple(
+    "RetryPolicy", ["attempts", "backoff", "max_backoff"],
+    defaults=(4, 0.5, 30.0),
+)
+
+
+class APIError(Exception):
+    """The API answered with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+def encode_multipart(fields, files):
+    """
+    Build a multipart/form-data body.
+
+    ``fields`` maps names to string values and ``files`` is a list of
+    ``(field, filename, data)``.
+
+    Returns:
+        tuple: The body bytes and its Content-Type.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode()
+        )
+    for name, filename, data in files:
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n".encode()
+        )
+        parts.append(data)
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _retry_after(response):
+    """
+    Seconds a Retry-After header asks to wait, or None.
+    """
+    value = response.getheader("Retry-After")
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def error_message(status, body):
+    """
+    The ``error`` of a JSON error body, or the body's text.
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if isinstance(payload, dict):
+        for key in ("error", "Error", "msg", "message"):
+            if key in payload:
+                return str(payload[key])
+    return body.decode("utf-8", "replace").strip() or f"HTTP {status}"
+
+
+class ConnectionPool:
+    """Keep-alive connections to one server, shared between threads.
+
+    Up to ``max_connections`` connections are open at once; a request
+    made while all of them are busy waits for one to be returned.
+    """
+
+    def __init__(self, base_url, max_connections=8, timeout=120):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("Base URL must start with http:// or https://")
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._connection_class = (
+            http.client.HTTPSConnection if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        # None marks a slot whose connection is yet to be opened
+        self._idle = queue.LifoQueue()
+        for _ in range(max_connections):
+            self._idle.put(None)
+
+    def _checkout(self):
+        connection = self._idle.get()
+        if connection is None:
+            connection = self._connection_class(
+                self.host, self.port, timeout=self.timeout
+            )
+        return connection
+
+    def _checkin(self, connection):
+        self._idle.put(connection)
+
+    def request(self, method, path, body=None, headers=None, query=None):
+        """
+        Send one request and return ``(connection, response)``.
+
+        The caller must read the response and pass both to
+        :meth:`release`. A connection the server closed while idle is
+        reopened once before an error is raised.
+        """
+        url = self.prefix + path
+        if query:
+            url = f"{url}?{urlencode(query)}"
+        connection = self._checkout()
+        # Only a connection that has already served requests can have
+        # gone stale while idle
+        stale = connection.sock is not None
+        while True:
+            try:
+                connection.request(method, url, body=body,
+                                   headers=headers or {})
+                return connection, connection.getresponse()
+            except (ConnectionError, http.client.BadStatusLine):
+                connection.close()
+                if stale:
+                    stale = False
+                    continue
+                self._checkin(connection)
+                raise
+            except BaseException:
+                connection.close()
+                self._checkin(connection)
+                raise
+
+    def release(self, connection, response):
+        """
+        Return a connection to the pool once its response is read.
+        """
+        if response.will_close or not response.isclosed():
+            connection.close()
+        self._checkin(connection)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        connections = []
+        while True:
+            try:
+                connections.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for connection in connections:
+            if connection is not None:
+                connection.close()
+            self._idle.put(None)
+
+
+def send(pool, retry, method, path, body=None, headers=None, query=None,
+         sink=None):
+    """
+    Send a request, retrying connection failures and retryable statuses.
+
+    The body of a successful response is returned, or streamed to
+    ``sink`` (a binary file) chunk by chunk when one is given.
+
+    Returns:
+        tuple: The status, the response headers and the body (None when
+        streamed to ``sink``).
+
+    Raises:
+        APIError: If the final response has an error status.
+        OSError: If the server cannot be reached after every attempt.
+    """
+    for attempt in range(retry.attempts):
+        last = attempt == retry.attempts - 1
+        try:
+            connection, response = pool.request(
+                method, path, body, headers, query
+            )
+        except (OSError, http.client.HTTPException):
+            if last:
+                raise
+            _sleep(retry, attempt, None)
+            continue
+
+        try:
+            if response.status >= 400:
+                data = response.read()
+                if response.status in RETRY_STATUSES and not last:
+                    wait = _retry_after(response)
+                    pool.release(connection, response)
+                    _sleep(retry, attempt, wait)
+                    continue
+                raise APIError(
+                    response.status, error_message(response.status, data)
+                )
+            if sink is None:
+                data = response.read()
+            else:
+                data = None
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    sink.write(chunk)
+            headers_out = dict(response.getheaders())
+        except BaseException:
+            connection.close()
+            pool.release(connection, response)
+            raise
+        pool.release(connection, response)
+        return response.status, headers_out, data
+    raise AssertionError("unreachable")
+
+
+def _sleep(retry, attempt, wait):
+    """
+    Wait before the next attempt.
+    """
+    if wait is None:
+        wait = retry.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+    time.sleep(min(wait, retry.max_backoff))
@@ -0,0 +1,462 @@
+"""Throughput benchmarks for every augmentation controller.
+
+Runs each controller over a matrix of synthetic image sizes, modes and
+parameter sets, and reports ops/sec, p50/p99 latency and peak memory.
+Results are written as JSON and compared against a stored baseline so
+that Pillow upgrades or code changes that slow things down are caught.
+
+Usage (from ``augment_backend``)::
+
+    python -m benchmarks.bench_controllers --quick
+    python -m benchmarks.bench_controllers --update-baseline
+    python -m benchmarks.bench_controllers --fail-on-regression
+
+No network access or sample files are needed; all inputs are generated.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+import PIL
+
+from benchmarks.corpus import (
+    MODES, QUICK_SIZES_MP, SIZES_MP, encode_png, synthetic_image
+)
+from controllers.adv_augmentation import _apply_blur, _augment_image
+from controllers.backends import configure_backends
+from controllers.basic_aug import _basic_rotate, _flip_image, _scale_image
+from controllers.image_rotator import _rotate_and_animate, _rotate_and_zip
+from controllers.pipeline import _run_pipeline
+from controllers.policy import Policy
+from controllers.random_generator import (
+    _apply_random_transformations, _generate_colour_variants,
+    _generate_random_augmentation
+)
+from controllers.tiled import _augment_tiled, _steps_for_augment
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results.json")
+
+# A case benchmarks one controller with one parameter set.
+# ``source`` is "image" for controllers taking a PIL image and "file" for
+# controllers taking an uploaded file; ``max_megapixels`` skips sizes the
+# controller cannot reasonably handle in a benchmark run.
+Case = namedtuple(
+    "Case", ["controller", "label", "call", "source", "max_megapixels"]
+)
+
+
+def _seeded(func):
+    """
+    Wrap a random controller so every iteration draws the same parameters.
+    """
+    def call(source):
+        random.seed(1234)
+        return func(source)
+    return call
+
+
+def _repeat(func, image, times):
+    """
+    Apply ``func`` to ``image`` ``times`` times in a row.
+    """
+    for _ in range(times):
+        image = func(image)
+    return image
+
+
+CASES = [
+    Case("_augment_image", "brightness",
+         lambda img: _augment_image(img, brightness=1.4),
+         "image", None),
+    Case("_augment_image", "all_enhancers",
+         lambda img: _augment_image(
+             img, brightness=1.2, contrast=1.3, saturation=0.7
+         ),
+         "image", None),
+    Case("_augment_image", "blur_grayscale",
+         lambda img: _augment_image(img, blur=True, grayscale=True),
+         "image", None),
+    # Stronger blur: repeated fixed-kernel passes against one Gaussian
+    # pass, whose cost should stay flat as the radius grows
+    Case("_apply_blur", "fixed_x1",
+         lambda img: _apply_blur(img),
+         "image", None),
+    Case("_apply_blur", "fixed_x8",
+         lambda img: _repeat(_apply_blur, img, 8),
+         "image", None),
+    Case("_apply_blur", "fixed_x32",
+         lambda img: _repeat(_apply_blur, img, 32),
+         "image", 4.0),
+    Case("_apply_blur", "radius_2",
+         lambda img: _apply_blur(img, 2),
+         "image", None),
+    Case("_apply_blur", "radius_8",
+         lambda img: _apply_blur(img, 8),
+         "image", None),
+    Case("_apply_blur", "radius_32",
+         lambda img: _apply_blur(img, 32),
+         "image", None),
+    Case("_basic_rotate", "angle_90",
+         lambda img: _basic_rotate(img, 90),
+         "image", None),
+    Case("_basic_rotate", "angle_33",
+         lambda img: _basic_rotate(img, 33),
+         "image", None),
+    Case("_basic_rotate", "angle_33_fast",
+         lambda img: _basic_rotate(img, 33, "fast"),
+         "image", None),
+    Case("_basic_rotate", "angle_33_balanced",
+         lambda img: _basic_rotate(img, 33, "balanced"),
+         "image", None),
+    Case("_basic_rotate", "angle_33_best",
+         lambda img: _basic_rotate(img, 33, "best"),
+         "image", None),
+    Case("_scale_image", "factor_0.5",
+         lambda img: _scale_image(img, 0.5),
+         "image", None),
+    Case("_scale_image", "factor_0.5_fast",
+         lambda img: _scale_image(img, 0.5, "fast"),
+         "image", None),
+    Case("_scale_image", "factor_0.5_balanced",
+         lambda img: _scale_image(img, 0.5, "balanced"),
+         "image", None),
+    Case("_scale_image", "factor_0.5_best",
+         lambda img: _scale_image(img, 0.5, "best"),
+         "image", None),
+    Case("_scale_image", "factor_2.0",
+         lambda img: _scale_image(img, 2.0),
+         "image", 12.0),
+    Case("_flip_image", "horizontal",
+         lambda img: _flip_image(img, "horizontal"),
+         "image", None),
+    Case("_flip_image", "vertical",
+         lambda img: _flip_image(img, "vertical"),
+         "image", None),
+    Case("_rotate_and_zip", "num_images_4",
+         lambda buf: _rotate_and_zip(buf, 4),
+         "file", 12.0),
+    Case("_rotate_and_zip", "num_images_36",
+         lambda buf: _rotate_and_zip(buf, 36),
+         "file", 1.0),
+    Case("_rotate_and_animate", "webp_36_edge_512",
+         lambda buf: _rotate_and_animate(buf, 36, long_edge=512),
+         "file", 12.0),
+    Case("_run_pipeline", "rotate_brightness_flip",
+         lambda img: _run_pipeline(img, [
+             {"type": "rotate", "angle": 33},
+             {"type": "brightness", "value": 1.3},
+             {"type": "flip", "direction": "horizontal"},
+         ]),
+         "image", None),
+    Case("_augment_tiled", "all_enhancers",
+         lambda buf: _augment_tiled(buf, _steps_for_augment(
+             brightness=1.2, contrast=1.3, saturation=0.7
+         )).close(),
+         "file", None),
+    Case("_augment_tiled", "blur_grayscale",
+         lambda buf: _augment_tiled(buf, _steps_for_augment(
+             blur=True, grayscale=True
+         )).close(),
+         "file", None),
+    # Random scaling goes up to 10x per side, so keep sources small
+    Case("_apply_random_transformations", "seeded",
+         _seeded(_apply_random_transformations),
+         "image", 1.0),
+    Case("_generate_random_augmentation", "seeded",
+         _seeded(_generate_random_augmentation),
+         "file", 1.0),
+    Case("Policy.apply", "randaugment_2_9",
+         _seeded(lambda img: Policy.from_spec(
+             {"type": "randaugment", "num_ops": 2, "magnitude": 9}
+         ).apply(img)),
+         "image", None),
+    Case("_generate_colour_variants", "variants_16",
+         _seeded(lambda img: list(_generate_colour_variants(img, 16))),
+         "image", 12.0),
+]
+
+
+class _PeakMemory:
+    """Track peak memory growth while a benchmark case runs.
+
+    On Linux the resident set size is sampled from ``/proc`` so that
+    Pillow's native allocations are included; elsewhere tracemalloc is
+    used, which only sees Python-level allocations.
+    """
+
+    STATM = "/proc/self/statm"
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.use_rss = os.path.exists(self.STATM)
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if self.use_rss else 0
+        self.peak = 0
+        self._start = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rss(self):
+        with open(self.STATM, encoding="ascii") as handle:
+            return int(handle.read().split()[1]) * self.page_size
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        gc.collect()
+        if self.use_rss:
+            self._start = self.peak = self._rss()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.use_rss:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self._rss())
+        else:
+            _, self.peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    @property
+    def peak_mb(self):
+        """
+        Peak growth over the starting footprint, in megabytes.
+        """
+        return max(0, self.peak - self._start) / (1024 * 1024)
+
+
+def _percentile(samples, fraction):
+    """
+    Return the ``fraction`` percentile of ``samples`` (nearest rank).
+    """
+    ordered = sorted(samples)
+    rank = int(round(fraction * len(ordered)))
+    return ordered[min(len(ordered) - 1, max(0, rank - 1))]
+
+
+def run_case(case, image, png_bytes, min_iterations, min_time):
+    """
+    Time one case on one source image and return its result record.
+    """
+    def make_source():
+        if case.source == "file":
+            png_bytes.seek(0)
+            return png_bytes
+        return image
+
+    # Warm-up run, also catches unsupported mode/parameter combinations
+    case.call(make_source())
+
+    timings = []
+    with _PeakMemory() as memory:
+        started = time.perf_counter()
+        while (
+            len(timings) < min_iterations
+            or time.perf_counter() - started < min_time
+        ):
+            source = make_source()
+            start = time.perf_counter()
+            case.call(source)
+            timings.append(time.perf_counter() - start)
+
+    total = sum(timings)
+    return {
+        "controller": case.controller,
+        "params": case.label,
+        "iterations": len(timings),
+        "ops_per_sec": len(timings) / total if total else None,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": _percentile(timings, 0.50) * 1000,
+        "p99_ms": _percentile(timings, 0.99) * 1000,
+        "peak_mem_mb": memory.peak_mb,
+    }
+
+
+def result_key(result):
+    """
+    Identify a result so it can be matched against the baseline.
+    """
+    return (
+        result["controller"],
+        result["params"],
+        result["mode"],
+        result["size_mp"],
+    )
+
+
+def run_matrix(sizes, modes, controllers=None, min_iterations=3,
+               min_time=0.5, log=print):
+    """
+    Run every selected case over the size and mode matrix.
+    """
+    results = []
+    for size_mp in sizes:
+        for mode in modes:
+            image = synthetic_image(size_mp, mode)
+            png_bytes = None
+            for case in CASES:
+                if controllers and case.controller not in controllers:
+                    continue
+                if case.max_megapixels and size_mp > case.max_megapixels:
+                    continue
+                if case.source == "file" and png_bytes is None:
+                    png_bytes = encode_png(image)
+
+                try:
+                    result = run_case(
+                        case, image, png_bytes, min_iterations, min_time
+                    )
+                # pylint: disable=broad-exception-caught
+                except Exception as exc:
+                    log(f"SKIP {case.controller}[{case.label}] "
+                        f"{size_mp}MP {mode}: {exc}")
+                    continue
+                # pylint: enable=broad-exception-caught
+
+                result.update({
+                    "mode": mode,
+                    "size_mp": size_mp,
+                    "width": image.width,
+                    "height": image.height,
+                })
+                results.append(result)
+                log(
+                    f"{case.controller:<32}{case.label:<16}"
+                    f"{size_mp:>6}MP {mode:<5}"
+                    f"{result['ops_per_sec']:>10.2f} ops/s"
+                    f"{result['p50_ms']:>10.1f} p50ms"
+                    f"{result['p99_ms']:>10.1f} p99ms"
+                    f"{result['peak_mem_mb']:>9.1f} MB"
+                )
+            del image, png_bytes
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return results whose throughput fell more than ``tolerance`` below
+    the baseline, as (result, baseline_ops_per_sec, change) tuples.
+    """
+    reference = {
+        result_key(item): item for item in baseline.get("results", [])
+    }
+    regressions = []
+    for result in results:
+        previous = reference.get(result_key(result))
+        if not previous or not previous.get("ops_per_sec"):
+            continue
+        change = result["ops_per_sec"] / previous["ops_per_sec"] - 1.0
+        if change < -tolerance:
+            regressions.append((result, previous["ops_per_sec"], change))
+    return regressions
+
+
+def environment():
+    """
+    Describe the machine and library versions a run was made with.
+    """
+    return {
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quick", action="store_true",
+                        help="only run the small sizes")
+    parser.add_argument("--sizes", type=float, nargs="+",
+                        help="image sizes in megapixels")
+    parser.add_argument("--modes", nargs="+", choices=MODES,
+                        help="image modes to cover")
+    parser.add_argument("--controllers", nargs="+",
+                        help="only run these controller functions")
+    parser.add_argument("--min-iterations", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.5,
+                        help="minimum seconds spent per case")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed throughput drop before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--backend", default="pillow",
+                        help="compute backend: pillow, numpy, opencv or auto")
+    parser.add_argument("--calibration",
+                        help="calibration table used by --backend auto")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    args = _parse_args(argv)
+    configure_backends(args.backend, args.calibration)
+    sizes = args.sizes or (QUICK_SIZES_MP if args.quick else SIZES_MP)
+    modes = args.modes or MODES
+
+    results = run_matrix(
+        sizes, modes, args.controllers, args.min_iterations, args.min_time
+    )
+    report = {
+        "environment": dict(environment(), backend=args.backend),
+        "results": results,
+    }
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Baseline updated at {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for result, previous, change in regressions:
+        print(
+            f"REGRESSION {result['controller']}[{result['params']}] "
+            f"{result['size_mp']}MP {result['mode']}: "
+            f"{previous:.2f} -> {result['ops_per_sec']:.2f} ops/s "
+            f"({change:+.1%})"
+        )
+    if not regressions:
+        print("No regressions against baseline")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
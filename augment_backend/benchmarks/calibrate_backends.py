@@ -0,0 +1,62 @@
+"""Offline calibration of the compute backends.
+
+Times every available backend (Pillow, NumPy and OpenCV when installed)
+on each core operation at one representative size per size class,
+checks its output against Pillow within the documented tolerances, and
+writes the fastest choice per operation and size class as JSON. Point
+``COMPUTE_CALIBRATION`` at the file and set ``COMPUTE_BACKEND=auto`` to
+use it.
+
+Usage (from ``augment_backend``)::
+
+    python -m benchmarks.calibrate_backends --output backends.json
+    python -m benchmarks.calibrate_backends --quick --repeats 1
+"""
+import argparse
+import sys
+
+from controllers.backends import (
+    CALIBRATION_MEGAPIXELS, QUICK_CALIBRATION_MEGAPIXELS, calibrate,
+    save_calibration
+)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.calibrate_backends",
+        description=__doc__.split("\n")[0],
+    )
+    parser.add_argument("--output", default="backends.json",
+                        help="where to write the calibration table")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="timed runs per backend; the best is kept")
+    parser.add_argument("--quick", action="store_true",
+                        help="calibrate on smaller images")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    megapixels = (
+        QUICK_CALIBRATION_MEGAPIXELS if args.quick
+        else CALIBRATION_MEGAPIXELS
+    )
+    table, timings = calibrate(megapixels, args.repeats)
+
+    for op, classes in timings.items():
+        for size_class, results in classes.items():
+            ranked = "  ".join(
+                f"{name} {seconds * 1000:8.2f}ms"
+                for name, seconds in sorted(
+                    results.items(), key=lambda item: item[1]
+                )
+            )
+            print(f"{op:<12} {size_class:<8} {ranked}")
+
+    save_calibration(args.output, table, timings)
+    print(f"Calibration written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Reproducible synthetic image corpora for benchmarks.
+
+Images are generated from a fixed seed so that every run, on every
+machine, processes exactly the same pixels. The content mixes smooth
+gradients with noise so that encoders and filters see realistic work
+rather than flat colour.
+"""
+import io
+import math
+import random
+
+from PIL import Image, ImageChops, ImageDraw
+
+
+# Target sizes in megapixels covered by the full matrix
+SIZES_MP = (0.1, 1.0, 5.0, 12.0, 50.0)
+
+# Smaller matrix for quick local checks
+QUICK_SIZES_MP = (0.1, 1.0)
+
+MODES = ("RGB", "RGBA", "L", "P")
+
+# 4:3 aspect ratio, close to what cameras produce
+ASPECT = 4 / 3
+
+# Odd-sized noise patch so tiling does not line up with filter kernels
+NOISE_TILE = (257, 263)
+
+
+def dimensions_for(megapixels):
+    """
+    Return (width, height) for a 4:3 image of roughly ``megapixels``.
+    """
+    pixels = megapixels * 1_000_000
+    height = max(1, int(math.sqrt(pixels / ASPECT)))
+    width = max(1, int(height * ASPECT))
+    return width, height
+
+
+def _noise(size, rng):
+    """
+    Tile a seeded noise patch over ``size``; values span 0..31.
+    """
+    tile_width, tile_height = NOISE_TILE
+    bands = [
+        Image.frombytes(
+            "L",
+            NOISE_TILE,
+            bytes(value & 31 for value in rng.randbytes(
+                tile_width * tile_height
+            )),
+        )
+        for _ in range(3)
+    ]
+    tile = Image.merge("RGB", bands)
+
+    noise = Image.new("RGB", size)
+    for top in range(0, size[1], tile_height):
+        for left in range(0, size[0], tile_width):
+            noise.paste(tile, (left, top))
+    return noise
+
+
+def synthetic_image(megapixels, mode="RGB", seed=0):
+    """
+    Generate a deterministic test image of the given size and mode.
+    """
+    width, height = dimensions_for(megapixels)
+
+    # Smooth colour field from scaled-up linear gradients
+    red = Image.linear_gradient("L").resize((width, height))
+    green = red.transpose(Image.Transpose.ROTATE_90).resize((width, height))
+    blue = Image.radial_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (red, green, blue))
+
+    # Seeded noise so entropy coders and filters have real work to do
+    rng = random.Random(seed)
+    image = ImageChops.add(
+        image, _noise((width, height), rng), scale=1.0, offset=-16
+    )
+
+    # A few seeded shapes add hard edges
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = min(width, x0 + rng.randrange(1, max(2, width // 4)))
+        y1 = min(height, y0 + rng.randrange(1, max(2, height // 4)))
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle((x0, y0, x1, y1), fill=fill)
+
+    if mode == "RGB":
+        return image
+    if mode == "RGBA":
+        alpha = Image.linear_gradient("L").resize((width, height))
+        image.putalpha(alpha)
+        return image
+    if mode == "L":
+        return image.convert("L")
+    if mode == "P":
+        return image.convert("P", dither=Image.Dither.NONE)
+    raise ValueError(f"Unsupported mode: {mode}")
+
+
+def encode_png(image):
+    """
+    Encode an image as PNG into a rewound in-memory buffer.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1 @@
+"""Offline bulk augmentation of image datasets."""
@@ -0,0 +1,7 @@
+"""Allow ``python -m bulk``."""
+import sys
+
+from bulk.cli import main
+
+
+sys.exit(main())
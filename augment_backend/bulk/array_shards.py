@@ -0,0 +1,277 @@
+"""Fixed-shape uint8 frame shards backed by memory-mapped ``.npy`` files.
+
+Each shard ``frames-NNNNN.npy`` holds up to ``frames_per_shard`` frames
+of shape ``(height, width, channels)``. A sidecar ``index.jsonl`` lists,
+for every stored frame, its shard, offset, source file and operation
+parameters, so training loaders can slice frames straight out of the
+memory map without decoding anything::
+
+    frames, index = open_shards("out/")
+    record = index[1234]
+    pixels = frames[record["shard"]][record["offset"]]
+
+Frames are only added to the index after the shard has been flushed, so
+re-running over the same directory appends after the last indexed frame
+and overwrites anything a crashed run left unindexed. Shards are
+preallocated to ``frames_per_shard`` frames; closing the writer trims the
+last one to the frames it holds (it grows back when appending), and
+``open_shards`` slices every shard to its indexed frames.
+"""
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+INDEX_NAME = "index.jsonl"
+META_NAME = "meta.json"
+CHANNELS = {"L": 1, "RGB": 3, "RGBA": 4}
+FIT_MODES = ("resize", "pad", "crop")
+
+
+def fit_frame(image, size, mode="RGB", fit="pad"):
+    """
+    Bring an image to the exact frame size and mode.
+
+    ``resize`` stretches, ``pad`` letterboxes with black keeping the
+    aspect ratio, and ``crop`` fills the frame and center-crops.
+    """
+    if image.mode != mode:
+        image = image.convert(mode)
+    if image.size == tuple(size):
+        return image
+    if fit == "resize":
+        return image.resize(size, Image.Resampling.BILINEAR)
+    if fit == "crop":
+        return ImageOps.fit(image, size, Image.Resampling.BILINEAR)
+    if fit == "pad":
+        return ImageOps.pad(image, size, Image.Resampling.BILINEAR)
+    raise ValueError(f"Fit must be one of {', '.join(FIT_MODES)}")
+
+
+def _set_frame_count(path, frames):
+    """
+    Rewrite a shard's header for ``frames`` frames and resize its file
+    to match, dropping or zero-filling frames at the end.
+
+    numpy pads ``.npy`` headers so the first axis can grow without
+    moving the data, so the header keeps its length.
+    """
+    with open(path, "r+b") as handle:
+        version = np.lib.format.read_magic(handle)
+        if version == (1, 0):
+            read_header = np.lib.format.read_array_header_1_0
+            write_header = np.lib.format.write_array_header_1_0
+        else:
+            read_header = np.lib.format.read_array_header_2_0
+            write_header = np.lib.format.write_array_header_2_0
+        shape, fortran_order, dtype = read_header(handle)
+        data_offset = handle.tell()
+
+        header = io.BytesIO()
+        write_header(header, {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": fortran_order,
+            "shape": (frames,) + shape[1:],
+        })
+        if header.tell() != data_offset:
+            raise ValueError(f"Cannot resize shard {path} in place")
+        handle.seek(0)
+        handle.write(header.getvalue())
+        frame_bytes = dtype.itemsize * int(np.prod(shape[1:]))
+        handle.truncate(data_offset + frames * frame_bytes)
+
+
+def frame_array(image):
+    """
+    Return an image's pixels as an ``(H, W, C)`` uint8 array.
+    """
+    array = np.asarray(image, dtype=np.uint8)
+    if array.ndim == 2:
+        array = array[:, :, np.newaxis]
+    return array
+
+
+class ArrayShardWriter:
+    """Append fixed-shape frames to memory-mapped ``.npy`` shards."""
+
+    def __init__(self, output_dir, frame_size, frame_mode="RGB",
+                 frames_per_shard=4096, commit_every=256):
+        if frame_mode not in CHANNELS:
+            raise ValueError(
+                f"Frame mode must be one of {', '.join(CHANNELS)}"
+            )
+        width, height = frame_size
+        self.output_dir = output_dir
+        self.frame_shape = (height, width, CHANNELS[frame_mode])
+        self.frame_mode = frame_mode
+        self.frames_per_shard = frames_per_shard
+        self.commit_every = commit_every
+        self.index_path = os.path.join(output_dir, INDEX_NAME)
+
+        os.makedirs(output_dir, exist_ok=True)
+        self._check_meta()
+        self._shard_id, self._offset = self._resume_position()
+        self._array = None
+        self._pending = []
+
+    def _check_meta(self):
+        """
+        Store the frame layout, or verify it when appending.
+        """
+        meta = {
+            "frame_shape": list(self.frame_shape),
+            "frame_mode": self.frame_mode,
+            "dtype": "uint8",
+            "frames_per_shard": self.frames_per_shard,
+        }
+        path = os.path.join(self.output_dir, META_NAME)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                existing = json.load(handle)
+            if existing != meta:
+                raise ValueError(
+                    f"Output holds frames of layout {existing}, "
+                    f"cannot append {meta}"
+                )
+            return
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump(meta, handle, indent=2)
+
+    def _resume_position(self):
+        """
+        Return (shard id, offset) just after the last indexed frame.
+        """
+        last = None
+        for record in read_index(self.output_dir):
+            last = record
+        if last is None:
+            return 0, 0
+        shard_id = int(last["shard"].split("-")[1].split(".")[0])
+        return shard_id, last["offset"] + 1
+
+    def completed_sources(self):
+        """
+        Return the set of sources with frames in the index.
+        """
+        return {record["source"] for record in read_index(self.output_dir)}
+
+    def _shard_name(self):
+        return f"frames-{self._shard_id:05d}.npy"
+
+    def _open_shard(self):
+        path = os.path.join(self.output_dir, self._shard_name())
+        if os.path.exists(path):
+            if np.load(path, mmap_mode="r").shape[0] < self.frames_per_shard:
+                # Trimmed when the last run closed
+                _set_frame_count(path, self.frames_per_shard)
+            self._array = np.load(path, mmap_mode="r+")
+        else:
+            self._array = np.lib.format.open_memmap(
+                path,
+                mode="w+",
+                dtype=np.uint8,
+                shape=(self.frames_per_shard,) + self.frame_shape,
+            )
+
+    def _roll_shard(self):
+        # Pending records stay pending so a source is never half-indexed
+        self._array.flush()
+        self._array = None
+        self._shard_id += 1
+        self._offset = 0
+
+    def add(self, source, entries):
+        """
+        Store frames for one source.
+
+        ``entries`` are ``(name, frame, params)`` where ``frame`` is an
+        array already matching the frame shape.
+        """
+        for name, frame, params in entries:
+            if frame.shape != self.frame_shape:
+                raise ValueError(
+                    f"Frame for {name} has shape {frame.shape}, "
+                    f"expected {self.frame_shape}"
+                )
+            if self._offset >= self.frames_per_shard:
+                self._roll_shard()
+            if self._array is None:
+                self._open_shard()
+            self._array[self._offset] = frame
+            self._pending.append({
+                "shard": self._shard_name(),
+                "offset": self._offset,
+                "source": source,
+                "name": name,
+                "params": params,
+            })
+            self._offset += 1
+        if len(self._pending) >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """
+        Flush written frames to disk, then add them to the index.
+        """
+        if not self._pending:
+            return
+        if self._array is not None:
+            self._array.flush()
+        with open(self.index_path, "a", encoding="utf-8") as handle:
+            for record in self._pending:
+                handle.write(json.dumps(record, default=str) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._pending = []
+
+    def close(self):
+        """
+        Commit pending frames, release the memory map and trim the last
+        shard to the frames written.
+        """
+        self.commit()
+        if self._array is None:
+            return
+        self._array = None
+        _set_frame_count(
+            os.path.join(self.output_dir, self._shard_name()), self._offset
+        )
+
+
+def read_index(output_dir):
+    """
+    Yield index records of a shard directory in write order.
+    """
+    path = os.path.join(output_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def open_shards(output_dir):
+    """
+    Open every shard read-only for slicing, cut to its indexed frames.
+
+    Returns:
+        tuple: ``{shard name: memmap}`` and the list of index records.
+    """
+    index = list(read_index(output_dir))
+    counts = {}
+    for record in index:
+        counts[record["shard"]] = max(
+            counts.get(record["shard"], 0), record["offset"] + 1
+        )
+    shards = {
+        name: np.load(
+            os.path.join(output_dir, name), mmap_mode="r"
+        )[:counts[name]]
+        for name in sorted(counts)
+    }
+    return shards, index
@@ -0,0 +1,318 @@
+"""Command-line tool for augmenting whole image datasets offline.
+
+Walks an input directory tree, spreads the work over a process pool in
+chunks, and writes the results into size-bounded tar or ZIP shards, or
+into memory-mapped ``.npy`` frame shards for training loaders.
+Interrupted runs pick up where they stopped: sources recorded in the
+output journal (or frame index) are skipped.
+
+Usage (from ``augment_backend``)::
+
+    python -m bulk INPUT OUTPUT pipeline --operations '[{"type": "flip"}]'
+    python -m bulk INPUT OUTPUT rotate --num-images 36 --format jpeg
+    python -m bulk INPUT OUTPUT random --variants 4 --seed 7
+    python -m bulk INPUT OUTPUT random --variants 32 --colour-only
+    python -m bulk INPUT OUTPUT random --variants 8 \
+        --policy '{"type": "randaugment", "num_ops": 2, "magnitude": 9}'
+    python -m bulk INPUT OUTPUT --shard-format npy --frame-size 224x224 \
+        rotate --num-images 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from bulk.array_shards import CHANNELS, FIT_MODES, ArrayShardWriter
+from bulk.sharding import Journal, ShardWriter, parse_size
+from bulk.tasks import ENCODERS, process_chunk
+from controllers.basic_aug import QUALITY_TIERS
+from controllers.pipeline import validate_operations
+from controllers.policy import Policy
+
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+
+
+def iter_sources(input_dir):
+    """
+    Yield ``(path, relpath)`` for every image below ``input_dir``,
+    in a stable order.
+    """
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                path = os.path.join(root, name)
+                yield path, os.path.relpath(path, input_dir)
+
+
+def iter_chunks(sources, chunk_size):
+    """
+    Group sources into lists of at most ``chunk_size``.
+    """
+    chunk = []
+    for source in sources:
+        chunk.append(source)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Progress:
+    """Periodic progress and throughput reporting."""
+
+    def __init__(self, workers, interval=5.0, stream=sys.stderr):
+        self.workers = workers
+        self.interval = interval
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.images = 0
+        self.outputs = 0
+        self.failures = 0
+
+    def update(self, images, outputs, failures):
+        """
+        Add finished work and report if the interval has passed.
+        """
+        self.images += images
+        self.outputs += outputs
+        self.failures += failures
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def summary(self):
+        """
+        Return throughput figures for the run so far.
+        """
+        elapsed = time.perf_counter() - self.started
+        rate = self.images / elapsed if elapsed else 0.0
+        return {
+            "images": self.images,
+            "outputs": self.outputs,
+            "failures": self.failures,
+            "elapsed_seconds": elapsed,
+            "images_per_sec": rate,
+            "images_per_sec_per_core": rate / self.workers,
+        }
+
+    def report(self):
+        """
+        Print a one-line progress report.
+        """
+        stats = self.summary()
+        print(
+            f"{stats['images']} images ({stats['failures']} failed), "
+            f"{stats['outputs']} outputs in {stats['elapsed_seconds']:.1f}s: "
+            f"{stats['images_per_sec']:.1f} img/s, "
+            f"{stats['images_per_sec_per_core']:.2f} img/s/core",
+            file=self.stream,
+        )
+
+
+def parse_frame_size(text):
+    """
+    Parse ``WIDTHxHEIGHT`` into a (width, height) tuple.
+    """
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Frame size must look like 224x224, got {text}"
+        ) from None
+    return width, height
+
+
+def run(input_dir, output_dir, spec, workers, chunk_size, writer,
+        journal, retry_failed=False):
+    """
+    Process every pending source and return the final throughput summary.
+    """
+    done = writer.completed_sources()
+    if not retry_failed:
+        done |= journal.failed_sources()
+    pending_sources = (
+        source for source in iter_sources(input_dir)
+        if source[1] not in done
+    )
+    if done:
+        print(f"Resuming: skipping {len(done)} finished sources",
+              file=sys.stderr)
+
+    progress = Progress(workers)
+    chunks = iter_chunks(pending_sources, chunk_size)
+    in_flight = set()
+    max_in_flight = 2 * workers
+
+    def handle(results):
+        outputs = failures = 0
+        for relpath, entries, error in results:
+            if error is not None:
+                journal.record_failure(relpath, error)
+                failures += 1
+                continue
+            writer.add(relpath, entries)
+            outputs += len(entries)
+        progress.update(len(results), outputs, failures)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk in chunks:
+                in_flight.add(executor.submit(process_chunk, chunk, spec))
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED
+                    )
+                    for future in finished:
+                        handle(future.result())
+            for future in in_flight:
+                handle(future.result())
+    finally:
+        # Whatever has been written so far is committed and will be
+        # skipped when the run is resumed
+        writer.close()
+
+    progress.report()
+    return progress.summary()
+
+
+def _load_operations(text):
+    """
+    Read operations (or a policy) from a JSON string, or from a file
+    given as ``@path``.
+    """
+    if text.startswith("@"):
+        with open(text[1:], encoding="utf-8") as handle:
+            return json.load(handle)
+    return json.loads(text)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m bulk", description=__doc__.split("\n")[0]
+    )
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=32,
+                        help="images per task sent to a worker")
+    parser.add_argument("--shard-format", choices=("tar", "zip", "npy"),
+                        default="tar")
+    parser.add_argument("--shard-size", type=parse_size, default="1GB",
+                        help="target tar/ZIP shard size, e.g. 512MB")
+    parser.add_argument("--frame-size", type=parse_frame_size,
+                        help="npy frame size as WIDTHxHEIGHT")
+    parser.add_argument("--frame-mode", choices=sorted(CHANNELS),
+                        default="RGB", help="npy frame channels")
+    parser.add_argument("--fit", choices=FIT_MODES, default="pad",
+                        help="how outputs are fitted to the npy frame")
+    parser.add_argument("--frames-per-shard", type=int, default=4096)
+    parser.add_argument("--format", choices=sorted(ENCODERS), default="png",
+                        help="encoding of output images")
+    parser.add_argument("--quality", type=int, default=90,
+                        help="quality for lossy output formats")
+    parser.add_argument("--resample", choices=sorted(QUALITY_TIERS),
+                        help="resampling tier for geometric operations")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="reprocess sources that failed previously")
+
+    jobs = parser.add_subparsers(dest="kind", required=True)
+    pipeline = jobs.add_parser(
+        "pipeline", help="apply an operation list to every image"
+    )
+    pipeline.add_argument("--operations", required=True,
+                          help="JSON operation list, or @file.json")
+    rotate = jobs.add_parser(
+        "rotate", help="rotation sequence per image"
+    )
+    rotate.add_argument("--num-images", type=int, default=36)
+    rand = jobs.add_parser(
+        "random", help="random augmentations per image"
+    )
+    rand.add_argument("--variants", type=int, default=1)
+    rand.add_argument("--seed", type=int, default=0)
+    rand.add_argument("--colour-only", action="store_true",
+                      help="only vary brightness, contrast, saturation "
+                           "and grayscale, keeping the geometry")
+    rand.add_argument("--policy",
+                      help="JSON augmentation policy (RandAugment, "
+                           "TrivialAugment or AutoAugment), or @file.json")
+    return parser.parse_args(argv)
+
+
+def build_spec(args):
+    """
+    Turn parsed arguments into the picklable job spec sent to workers.
+    """
+    spec = {"kind": args.kind, "format": args.format,
+            "quality": args.quality, "resample": args.resample}
+    if args.shard_format == "npy":
+        if not args.frame_size:
+            raise ValueError("--frame-size is required for npy output")
+        spec.update({
+            "frame_size": args.frame_size,
+            "frame_mode": args.frame_mode,
+            "fit": args.fit,
+        })
+    if args.kind == "pipeline":
+        operations = _load_operations(args.operations)
+        validate_operations(operations)
+        spec["operations"] = operations
+    elif args.kind == "rotate":
+        if not 1 <= args.num_images <= 360:
+            raise ValueError("--num-images must be between 1 and 360")
+        spec["num_images"] = args.num_images
+    else:
+        if args.variants < 1:
+            raise ValueError("--variants must be at least 1")
+        spec["variants"] = args.variants
+        spec["seed"] = args.seed
+        spec["colour_only"] = args.colour_only
+        if args.policy:
+            if args.colour_only:
+                raise ValueError("--policy cannot be combined with "
+                                 "--colour-only")
+            spec["policy"] = Policy.from_spec(
+                _load_operations(args.policy)
+            ).to_spec()
+    return spec
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    args = _parse_args(argv)
+    try:
+        spec = build_spec(args)
+    except (ValueError, OSError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+    journal = Journal(args.output_dir)
+    try:
+        if args.shard_format == "npy":
+            writer = ArrayShardWriter(
+                args.output_dir, args.frame_size, args.frame_mode,
+                args.frames_per_shard,
+            )
+        else:
+            writer = ShardWriter(
+                args.output_dir, args.shard_format, args.shard_size, journal
+            )
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+    summary = run(
+        args.input_dir, args.output_dir, spec, args.workers,
+        args.chunk_size, writer, journal, args.retry_failed,
+    )
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failures"] == 0 else 1
@@ -0,0 +1,209 @@
+"""Size-bounded tar/ZIP shard output with a resumable journal.
+
+Shards are written as ``shard-NNNNN.<ext>.partial`` and renamed once
+closed. Only then are the sources they contain recorded in the journal,
+so after an interruption every source is either in a finished shard or
+will be processed again; leftover ``.partial`` files, and shards renamed
+but never journaled, are discarded.
+"""
+import io
+import json
+import os
+import re
+import tarfile
+import time
+import zipfile
+
+
+JOURNAL_NAME = "bulk_manifest.jsonl"
+ERRORS_NAME = "bulk_errors.jsonl"
+SHARD_PATTERN = re.compile(r"^shard-(\d+)\.(tar|zip)$")
+
+
+def parse_size(text):
+    """
+    Parse sizes like ``512MB`` or ``2G`` into bytes.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", text, re.I)
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    number, unit = match.groups()
+    power = " KMGT".index(unit.upper() or " ")
+    return int(float(number) * (1024 ** power))
+
+
+class Journal:
+    """Append-only record of committed shards and failed sources."""
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        self.errors_path = os.path.join(output_dir, ERRORS_NAME)
+
+    def completed_sources(self):
+        """
+        Return the set of sources stored in committed shards.
+        """
+        done = set()
+        for record in self._read(self.path):
+            done.update(record["sources"])
+        return done
+
+    def committed_shards(self):
+        """
+        Return the set of shard file names recorded as finished.
+        """
+        return {record["shard"] for record in self._read(self.path)}
+
+    def failed_sources(self):
+        """
+        Return the set of sources that previously failed.
+        """
+        return {record["source"] for record in self._read(self.errors_path)}
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    @staticmethod
+    def _append(path, record):
+        with open(path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def commit_shard(self, shard_name, sources, entries, size):
+        """
+        Record a finished shard and the sources it contains.
+        """
+        self._append(self.path, {
+            "shard": shard_name,
+            "sources": sources,
+            "entries": entries,
+            "bytes": size,
+            "committed_at": time.time(),
+        })
+
+    def record_failure(self, source, error):
+        """
+        Record a source that could not be processed.
+        """
+        self._append(self.errors_path, {"source": source, "error": error})
+
+
+class ShardWriter:
+    """Write entries into numbered tar or ZIP shards of bounded size."""
+
+    def __init__(self, output_dir, shard_format="tar",
+                 max_bytes=1024 ** 3, journal=None):
+        if shard_format not in ("tar", "zip"):
+            raise ValueError("Shard format must be 'tar' or 'zip'")
+        self.output_dir = output_dir
+        self.shard_format = shard_format
+        self.max_bytes = max_bytes
+        self.journal = journal or Journal(output_dir)
+        self.next_index = self._prepare_directory()
+        self.shards_written = 0
+        self._archive = None
+        self._path = None
+        self._sources = []
+        self._entries = 0
+        self._bytes = 0
+
+    def _prepare_directory(self):
+        """
+        Drop unfinished shards and return the next free shard index.
+
+        A shard missing from the journal was interrupted after its rename;
+        its sources are not recorded as done and will be processed again,
+        so keeping it would duplicate them.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        committed = self.journal.committed_shards()
+        next_index = 0
+        for name in os.listdir(self.output_dir):
+            if name.endswith(".partial"):
+                os.remove(os.path.join(self.output_dir, name))
+                continue
+            match = SHARD_PATTERN.match(name)
+            if match is None:
+                continue
+            if name not in committed:
+                os.remove(os.path.join(self.output_dir, name))
+                continue
+            next_index = max(next_index, int(match.group(1)) + 1)
+        return next_index
+
+    def _open(self):
+        name = f"shard-{self.next_index:05d}.{self.shard_format}"
+        self.next_index += 1
+        self._path = os.path.join(self.output_dir, name)
+        if self.shard_format == "tar":
+            self._archive = tarfile.open(self._path + ".partial", "w")
+        else:
+            self._archive = zipfile.ZipFile(
+                self._path + ".partial", "w", zipfile.ZIP_STORED
+            )
+
+    def _write(self, name, data):
+        if self.shard_format == "tar":
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, io.BytesIO(data))
+        else:
+            self._archive.writestr(name, data)
+
+    def completed_sources(self):
+        """
+        Return the set of sources in committed shards.
+        """
+        return self.journal.completed_sources()
+
+    def add(self, source, entries):
+        """
+        Write all output entries of one source to the current shard.
+
+        A source's entries always land in the same shard; the shard is
+        closed once it reaches ``max_bytes``.
+        """
+        if self._archive is None:
+            self._open()
+        for name, data in entries:
+            self._write(name, data)
+            self._entries += 1
+            self._bytes += len(data)
+        self._sources.append(source)
+        if self._bytes >= self.max_bytes:
+            self.close_shard()
+
+    def close_shard(self):
+        """
+        Finish the current shard and commit it to the journal.
+        """
+        if self._archive is None:
+            return
+        self._archive.close()
+        os.replace(self._path + ".partial", self._path)
+        self.journal.commit_shard(
+            os.path.basename(self._path),
+            self._sources,
+            self._entries,
+            self._bytes,
+        )
+        self.shards_written += 1
+        self._archive = None
+        self._sources = []
+        self._entries = 0
+        self._bytes = 0
+
+    def close(self):
+        """
+        Close the writer, committing any open shard.
+        """
+        self.close_shard()
@@ -0,0 +1,157 @@
+"""Work performed inside the bulk process pool.
+
+Workers receive file paths rather than image data, decode the source
+themselves and return encoded output entries, so only compressed bytes
+cross process boundaries. For ``npy`` output they return frames already
+fitted to the target shape instead.
+"""
+import io
+import os
+import random
+import zlib
+
+from PIL import Image
+
+from bulk.array_shards import fit_frame, frame_array
+from controllers.image_rotator import _rotate_frames
+from controllers.pipeline import Pipeline
+from controllers.planner import _to_working_mode, _working_mode
+from controllers.policy import Policy, _generate_policy_variants
+from controllers.random_generator import (
+    _generate_colour_variants, _generate_random_variants
+)
+
+
+# Output encoders: file extension and the Pillow save arguments
+ENCODERS = {
+    "png": ("png", lambda quality: {"format": "PNG"}),
+    "jpeg": ("jpg", lambda quality: {"format": "JPEG", "quality": quality}),
+    "webp": ("webp", lambda quality: {"format": "WEBP", "quality": quality}),
+}
+
+# Pipelines and policies are validated once per worker process, not
+# once per image
+_pipelines = {}
+_policies = {}
+
+
+def _pipeline_for(operations, quality=None):
+    key = (repr(operations), quality)
+    if key not in _pipelines:
+        _pipelines[key] = Pipeline.from_operations(
+            operations
+        ).with_quality(quality)
+    return _pipelines[key]
+
+
+def _policy_for(spec):
+    key = repr(spec)
+    if key not in _policies:
+        _policies[key] = Policy.from_spec(spec)
+    return _policies[key]
+
+
+def _encode(image, spec):
+    """
+    Encode one output image with the job's encoder settings.
+    """
+    _, save_args = ENCODERS[spec["format"]]
+    if spec["format"] == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, **save_args(spec["quality"]))
+    return buffer.getvalue()
+
+
+def _seed_for(relpath, base_seed):
+    """
+    Stable per-file seed so re-runs reproduce the same random outputs.
+    """
+    return zlib.crc32(relpath.encode("utf-8")) ^ base_seed
+
+
+def augment_source(image, relpath, spec):
+    """
+    Apply the job to one decoded image.
+
+    Returns:
+        list: ``(suffix, image, params)`` triples, one per output variant.
+    """
+    kind = spec["kind"]
+    if kind == "pipeline":
+        pipeline = _pipeline_for(spec["operations"], spec.get("resample"))
+        pipeline = pipeline.planned(_working_mode(image))
+        return [
+            ("aug", pipeline.run(image),
+             {"operations": pipeline.to_operations()})
+        ]
+
+    if kind == "rotate":
+        image = _to_working_mode(image)
+        return [
+            (f"rot_{int(angle):03d}", rotated, {"angle": angle})
+            for angle, rotated in _rotate_frames(
+                image, spec["num_images"], spec.get("resample")
+            )
+        ]
+
+    if kind == "random":
+        image = _to_working_mode(image)
+        seed = _seed_for(relpath, spec["seed"])
+        random.seed(seed)
+        if spec.get("policy"):
+            variants = _generate_policy_variants(
+                image, spec["variants"], _policy_for(spec["policy"]),
+                spec.get("resample")
+            )
+        elif spec.get("colour_only"):
+            variants = _generate_colour_variants(image, spec["variants"])
+        else:
+            variants = _generate_random_variants(
+                image, spec["variants"], spec.get("resample")
+            )
+        return [
+            (f"rand_{index:02d}", output, dict(params, seed=seed))
+            for index, (params, output) in enumerate(variants)
+        ]
+
+    raise ValueError(f"Unknown job kind: {kind}")
+
+
+def process_chunk(sources, spec):
+    """
+    Process a chunk of ``(path, relpath)`` sources.
+
+    Returns:
+        list: ``(relpath, entries, error)`` per source. For archive output
+        entries are ``(name, encoded_bytes)``; for ``npy`` output they are
+        ``(name, frame_array, params)`` with frames fitted to the frame
+        size.
+    """
+    extension, _ = ENCODERS[spec["format"]]
+    results = []
+    for path, relpath in sources:
+        try:
+            with Image.open(path) as image:
+                image.load()
+                outputs = augment_source(image, relpath, spec)
+            stem = os.path.splitext(relpath)[0].replace(os.sep, "/")
+            if spec.get("frame_size"):
+                entries = [
+                    (f"{stem}_{suffix}", frame_array(fit_frame(
+                        output, spec["frame_size"], spec["frame_mode"],
+                        spec["fit"]
+                    )), params)
+                    for suffix, output, params in outputs
+                ]
+            else:
+                entries = [
+                    (f"{stem}_{suffix}.{extension}", _encode(output, spec))
+                    for suffix, output, _ in outputs
+                ]
+            results.append((relpath, entries, None))
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            results.append((relpath, [], str(exc)))
+        # pylint: enable=broad-exception-caught
+    return results
@@ -0,0 +1,67 @@
+"""Single-flight coalescing of identical in-flight augmentation requests.
+
+When several requests with the same source image and the same normalized
+parameters arrive while the first one is still being computed, only that
+first request (the leader) does the work; the others (followers) wait
+for its result. Nothing is kept once the leader finishes, so this caps
+duplicate work during bursts without acting as a result cache.
+"""
+import threading
+
+
+class _Call:
+    """One in-flight computation and the outcome its followers wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Run a function at most once at a time per key."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call ``func`` unless an identical call is already running.
+
+        Returns ``(result, shared)`` where ``shared`` tells whether the
+        result came from another request's call. Exceptions raised by the
+        leader are raised in every follower too.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """
+        Return the number of keys currently being computed.
+        """
+        with self._lock:
+            return len(self._calls)
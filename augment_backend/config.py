@@ -1,5 +1,6 @@
 """Application configuration settings."""
 import os
+import tempfile
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -25,8 +26,141 @@ class Config:
     if not MONGO_URI:
         raise ValueError("MONGOURI environment variable not set")
     
-    # File upload limit (5MB)
-    MAX_CONTENT_LENGTH = 5 * 1024 * 1024
+    # File upload limit (5MB by default)
+    MAX_CONTENT_LENGTH = int(
+        os.getenv("MAX_CONTENT_LENGTH", 5 * 1024 * 1024)
+    )
+
+    # Tiled processing: per-pixel operations on images of at least
+    # TILE_THRESHOLD_MEGAPIXELS run tile by tile from memory-mapped
+    # scratch files (in TILE_DIR, the system temp dir by default)
+    TILE_THRESHOLD_MEGAPIXELS = float(
+        os.getenv("TILE_THRESHOLD_MEGAPIXELS", 16)
+    )
+    TILE_SIZE = int(os.getenv("TILE_SIZE", 1024))
+    TILE_WORKERS = int(os.getenv("TILE_WORKERS", os.cpu_count() or 4))
+    TILE_DIR = os.getenv("TILE_DIR") or None
+
+    # Chunked uploads: assembled on disk in UPLOAD_DIR, up to
+    # UPLOAD_MAX_SIZE per file and UPLOAD_CHUNK_SIZE per request, and
+    # removed UPLOAD_TTL seconds after they were started
+    UPLOAD_DIR = os.getenv(
+        "UPLOAD_DIR",
+        os.path.join(tempfile.gettempdir(), "augment_uploads")
+    )
+    UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", 512 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+    UPLOAD_TTL = int(os.getenv("UPLOAD_TTL", 24 * 60 * 60))
+
+    # Preview renders: proxies are downscaled to PREVIEW_LONG_EDGE
+    # pixels, PREVIEW_CACHE_ENTRIES of them are kept per process, and
+    # results are sent as JPEG at PREVIEW_QUALITY
+    PREVIEW_LONG_EDGE = int(os.getenv("PREVIEW_LONG_EDGE", 512))
+    PREVIEW_CACHE_ENTRIES = int(os.getenv("PREVIEW_CACHE_ENTRIES", 64))
+    PREVIEW_QUALITY = int(os.getenv("PREVIEW_QUALITY", 80))
+
+    # Animated rotation sets (/augment/rotate with format=webp, gif or
+    # apng) are rendered at most this many pixels on the long edge
+    # (0 keeps the full resolution)
+    ROTATE_ANIMATION_LONG_EDGE = int(
+        os.getenv("ROTATE_ANIMATION_LONG_EDGE", 512)
+    )
+
+    # Default resampling tier for rotate, scale and random operations:
+    # "fast", "balanced" or "best". Unset keeps each operation's
+    # historical filter; requests may choose a tier with ``quality``.
+    RESAMPLE_QUALITY = os.getenv("RESAMPLE_QUALITY") or None
+
+    # Compute backend for the core image operations: "pillow" (the
+    # reference), "numpy" or "opencv" to prefer one wherever it applies,
+    # or "auto" to pick the fastest per operation and image size from
+    # the calibration table in COMPUTE_CALIBRATION (calibrated quickly
+    # at startup and saved there when missing)
+    COMPUTE_BACKEND = os.getenv("COMPUTE_BACKEND", "pillow")
+    COMPUTE_CALIBRATION = os.getenv("COMPUTE_CALIBRATION") or None
+
+    # Worker processes for random renders (0 runs them in the request's
+    # own process). Basic, advanced and pipeline renders are offloaded
+    # only with STAGE_CACHE_BYTES=0, since cached stages are kept in the
+    # request process. Sources and results are handed over through
+    # shared memory, keeping up to SHARED_FRAME_BYTES of idle segments
+    # per process for reuse.
+    PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", 0))
+    SHARED_FRAME_BYTES = int(
+        os.getenv("SHARED_FRAME_BYTES", 256 * 1024 * 1024)
+    )
+
+    # ASGI serving (asgi.py): views run on ASGI_WORKERS threads while
+    # the event loop handles client I/O; request bodies are spooled in
+    # memory up to ASGI_SPOOL_BYTES, then to disk
+    ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", os.cpu_count() or 4))
+    ASGI_SPOOL_BYTES = int(os.getenv("ASGI_SPOOL_BYTES", 1024 * 1024))
+
+    # HTTP caching of deterministic results: sent with an ETag and
+    # RESULT_CACHE_CONTROL. Rotation sets and batch archives are also
+    # kept in RESULT_DIR, up to RESULT_STORE_BYTES (0 disables), and
+    # served with Range support from /results/<id>.
+    RESULT_CACHE_CONTROL = os.getenv(
+        "RESULT_CACHE_CONTROL", "private, max-age=86400"
+    )
+    RESULT_DIR = os.getenv(
+        "RESULT_DIR",
+        os.path.join(tempfile.gettempdir(), "augment_results")
+    )
+    RESULT_STORE_BYTES = int(
+        os.getenv("RESULT_STORE_BYTES", 1024 * 1024 * 1024)
+    )
+
+    # Log archival (log_archive.py): entries older than
+    # LOG_ARCHIVE_AFTER_DAYS are moved from MongoDB to day-partitioned
+    # files in LOG_ARCHIVE_DIR, LOG_ARCHIVE_BATCH at a time, every
+    # LOG_ARCHIVE_INTERVAL seconds (0 disables the in-process job).
+    # LOG_ARCHIVE_FORMAT is "parquet" (needs pyarrow), "jsonl" (gzip)
+    # or "auto".
+    LOG_ARCHIVE_DIR = os.getenv(
+        "LOG_ARCHIVE_DIR",
+        os.path.join(tempfile.gettempdir(), "augment_log_archive")
+    )
+    LOG_ARCHIVE_AFTER_DAYS = float(os.getenv("LOG_ARCHIVE_AFTER_DAYS", 30))
+    LOG_ARCHIVE_BATCH = int(os.getenv("LOG_ARCHIVE_BATCH", 5000))
+    LOG_ARCHIVE_INTERVAL = float(os.getenv("LOG_ARCHIVE_INTERVAL", 0))
+    LOG_ARCHIVE_FORMAT = os.getenv("LOG_ARCHIVE_FORMAT", "auto")
+
+    # Let identical concurrent requests share one computation
+    COALESCE_REQUESTS = (
+        os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+    )
+
+    # Memory for cached intermediate pipeline results (0 disables)
+    STAGE_CACHE_BYTES = int(
+        os.getenv("STAGE_CACHE_BYTES", 256 * 1024 * 1024)
+    )
+
+    # Batch endpoints: whole-request limit, files per request and the
+    # number of images processed in parallel
+    BATCH_MAX_CONTENT_LENGTH = int(
+        os.getenv("BATCH_MAX_CONTENT_LENGTH", 200 * 1024 * 1024)
+    )
+    BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 500))
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 4))
+
+    # Request profiling (opt-in, disabled by default)
+    # Fraction of augmentation requests profiled at random (0.0 - 1.0)
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+    # Allow clients to request a profile with the X-Profile header
+    PROFILE_ALLOW_HEADER = (
+        os.getenv("PROFILE_ALLOW_HEADER", "false").lower() == "true"
+    )
+    # "cprofile" (deterministic) or "sampling" (stack sampling)
+    PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+    PROFILE_SAMPLE_INTERVAL = float(
+        os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005)
+    )
+    PROFILE_DIR = os.getenv(
+        "PROFILE_DIR",
+        os.path.join(tempfile.gettempdir(), "augment_profiles")
+    )
+    PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", 200))
 
     # Mail configuration
     MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
@@ -1,8 +1,15 @@
-from PIL import Image, ImageEnhance, ImageOps, ImageFilter
+from PIL import Image
 import logging
+import math
+
+from controllers.backends import _dispatch
+from controllers.planner import _grayscale_split, _to_working_mode
 
 logger = logging.getLogger(__name__)
 
+# Largest Gaussian blur radius (standard deviation, in pixels)
+MAX_BLUR_RADIUS = 50.0
+
 
 def _augment_image(
     image: Image.Image,
@@ -10,7 +17,8 @@ def _augment_image(
     contrast: float = 1.0,
     saturation: float = 1.0,
     blur: bool = False,
-    grayscale: bool = False
+    grayscale: bool = False,
+    blur_radius: float = 0.0
 ) -> Image.Image:
     """
     Apply advanced augmentations to a PIL Image
@@ -21,31 +29,95 @@ def _augment_image(
         raise ValueError("Contrast must be between 0.1 and 3.0")
     if not 0.1 <= saturation <= 3.0:
         raise ValueError("Saturation must be between 0.1 and 3.0")
+    if not 0.0 <= blur_radius <= MAX_BLUR_RADIUS:
+        raise ValueError(
+            f"Blur radius must be between 0 and {MAX_BLUR_RADIUS}"
+        )
 
     try:
-        # Enforce RGB early (SRS constraint)
-        img = image.copy().convert('RGB')
-
-        if brightness != 1.0:
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(brightness)
+        # Convert once: to L for grayscale sources, and for grayscale
+        # results as early as that keeps the result the same (then
+        # saturation is a no-op); otherwise to RGB
+        adjustments = (
+            (_adjust_brightness, brightness),
+            (_adjust_contrast, contrast),
+            (_adjust_saturation, saturation),
+        )
+        split = len(adjustments)
+        if grayscale:
+            split = _grayscale_split([factor for _, factor in adjustments])
+        img = _to_working_mode(image, "L" if split == 0 else None)
 
-        if contrast != 1.0:
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(contrast)
+        for index, (adjust, factor) in enumerate(adjustments):
+            if index == split and img.mode != "L":
+                img = _to_grayscale(img)
+            if factor != 1.0 and not (
+                img.mode == "L" and adjust is _adjust_saturation
+            ):
+                img = adjust(img, factor)
 
-        if saturation != 1.0:
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(saturation)
+        if grayscale and img.mode != "L":
+            img = _to_grayscale(img)
 
         if blur:
-            img = img.filter(ImageFilter.BLUR)
-
-        if grayscale:
-            img = ImageOps.grayscale(img)
+            img = _apply_blur(img, blur_radius)
 
+        if img is image:
+            img = image.copy()
         return img
 
     except Exception as e:
         logger.error(f"Advanced augmentation error: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def _adjust_brightness(image, factor):
+    """
+    Scale image brightness (1.0 keeps the original)
+    """
+    return _dispatch("brightness", image, factor)
+
+
+def _adjust_contrast(image, factor, mean=None):
+    """
+    Scale image contrast (1.0 keeps the original)
+
+    ``mean`` overrides the mean luminance blended towards, for callers
+    working on part of a larger image.
+    """
+    return _dispatch("contrast", image, factor, mean)
+
+
+def _adjust_saturation(image, factor):
+    """
+    Scale colour saturation (1.0 keeps the original)
+    """
+    return _dispatch("saturation", image, factor)
+
+
+def _apply_blur(image, radius=0.0):
+    """
+    Blur an image; radius 0 applies Pillow's fixed 5x5 kernel
+
+    Other radii apply a Gaussian blur with that standard deviation.
+    Pillow approximates it with three box-filter passes, so the cost
+    stays about the same however large the radius is.
+    """
+    return _dispatch("blur", image, radius)
+
+
+def _blur_reach(radius=0.0):
+    """
+    How many pixels away from an output pixel ``_apply_blur`` reads
+    """
+    if not radius:
+        return 2
+    # Three box passes, each reaching at most radius + 1 pixels
+    return 3 * (math.ceil(radius) + 1)
+
+
+def _to_grayscale(image):
+    """
+    Convert an image to single-channel grayscale
+    """
+    return _dispatch("grayscale", image)
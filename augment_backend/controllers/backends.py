@@ -0,0 +1,931 @@
+import json
+import logging
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+# Core operations every backend may implement
+OPERATIONS = (
+    "rotate", "resize", "flip", "brightness", "contrast", "saturation",
+    "blur", "grayscale",
+)
+
+# Size classes by megapixels (upper bounds), and the size each class is
+# calibrated at (offline, and scaled down for quick startup runs)
+SIZE_CLASSES = (("small", 1.0), ("medium", 8.0), ("large", math.inf))
+CALIBRATION_MEGAPIXELS = {"small": 0.5, "medium": 4.0, "large": 16.0}
+QUICK_CALIBRATION_MEGAPIXELS = {"small": 0.25, "medium": 1.0, "large": 4.0}
+
+# Largest difference from the Pillow result a backend may produce, as
+# (maximum, mean) absolute difference per channel value. Everything but
+# rotation must agree up to rounding. Calibration, and configuring a
+# backend for every operation, rejects backends outside these bounds.
+TOLERANCES = {
+    "flip": (0, 0.0),
+    "grayscale": (1, 0.5),
+    "brightness": (1, 0.5),
+    "contrast": (1, 0.5),
+    "saturation": (1, 0.5),
+    "resize": (1, 0.5),
+    "blur": (1, 0.5),
+}
+
+# Rotation bounds per resampling filter. Nearest-neighbour sampling may
+# take the next pixel, or the fill, where a source coordinate lands on a
+# pixel boundary, so only its mean is tight.
+ROTATE_TOLERANCES = {
+    Image.Resampling.NEAREST: (255, 0.5),
+    Image.Resampling.BILINEAR: (1, 0.5),
+    Image.Resampling.BICUBIC: (1, 0.5),
+}
+
+# Arguments each operation is timed and checked with during calibration
+CALIBRATION_ARGS = {
+    "rotate": lambda image: (33.0, Image.Resampling.BILINEAR),
+    "resize": lambda image: (
+        (image.width // 2, image.height // 2), Image.Resampling.BICUBIC
+    ),
+    "flip": lambda image: ("horizontal",),
+    "brightness": lambda image: (1.4,),
+    "contrast": lambda image: (1.3,),
+    "saturation": lambda image: (1.5,),
+    "blur": lambda image: (4.0,),
+    "grayscale": lambda image: (),
+}
+
+
+def _size_class(image):
+    """
+    Name of the size class an image falls into.
+    """
+    megapixels = image.width * image.height / 1_000_000
+    for name, limit in SIZE_CLASSES:
+        if megapixels < limit:
+            return name
+    return SIZE_CLASSES[-1][0]
+
+
+class PillowBackend:
+    """
+    Reference implementation; every operation, every mode.
+    """
+
+    name = "pillow"
+
+    def supports(self, op, image, *args):
+        """
+        Every operation runs on Pillow, whatever the image.
+        """
+        return True
+
+    def rotate(self, image, angle, resample=Image.Resampling.NEAREST):
+        """
+        Rotate counter-clockwise with ``expand=True``, filling with black.
+        """
+        return image.rotate(angle, resample, expand=True)
+
+    def resize(self, image, size, resample=None, reducing_gap=None):
+        """
+        Resize with ``resample`` (Pillow's default when None).
+        """
+        return image.resize(size, resample, reducing_gap=reducing_gap)
+
+    def flip(self, image, direction):
+        """
+        Mirror left to right (``horizontal``) or top to bottom.
+        """
+        if direction == "horizontal":
+            return image.transpose(Image.FLIP_LEFT_RIGHT)
+        return image.transpose(Image.FLIP_TOP_BOTTOM)
+
+    def brightness(self, image, factor):
+        """
+        Blend towards black by ``factor``.
+        """
+        return ImageEnhance.Brightness(image).enhance(factor)
+
+    def contrast(self, image, factor, mean=None):
+        """
+        Blend towards the mean grey level (or ``mean``) by ``factor``.
+        """
+        if mean is None:
+            return ImageEnhance.Contrast(image).enhance(factor)
+        degenerate = Image.new("L", image.size, mean).convert(image.mode)
+        return Image.blend(degenerate, image, factor)
+
+    def saturation(self, image, factor):
+        """
+        Blend towards the image's grayscale version by ``factor``.
+        """
+        return ImageEnhance.Color(image).enhance(factor)
+
+    def blur(self, image, radius=0.0):
+        """
+        Gaussian blur of ``radius``, or the fixed 5x5 kernel for 0.
+        """
+        if not radius:
+            return image.filter(ImageFilter.BLUR)
+        return image.filter(ImageFilter.GaussianBlur(radius))
+
+    def grayscale(self, image):
+        """
+        Convert to an L image.
+        """
+        return ImageOps.grayscale(image)
+
+
+def _luma(pixels):
+    """
+    ITU-R 601 luma of an ``(H, W, 3)`` uint8 array, rounded as Pillow does.
+    """
+    weighted = (
+        pixels[..., 0].astype(np.uint32) * 19595
+        + pixels[..., 1].astype(np.uint32) * 38470
+        + pixels[..., 2].astype(np.uint32) * 7471
+        + 0x8000
+    )
+    return (weighted >> 16).astype(np.uint8)
+
+
+def _blend(degenerate, pixels, factor):
+    """
+    ``Image.blend`` on arrays: single-precision, truncated and clipped.
+    """
+    alpha = np.float32(factor)
+    low = np.asarray(degenerate, dtype=np.float32)
+    blended = low + alpha * (pixels.astype(np.float32) - low)
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+
+def _bicubic(x):
+    """
+    Pillow's bicubic kernel (a = -0.5).
+    """
+    x = np.abs(x)
+    near = ((1.5 * x - 2.5) * x) * x + 1.0
+    far = (((x - 5.0) * x + 8.0) * x - 4.0) * -0.5
+    return np.where(x < 1.0, near, np.where(x < 2.0, far, 0.0))
+
+
+def _hamming(x):
+    """
+    Pillow's Hamming-windowed sinc kernel.
+    """
+    x = np.abs(x)
+    # The window's constants are single-precision literals in Pillow
+    window = np.sinc(x) * (
+        float(np.float32(0.54)) + float(np.float32(0.46)) * np.cos(np.pi * x)
+    )
+    return np.where(x < 1.0, window, 0.0)
+
+
+# Pillow's resampling filters: support radius and weight function
+RESAMPLE_FILTERS = {
+    Image.Resampling.BOX: (
+        0.5, lambda x: ((x > -0.5) & (x <= 0.5)).astype(np.float64)
+    ),
+    Image.Resampling.BILINEAR: (
+        1.0, lambda x: np.maximum(1.0 - np.abs(x), 0.0)
+    ),
+    Image.Resampling.HAMMING: (1.0, _hamming),
+    Image.Resampling.BICUBIC: (2.0, _bicubic),
+    Image.Resampling.LANCZOS: (
+        3.0, lambda x: np.where(
+            (x >= -3.0) & (x < 3.0), np.sinc(x) * np.sinc(x / 3.0), 0.0
+        )
+    ),
+}
+
+# Fractional bits of Pillow's fixed-point resampling coefficients
+PRECISION_BITS = 22
+
+# Output pixels computed per step by the NumPy rotation, which bounds
+# its coordinate arrays
+ROTATE_CHUNK_PIXELS = 1 << 20
+
+
+def _nearest_indices(in_size, out_size, start, scale):
+    """
+    Source index of every output pixel of a nearest-neighbour resize,
+    or -1 outside the source; positions are accumulated step by step
+    as Pillow does, rounding errors included.
+    """
+    steps = np.full(out_size, scale)
+    steps[0] = start + scale * 0.5
+    positions = np.cumsum(steps)
+    indices = np.where(positions < 0.0, -1, positions.astype(np.intp))
+    return np.where(indices < in_size, indices, -1)
+
+
+def _resample_axis(pixels, axis, out_size, start, end, resample):
+    """
+    Resample one axis of an array over the input span ``[start, end)``
+    with Pillow's coefficients: the filter is widened by the scale when
+    shrinking, taps past the edge are dropped and renormalized, and the
+    weights are applied in fixed point.
+    """
+    in_size = pixels.shape[axis]
+    # Pillow passes the span in single precision
+    start, end = np.float32(start), np.float32(end)
+    scale = float(end - start) / out_size
+    start = float(start)
+    if resample == Image.Resampling.NEAREST:
+        indices = _nearest_indices(in_size, out_size, start, scale)
+        result = np.take(pixels, np.maximum(indices, 0), axis=axis)
+        outside = [slice(None)] * pixels.ndim
+        outside[axis] = indices < 0
+        result[tuple(outside)] = 0
+        return result
+
+    support, kernel = RESAMPLE_FILTERS[resample]
+    filterscale = max(scale, 1.0)
+    support *= filterscale
+    taps = np.arange(int(math.ceil(support)) * 2 + 1)
+    centers = start + (np.arange(out_size) + 0.5) * scale
+    # Truncation towards zero, as the C code's int() casts
+    low = np.maximum((centers - support + 0.5).astype(np.intp), 0)
+    count = np.minimum(
+        (centers + support + 0.5).astype(np.intp), in_size
+    ) - low
+    weights = kernel(
+        (taps + low[:, np.newaxis] - centers[:, np.newaxis] + 0.5)
+        * (1.0 / filterscale)
+    )
+    weights[taps >= count[:, np.newaxis]] = 0.0
+    # Summed tap by tap, in the C code's order
+    totals = np.zeros(out_size)
+    for tap in range(len(taps)):
+        totals += weights[:, tap]
+    weights = np.divide(
+        weights, totals[:, np.newaxis], out=weights,
+        where=totals[:, np.newaxis] != 0,
+    ) * (1 << PRECISION_BITS)
+    coefficients = np.where(
+        weights < 0, weights - 0.5, weights + 0.5
+    ).astype(np.int32)
+    indices = np.minimum(low[:, np.newaxis] + taps, in_size - 1)
+
+    # Coefficients broadcast along the resampled axis
+    shape = [1] * pixels.ndim
+    shape[axis] = out_size
+    result = np.full(
+        pixels.shape[:axis] + (out_size,) + pixels.shape[axis + 1:],
+        1 << (PRECISION_BITS - 1), dtype=np.int32,
+    )
+    for tap in range(len(taps)):
+        if not coefficients[:, tap].any():
+            continue
+        result += (
+            np.take(pixels, indices[:, tap], axis=axis).astype(np.int32)
+            * coefficients[:, tap].reshape(shape)
+        )
+    return np.clip(result >> PRECISION_BITS, 0, 255).astype(np.uint8)
+
+
+def _reduce(pixels, factor_x, factor_y):
+    """
+    ``Image.reduce``: average ``factor_x`` by ``factor_y`` blocks; the
+    blocks at the right and bottom edges average the pixels they have.
+    Division is by Pillow's 24-bit reciprocal.
+    """
+    height, width = pixels.shape[:2]
+    sums = np.add.reduceat(
+        np.add.reduceat(
+            pixels.astype(np.uint64), np.arange(0, height, factor_y), axis=0
+        ),
+        np.arange(0, width, factor_x), axis=1,
+    )
+    rows = np.minimum(factor_y, height - np.arange(0, height, factor_y))
+    columns = np.minimum(factor_x, width - np.arange(0, width, factor_x))
+    counts = np.outer(rows, columns).astype(np.uint64)
+    if pixels.ndim == 3:
+        counts = counts[..., np.newaxis]
+    multipliers = (
+        np.float32(1 << 32) / (counts << np.uint64(8)).astype(np.float32)
+    ).astype(np.uint64)
+    averages = ((sums + counts // 2) * multipliers) >> np.uint64(24)
+    return averages.astype(np.uint8)
+
+
+def _box_blur_axis(pixels, radius, axis):
+    """
+    One pass of Pillow's box blur along an axis: the ``2r + 1`` pixels
+    around each one count fully and the next pixel on either side by
+    the fractional part of ``radius``; edge pixels are repeated. The
+    weights are Pillow's 24-bit fixed-point ones.
+    """
+    whole = int(radius)
+    full_weight = int(
+        np.float32(1 << 24) / (radius * np.float32(2) + np.float32(1))
+    )
+    edge_weight = ((1 << 24) - (whole * 2 + 1) * full_weight) // 2
+    size = pixels.shape[axis]
+    pad = [(0, 0)] * pixels.ndim
+    pad[axis] = (whole + 1, whole + 1)
+    padded = np.pad(pixels, pad, mode="edge").astype(np.int64)
+    sums = np.cumsum(padded, axis=axis)
+    zero = np.zeros_like(np.take(sums, [0], axis=axis))
+    sums = np.concatenate([zero, sums], axis=axis)
+
+    def span(first, array=sums):
+        return np.take(array, np.arange(first, first + size), axis=axis)
+
+    inner = span(whole * 2 + 2) - span(1)
+    outer = span(0, padded) + span(whole * 2 + 2, padded)
+    bulk = inner * full_weight + outer * edge_weight + (1 << 23)
+    return (bulk >> 24).astype(np.uint8)
+
+
+def _gaussian_box_radius(radius, passes):
+    """
+    Box radius whose ``passes`` repeats approximate a Gaussian of
+    ``radius`` (Pillow's extended box blur, Gwosdek et al. 2011),
+    rounded to single precision at the same steps as Pillow.
+    """
+    f32 = np.float32
+    sigma2 = f32(radius) * f32(radius) / f32(passes)
+    length = f32(math.sqrt(12.0 * float(sigma2) + 1.0))
+    whole = f32(math.floor((float(length) - 1.0) / 2.0))
+    fraction = (f32(2) * whole + f32(1)) * (
+        whole * (whole + f32(1)) - f32(3) * sigma2
+    )
+    fraction /= f32(6) * (sigma2 - (whole + f32(1)) * (whole + f32(1)))
+    return whole + fraction
+
+
+def _rotation_matrix(size, angle):
+    """
+    Output size and inverse affine matrix of ``Image.rotate`` with
+    ``expand=True``, computed as Pillow does.
+    """
+    width, height = size
+    radians = -math.radians(angle)
+    a, b = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    d, e = -b, a
+    center_x, center_y = width / 2.0, height / 2.0
+    c = a * -center_x + b * -center_y + center_x
+    f = d * -center_x + e * -center_y + center_y
+    corners = [(0, 0), (width, 0), (width, height), (0, height)]
+    xs = [a * x + b * y + c for x, y in corners]
+    ys = [d * x + e * y + f for x, y in corners]
+    new_width = math.ceil(max(xs)) - math.floor(min(xs))
+    new_height = math.ceil(max(ys)) - math.floor(min(ys))
+    shift_x, shift_y = -(new_width - width) / 2.0, -(new_height - height) / 2.0
+    c, f = a * shift_x + b * shift_y + c, d * shift_x + e * shift_y + f
+    return (new_width, new_height), (a, b, c, d, e, f)
+
+
+def _fixed_point(value):
+    """
+    ``value`` in Pillow's 16.16 fixed point.
+    """
+    return math.floor(value * 65536.0 + 0.5)
+
+
+def _fits_fixed_point(size, matrix):
+    """
+    Check whether Pillow samples a nearest-neighbour rotation to
+    ``size`` in 16.16 fixed point, which needs every source coordinate
+    of the output's corners within +/-32768.
+    """
+    a, b, c, d, e, f = matrix
+    if b == 0:
+        # Axis-aligned maps take Pillow's scaling path instead
+        return False
+    return all(
+        abs(x * a + y * b + c) < 32768.0 and abs(x * d + y * e + f) < 32768.0
+        for x in (0, size[0]) for y in (0, size[1])
+    )
+
+
+class NumpyBackend:
+    """
+    Vectorized operations on 8-bit L and RGB images.
+
+    Brightness and contrast blend every value towards a constant, so
+    they are computed once per possible value as a 256-entry table and
+    applied with ``Image.point``. Rotation samples the inverse affine
+    map (nearest in Pillow's 16.16 fixed point, or bilinear; bicubic
+    stays with Pillow), resizing applies Pillow's separable filter
+    coefficients and the Gaussian blur is Pillow's three-pass extended
+    box blur from running sums, both with Pillow's fixed-point weights,
+    so all three reproduce Pillow's output.
+    """
+
+    name = "numpy"
+
+    _operations = set(OPERATIONS)
+
+    _rotate_filters = (Image.Resampling.NEAREST, Image.Resampling.BILINEAR)
+
+    def supports(self, op, image, *args):
+        """
+        Check whether this backend runs ``op`` on ``image`` with ``args``.
+        """
+        if op not in self._operations or image.mode not in ("L", "RGB"):
+            return False
+        if op == "rotate":
+            resample = args[1] if len(args) > 1 else Image.Resampling.NEAREST
+            if resample not in self._rotate_filters:
+                return False
+            angle = args[0] % 360.0 if args else 0.0
+            if resample == Image.Resampling.BILINEAR or angle % 90 == 0:
+                return True
+            return _fits_fixed_point(*_rotation_matrix(image.size, angle))
+        if op == "blur":
+            # The fixed 5x5 kernel (radius 0) stays with Pillow
+            return bool(args and args[0])
+        if op in ("saturation", "grayscale"):
+            return image.mode == "RGB"
+        return True
+
+    @staticmethod
+    def _apply_table(image, degenerate, factor):
+        """
+        Blend every band towards ``degenerate`` through a lookup table.
+        """
+        table = _blend(degenerate, np.arange(256, dtype=np.uint8), factor)
+        return image.point(table.tolist() * len(image.getbands()))
+
+    def rotate(self, image, angle, resample=Image.Resampling.NEAREST):
+        """
+        Rotate counter-clockwise with ``expand=True``, filling with black.
+        """
+        pixels = np.asarray(image)
+        angle = angle % 360.0
+        if angle in (0, 90, 180, 270):
+            return Image.fromarray(
+                np.ascontiguousarray(np.rot90(pixels, int(angle) // 90))
+            )
+
+        height, width = pixels.shape[:2]
+        (new_width, new_height), (a, b, c, d, e, f) = _rotation_matrix(
+            image.size, angle
+        )
+        rotated = np.zeros(
+            (new_height, new_width) + pixels.shape[2:], dtype=np.uint8
+        )
+        columns = np.arange(new_width)
+        step = max(1, ROTATE_CHUNK_PIXELS // new_width)
+        if resample == Image.Resampling.NEAREST:
+            # Pillow's 16.16 fixed-point stepping, sampled at centres
+            fixed = [_fixed_point(value) for value in (
+                a, b, c + a * 0.5 + b * 0.5, d, e, f + d * 0.5 + e * 0.5
+            )]
+        for top in range(0, new_height, step):
+            rows = np.arange(top, min(top + step, new_height))[:, None]
+            target = rotated[top:top + step]
+            if resample == Image.Resampling.NEAREST:
+                xin = (fixed[0] * columns + fixed[1] * rows + fixed[2]) >> 16
+                yin = (fixed[3] * columns + fixed[4] * rows + fixed[5]) >> 16
+                inside = (
+                    (xin >= 0) & (xin < width) & (yin >= 0) & (yin < height)
+                )
+                target[inside] = pixels[yin[inside], xin[inside]]
+                continue
+
+            xin = a * (columns + 0.5) + b * (rows + 0.5) + c
+            yin = d * (columns + 0.5) + e * (rows + 0.5) + f
+            inside = (xin >= 0) & (xin < width) & (yin >= 0) & (yin < height)
+            xin, yin = xin[inside] - 0.5, yin[inside] - 0.5
+            x0, y0 = np.floor(xin), np.floor(yin)
+            dx, dy = xin - x0, yin - y0
+            if pixels.ndim == 3:
+                dx, dy = dx[:, np.newaxis], dy[:, np.newaxis]
+            x0, y0 = x0.astype(np.intp), y0.astype(np.intp)
+            left = np.clip(x0, 0, width - 1)
+            right = np.clip(x0 + 1, 0, width - 1)
+            top_row = np.clip(y0, 0, height - 1)
+            bottom_row = np.clip(y0 + 1, 0, height - 1)
+            upper = pixels[top_row, left] + (
+                pixels[top_row, right].astype(np.float64)
+                - pixels[top_row, left]
+            ) * dx
+            lower = pixels[bottom_row, left] + (
+                pixels[bottom_row, right].astype(np.float64)
+                - pixels[bottom_row, left]
+            ) * dx
+            blended = upper + (lower - upper) * dy
+            target[inside] = np.clip(blended, 0, 255).astype(np.uint8)
+        return Image.fromarray(rotated)
+
+    def resize(self, image, size, resample=None, reducing_gap=None):
+        """
+        Resize with Pillow's filters, reducing by whole factors first
+        when ``reducing_gap`` allows it.
+        """
+        if resample is None:
+            resample = Image.Resampling.BICUBIC
+        pixels = np.asarray(image)
+        width, height = image.size
+        out_width, out_height = size
+        span_x, span_y = float(width), float(height)
+        if reducing_gap is not None and resample != Image.Resampling.NEAREST:
+            factor_x = int(width / out_width / reducing_gap) or 1
+            factor_y = int(height / out_height / reducing_gap) or 1
+            if factor_x > 1 or factor_y > 1:
+                pixels = _reduce(pixels, factor_x, factor_y)
+                span_x, span_y = width / factor_x, height / factor_y
+
+        if out_width != pixels.shape[1] or span_x != pixels.shape[1]:
+            pixels = _resample_axis(
+                pixels, 1, out_width, 0.0, span_x, resample
+            )
+        if out_height != pixels.shape[0] or span_y != pixels.shape[0]:
+            pixels = _resample_axis(
+                pixels, 0, out_height, 0.0, span_y, resample
+            )
+        return Image.fromarray(np.ascontiguousarray(pixels))
+
+    def flip(self, image, direction):
+        """
+        Mirror left to right (``horizontal``) or top to bottom.
+        """
+        pixels = np.asarray(image)
+        if direction == "horizontal":
+            pixels = pixels[:, ::-1]
+        else:
+            pixels = pixels[::-1]
+        return Image.fromarray(np.ascontiguousarray(pixels))
+
+    def brightness(self, image, factor):
+        """
+        Blend towards black by ``factor``.
+        """
+        return self._apply_table(image, 0, factor)
+
+    def contrast(self, image, factor, mean=None):
+        """
+        Blend towards the mean grey level (or ``mean``) by ``factor``.
+        """
+        if mean is None:
+            counts = np.asarray(image.convert("L").histogram())
+            mean = int(np.dot(np.arange(256), counts) / counts.sum() + 0.5)
+        return self._apply_table(image, mean, factor)
+
+    def saturation(self, image, factor):
+        """
+        Blend towards the image's own luma by ``factor``.
+        """
+        pixels = np.asarray(image)
+        degenerate = _luma(pixels)[..., np.newaxis]
+        return Image.fromarray(_blend(degenerate, pixels, factor))
+
+    def blur(self, image, radius=0.0):
+        """
+        Gaussian blur of ``radius`` as three box blurs per axis.
+        """
+        box_radius = _gaussian_box_radius(radius, 3)
+        pixels = np.asarray(image)
+        for axis in (1, 0):
+            for _ in range(3):
+                pixels = _box_blur_axis(pixels, box_radius, axis)
+        return Image.fromarray(pixels)
+
+    def grayscale(self, image):
+        """
+        ITU-R 601 luma as an L image.
+        """
+        return Image.fromarray(_luma(np.asarray(image)))
+
+
+class OpenCVBackend(NumpyBackend):
+    """
+    OpenCV kernels for 8-bit L and RGB images (when cv2 is installed).
+
+    Colour enhancements reuse the NumPy versions.
+    """
+
+    name = "opencv"
+
+    _operations = set(OPERATIONS)
+
+    def supports(self, op, image, *args):
+        """
+        Check whether this backend runs ``op`` on ``image`` with ``args``.
+        """
+        if op not in self._operations or image.mode not in ("L", "RGB"):
+            return False
+        if op == "blur":
+            # The fixed 5x5 kernel (radius 0) stays with Pillow
+            return bool(args and args[0])
+        if op in ("saturation", "grayscale"):
+            return image.mode == "RGB"
+        return True
+
+    @staticmethod
+    def _interpolation(resample, downscale=False):
+        """
+        OpenCV interpolation flag closest to a Pillow filter.
+        """
+        if resample == Image.Resampling.NEAREST:
+            return cv2.INTER_NEAREST
+        if downscale:
+            # Pillow filters antialias when shrinking; area averaging
+            # is OpenCV's closest equivalent
+            return cv2.INTER_AREA
+        return {
+            Image.Resampling.BILINEAR: cv2.INTER_LINEAR,
+            Image.Resampling.LANCZOS: cv2.INTER_LANCZOS4,
+        }.get(resample, cv2.INTER_CUBIC)
+
+    def rotate(self, image, angle, resample=Image.Resampling.NEAREST):
+        """
+        Rotate counter-clockwise with ``expand=True``, filling with black.
+        """
+        width, height = image.size
+        # Output size exactly as Image.rotate(expand=True) computes it
+        radians = -math.radians(angle)
+        cos, sin = round(math.cos(radians), 15), round(math.sin(radians), 15)
+        xs = [x * cos + y * sin for x, y in (
+            (0, 0), (width, 0), (width, height), (0, height)
+        )]
+        ys = [-x * sin + y * cos for x, y in (
+            (0, 0), (width, 0), (width, height), (0, height)
+        )]
+        new_width = math.ceil(max(xs)) - math.floor(min(xs))
+        new_height = math.ceil(max(ys)) - math.floor(min(ys))
+
+        # OpenCV puts pixel centres on integer coordinates, Pillow on
+        # half-integers
+        matrix = cv2.getRotationMatrix2D(
+            ((width - 1) / 2, (height - 1) / 2), angle, 1.0
+        )
+        matrix[0, 2] += (new_width - width) / 2
+        matrix[1, 2] += (new_height - height) / 2
+        rotated = cv2.warpAffine(
+            np.asarray(image), matrix, (new_width, new_height),
+            flags=self._interpolation(resample),
+            borderMode=cv2.BORDER_CONSTANT, borderValue=0,
+        )
+        return Image.fromarray(rotated)
+
+    def resize(self, image, size, resample=None, reducing_gap=None):
+        """
+        Resize with the closest OpenCV interpolation.
+        """
+        downscale = size[0] < image.width and size[1] < image.height
+        resized = cv2.resize(
+            np.asarray(image), size,
+            interpolation=self._interpolation(resample, downscale),
+        )
+        return Image.fromarray(resized)
+
+    def flip(self, image, direction):
+        """
+        Mirror left to right (``horizontal``) or top to bottom.
+        """
+        code = 1 if direction == "horizontal" else 0
+        return Image.fromarray(cv2.flip(np.asarray(image), code))
+
+    def blur(self, image, radius=0.0):
+        """
+        Gaussian blur of ``radius`` with replicated edges.
+        """
+        blurred = cv2.GaussianBlur(
+            np.asarray(image), (0, 0), radius,
+            borderType=cv2.BORDER_REPLICATE,
+        )
+        return Image.fromarray(blurred)
+
+    def grayscale(self, image):
+        """
+        ITU-R 601 luma as an L image.
+        """
+        return Image.fromarray(
+            cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+        )
+
+
+def _available_backends():
+    """
+    Instances of every backend usable in this environment, Pillow first.
+    """
+    backends = [PillowBackend(), NumpyBackend()]
+    if cv2 is not None:
+        backends.append(OpenCVBackend())
+    return backends
+
+
+class BackendRegistry:
+    """
+    Chooses the backend that runs each operation, per image size class.
+
+    ``table`` maps operation name to ``{size class: backend name}``;
+    anything missing, unavailable or unsupported for the image at hand
+    runs on Pillow.
+    """
+
+    def __init__(self, table=None):
+        self.backends = {
+            backend.name: backend for backend in _available_backends()
+        }
+        self.table = table or {}
+
+    def select(self, op, image, *args):
+        """
+        Return the backend to run ``op`` on ``image`` with ``args``.
+        """
+        name = self.table.get(op, {}).get(_size_class(image), "pillow")
+        backend = self.backends.get(name)
+        if backend is None or not backend.supports(op, image, *args):
+            return self.backends["pillow"]
+        return backend
+
+
+# Replaced as a whole by configure_backends, so lookups need no lock
+_registry = BackendRegistry()
+
+
+def _dispatch(op, image, *args):
+    """
+    Run one core operation on the backend selected for it.
+    """
+    backend = _registry.select(op, image, *args)
+    return getattr(backend, op)(image, *args)
+
+
+def _calibration_image(megapixels):
+    """
+    Smooth synthetic RGB image of roughly ``megapixels``.
+
+    Smooth content keeps comparisons between resampling filters
+    meaningful; noise would make every filter look wrong.
+    """
+    height = max(8, int(math.sqrt(megapixels * 1_000_000 * 3 / 4)))
+    width = height * 4 // 3
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    pixels = np.stack([
+        128 + 100 * np.sin(x / 37.0),
+        255 * x / width,
+        128 + 100 * np.cos((x + y) / 53.0),
+    ], axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def _within_tolerance(op, expected, actual, args=()):
+    """
+    Check a backend result against the Pillow result for ``op`` called
+    with ``args``.
+    """
+    if expected.size != actual.size or expected.mode != actual.mode:
+        return False
+    difference = np.abs(
+        np.asarray(expected, dtype=np.int16)
+        - np.asarray(actual, dtype=np.int16)
+    )
+    if op == "rotate":
+        resample = args[1] if len(args) > 1 else Image.Resampling.NEAREST
+        maximum, mean = ROTATE_TOLERANCES[resample]
+    else:
+        maximum, mean = TOLERANCES[op]
+    return difference.max() <= maximum and difference.mean() <= mean
+
+
+def _time_call(func, repeats):
+    """
+    Best wall time of ``repeats`` calls.
+    """
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(megapixels=None, repeats=3, operations=OPERATIONS):
+    """
+    Time every available backend per operation and size class.
+
+    Backends whose output differs from Pillow's by more than
+    ``TOLERANCES`` are skipped. Returns ``(table, timings)``: the
+    fastest backend name per operation and size class, and the measured
+    seconds as ``{op: {size class: {backend: seconds}}}``.
+    """
+    megapixels = megapixels or CALIBRATION_MEGAPIXELS
+    backends = _available_backends()
+    table, timings = {}, {}
+    for size_class, size in megapixels.items():
+        image = _calibration_image(size)
+        for op in operations:
+            args = CALIBRATION_ARGS[op](image)
+            expected = getattr(backends[0], op)(image, *args)
+            results = timings.setdefault(op, {}).setdefault(size_class, {})
+            for backend in backends:
+                if not backend.supports(op, image, *args):
+                    continue
+                func = getattr(backend, op)
+                if backend.name != "pillow" and not _within_tolerance(
+                    op, expected, func(image, *args), args
+                ):
+                    logger.warning(
+                        "Backend %s exceeds the %s tolerance; skipped",
+                        backend.name, op,
+                    )
+                    continue
+                results[backend.name] = _time_call(
+                    lambda: func(image, *args), repeats
+                )
+            table.setdefault(op, {})[size_class] = min(
+                results, key=results.get
+            )
+    return table, timings
+
+
+def _verified_operations(backend):
+    """
+    Operations ``backend`` runs within tolerance of Pillow, checked once
+    each with the calibration arguments on a small synthetic image.
+    """
+    image = _calibration_image(QUICK_CALIBRATION_MEGAPIXELS["small"])
+    reference = PillowBackend()
+    verified = []
+    for op in OPERATIONS:
+        args = CALIBRATION_ARGS[op](image)
+        if backend.supports(op, image, *args) and _within_tolerance(
+            op, getattr(reference, op)(image, *args),
+            getattr(backend, op)(image, *args), args,
+        ):
+            verified.append(op)
+        else:
+            logger.warning(
+                "Backend %s fails the %s check; %s stays on Pillow",
+                backend.name, op, op,
+            )
+    return verified
+
+
+def configure_backends(mode="pillow", calibration_path=None):
+    """
+    Set up the process-wide registry.
+
+    ``mode`` "pillow" keeps every operation on Pillow; "numpy" or
+    "opencv" prefers that backend wherever it supports an operation and
+    stays within ``TOLERANCES`` (see :func:`_verified_operations`);
+    "auto" uses the calibration table at ``calibration_path``, running
+    a quick calibration (and saving it there) when none exists yet.
+    """
+    global _registry
+    if mode == "auto":
+        table = None
+        if calibration_path and os.path.exists(calibration_path):
+            with open(calibration_path, encoding="utf-8") as handle:
+                table = json.load(handle)["table"]
+        if table is None:
+            table, timings = calibrate(QUICK_CALIBRATION_MEGAPIXELS, 1)
+            if calibration_path:
+                save_calibration(calibration_path, table, timings)
+    elif mode == "pillow":
+        table = {}
+    else:
+        backends = {
+            backend.name: backend for backend in _available_backends()
+        }
+        if mode not in backends:
+            raise ValueError(f"Compute backend '{mode}' is not available")
+        table = {
+            op: {name: mode for name, _ in SIZE_CLASSES}
+            for op in _verified_operations(backends[mode])
+        }
+
+    _registry = BackendRegistry(table)
+    logger.info("Compute backends (%s): %s", mode, table)
+    return _registry
+
+
+def backend_table():
+    """
+    Operation table of the process-wide registry, as resolved by
+    :func:`configure_backends`.
+    """
+    return _registry.table
+
+
+def use_backend_table(table):
+    """
+    Install a table resolved in another process (see
+    :func:`backend_table`) as this process's registry.
+    """
+    global _registry
+    _registry = BackendRegistry(table)
+    return _registry
+
+
+def save_calibration(path, table, timings):
+    """
+    Write a calibration table and its timings as JSON.
+    """
+    with open(path + ".tmp", "w", encoding="utf-8") as handle:
+        json.dump({"table": table, "timings": timings}, handle, indent=2)
+    os.replace(path + ".tmp", path)
@@ -1,22 +1,73 @@
+from collections import namedtuple
+
 from PIL import Image
 
+from controllers.backends import _dispatch
+
+
+# Filters used by each resampling quality tier: for rotation (which
+# supports NEAREST, BILINEAR and BICUBIC only), for resizing, and the
+# ``reducing_gap`` that lets large downscales start with a fast box
+# reduction (None resamples the full image exactly)
+Resampling = namedtuple("Resampling", ["rotate", "resize", "reducing_gap"])
+
+QUALITY_TIERS = {
+    "fast": Resampling(
+        Image.Resampling.NEAREST, Image.Resampling.BILINEAR, 2.0
+    ),
+    "balanced": Resampling(
+        Image.Resampling.BILINEAR, Image.Resampling.BICUBIC, 3.0
+    ),
+    "best": Resampling(
+        Image.Resampling.BICUBIC, Image.Resampling.LANCZOS, None
+    ),
+}
 
-def _basic_rotate(image, angle):
+
+def _check_quality(quality):
+    """
+    Validate a resampling quality tier; None keeps each operation's
+    historical filter.
+    """
+    if quality is not None and quality not in QUALITY_TIERS:
+        allowed = ", ".join(f"'{tier}'" for tier in QUALITY_TIERS)
+        raise ValueError(f"quality must be one of {allowed}")
+    return quality
+
+
+def _resize(image, size, quality=None, resample=None):
+    """
+    Resize an image with the filters of a quality tier, or with
+    ``resample`` (Pillow's default when None) if no tier is given
+    """
+    if quality is None:
+        return _dispatch("resize", image, size, resample)
+    tier = QUALITY_TIERS[quality]
+    return _dispatch(
+        "resize", image, size, tier.resize, tier.reducing_gap
+    )
+
+
+def _basic_rotate(image, angle, quality=None):
     """
     Rotate an image by a specified angle
     """
-    rotated = image.rotate(angle, expand=True)
+    if quality is None:
+        resample = Image.Resampling.NEAREST
+    else:
+        resample = QUALITY_TIERS[quality].rotate
+    rotated = _dispatch("rotate", image, angle, resample)
     return rotated
 
 
-def _scale_image(image, scale_factor):
+def _scale_image(image, scale_factor, quality=None):
     """
     Scale an image by a specified factor
     """
     width, height = image.size
     new_width = int(width * scale_factor)
     new_height = int(height * scale_factor)
-    scaled = image.resize((new_width, new_height))
+    scaled = _resize(image, (new_width, new_height), quality)
     return scaled
 
 
@@ -24,13 +75,10 @@ def _flip_image(image, direction="horizontal"):
     """
     Flip an image horizontally or vertically
     """
-    if direction == "horizontal":
-        flipped = image.transpose(Image.FLIP_LEFT_RIGHT)
-    elif direction == "vertical":
-        flipped = image.transpose(Image.FLIP_TOP_BOTTOM)
-    else:
+    if direction not in ("horizontal", "vertical"):
         raise ValueError(
             "Invalid direction. Use 'horizontal' or 'vertical'."
         )
 
+    flipped = _dispatch("flip", image, direction)
     return flipped
\ No newline at end of file
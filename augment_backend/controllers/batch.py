@@ -0,0 +1,123 @@
+import io
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from controllers.planner import _working_mode
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """
+    Return the shared worker pool, creating it on first use.
+
+    Pillow releases the GIL inside its image kernels, so a thread pool
+    spreads decode, augmentation and encode work over several cores.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="augment-batch"
+            )
+        return _executor
+
+
+def _augment_file(image_file, pipeline):
+    """
+    Decode one upload, run ``pipeline`` over it and encode it as PNG.
+    """
+    image = Image.open(image_file)
+    augmented = pipeline.planned(_working_mode(image)).run(image)
+
+    img_bytes = io.BytesIO()
+    augmented.save(img_bytes, format="PNG")
+    return img_bytes.getvalue()
+
+
+def _output_name(filename, index):
+    """
+    Name of the archive entry for the ``index``-th uploaded file.
+    """
+    stem = os.path.splitext(os.path.basename(filename or "image"))[0]
+    return f"{index:04d}_{stem}.png"
+
+
+def _process_batch(jobs, workers):
+    """
+    Run ``(filename, image_file, pipeline)`` jobs on the worker pool.
+
+    Yields ``(filename, png_bytes, error)`` in submission order. At most
+    ``2 * workers`` jobs are in flight, which bounds the number of decoded
+    images held in memory at once.
+    """
+    executor = _get_executor(workers)
+    window = max(1, 2 * workers)
+    pending = deque()
+    jobs = iter(jobs)
+
+    def submit_next():
+        for filename, image_file, pipeline in jobs:
+            pending.append(
+                (filename, executor.submit(_augment_file, image_file, pipeline))
+            )
+            return True
+        return False
+
+    while len(pending) < window and submit_next():
+        pass
+
+    while pending:
+        filename, future = pending.popleft()
+        submit_next()
+        try:
+            yield filename, future.result(), None
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            yield filename, None, str(exc)
+        # pylint: enable=broad-exception-caught
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer drained after every archive entry."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        """
+        Return and forget everything written since the last drain.
+        """
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _stream_zip(entries):
+    """
+    Stream ``(name, data)`` entries as a ZIP archive, chunk by chunk.
+
+    Entries are stored without recompression since PNG data is already
+    deflated.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zipf:
+        for name, data in entries:
+            zipf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,267 @@
+import numpy as np
+from PIL import Image
+
+from controllers.planner import _grayscale_split
+
+
+# Upper bound on the working memory of one batch of samples
+DEFAULT_BATCH_BYTES = 256 * 1024 * 1024
+
+# Bytes of working memory per pixel of a sample: the uint8 result, the
+# float32 luma and the float32 copy saturation blends in
+BYTES_PER_PIXEL = 3 + 4 + 12
+
+# ITU-R 601 luma weights in 16-bit fixed point, as Pillow converts to L.
+# Every partial sum stays below 2 ** 24, so float32 keeps them exact and
+# the weighting runs as a single matrix product.
+LUMA_WEIGHTS = np.array([19595, 38470, 7471], dtype=np.float32)
+
+# Colour steps in the order the random generator applies them
+ADJUSTMENTS = ("brightness", "contrast", "saturation")
+
+# Largest share of distinct colours among an image's pixels for which
+# computing variants on the colours beats running Pillow per variant;
+# noise-like images with more colours are left to Pillow
+MAX_COLOUR_RATIO = 0.25
+
+
+def _batch_size(pixels, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Number of samples of ``pixels`` pixels each processed together within
+    ``max_bytes`` of working memory (at least one).
+    """
+    return max(1, max_bytes // (max(pixels, 1) * BYTES_PER_PIXEL))
+
+
+def _batch_luma(pixels):
+    """
+    Luma of a ``(..., C)`` uint8 array as whole float32 values, rounded
+    as Pillow does; single-channel arrays are their own luma.
+    """
+    if pixels.shape[-1] == 1:
+        return pixels[..., 0].astype(np.float32)
+    weighted = pixels.reshape(-1, 3).astype(np.float32) @ LUMA_WEIGHTS
+    weighted += 0x8000
+    weighted *= 1.0 / 65536
+    return np.floor(weighted, out=weighted).reshape(pixels.shape[:-1])
+
+
+def _blend_table(factor, degenerate):
+    """
+    ``Image.blend`` of every uint8 value with a constant ``degenerate``,
+    as a 256-entry table.
+    """
+    low = np.float32(degenerate)
+    values = np.arange(256, dtype=np.float32) - low
+    values = low + np.float32(factor) * values
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def _to_gray(pixels, samples):
+    """
+    Replace the given samples by their luma in all three channels.
+
+    A grey sample with equal channels goes through brightness, contrast
+    and saturation exactly as the L image would.
+    """
+    if samples.size and pixels.shape[-1] == 3:
+        pixels[samples] = _batch_luma(pixels[samples])[..., np.newaxis]
+
+
+def _colour_chunk(pixels, params, counts=None):
+    """
+    Apply per-sample colour parameters to an ``(N, M, C)`` uint8 array
+    of N samples of M pixels in place.
+
+    ``params`` holds one dict per sample with the brightness, contrast
+    and saturation factors and grayscale flag drawn by the random
+    generator. Grayscale samples convert at the point
+    :func:`controllers.planner._grayscale_split` picks; single-channel
+    arrays are grey throughout. ``counts`` weights each pixel in the
+    mean contrast blends with, for samples holding distinct colours.
+    """
+    factors = {
+        name: np.array([sample[name] for sample in params], np.float32)
+        for name in ADJUSTMENTS
+    }
+    # Index of the step grayscale samples convert before; colour samples
+    # never convert and grey arrays start out converted
+    never = len(ADJUSTMENTS) + 1
+    splits = np.array([
+        _grayscale_split([sample[name] for name in ADJUSTMENTS])
+        if sample["grayscale"] else never
+        for sample in params
+    ])
+    if pixels.shape[-1] == 1:
+        splits[:] = 0
+
+    _to_gray(pixels, np.flatnonzero(splits == 0))
+    for index, factor in enumerate(factors["brightness"]):
+        np.take(_blend_table(factor, 0), pixels[index], out=pixels[index])
+
+    _to_gray(pixels, np.flatnonzero(splits == 1))
+    luma = _batch_luma(pixels)
+    if counts is None:
+        means = luma.sum(axis=1, dtype=np.float64) / luma.shape[1]
+    else:
+        means = luma.astype(np.float64) @ counts / counts.sum()
+    for index, factor in enumerate(factors["contrast"]):
+        table = _blend_table(factor, int(means[index] + 0.5))
+        np.take(table, pixels[index], out=pixels[index])
+
+    _to_gray(pixels, np.flatnonzero(splits == 2))
+    colour = np.flatnonzero(splits > 2)
+    if colour.size:
+        # Saturation leaves grey samples unchanged
+        chosen = pixels[colour]
+        luma = _batch_luma(chosen)[..., np.newaxis]
+        blended = chosen.astype(np.float32)
+        blended -= luma
+        blended *= factors["saturation"][colour, None, None]
+        blended += luma
+        np.clip(blended, 0, 255, out=blended)
+        pixels[colour] = blended
+
+    _to_gray(pixels, np.flatnonzero(splits == len(ADJUSTMENTS)))
+    return pixels
+
+
+def _colour_batches(stack, params, counts=None,
+                    max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Yield ``(start, pixels)`` for consecutive batches of a colour-
+    augmented ``(N, M, C)`` uint8 stack.
+
+    ``stack`` may be a broadcast view of a single image; each batch is
+    copied from it, so at most one batch is held in working memory.
+    """
+    size = _batch_size(stack.shape[1], max_bytes)
+    for start in range(0, len(params), size):
+        chunk = np.array(stack[start:start + size], dtype=np.uint8)
+        batch = params[start:start + size]
+        yield start, _colour_chunk(chunk, batch, counts)
+
+
+def _check_stack(stack):
+    """
+    Check that ``stack`` is an ``(N, H, W, C)`` RGB or L array.
+    """
+    if stack.ndim != 4 or stack.shape[-1] not in (1, 3):
+        raise ValueError("Stack must have shape (N, H, W, 3 or 1)")
+
+
+def _augment_colour_batch(stack, params, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Apply per-sample colour parameters to a stack of same-sized RGB or
+    L images in vectorized form.
+
+    Matches the colour steps of
+    :func:`controllers.random_generator._apply_transformations` pixel
+    for pixel; grayscale samples come back with equal channels.
+
+    Args:
+        stack: ``(N, H, W, 3)`` or ``(N, H, W, 1)`` uint8 array.
+        params: One dict per sample with ``brightness``, ``contrast``,
+            ``saturation`` and ``grayscale``.
+        max_bytes: Working memory bound of one batch of samples.
+
+    Returns:
+        numpy.ndarray: The augmented uint8 stack, shaped like ``stack``.
+    """
+    stack = np.asarray(stack)
+    _check_stack(stack)
+    if len(params) != len(stack):
+        raise ValueError("Expected one parameter set per image")
+
+    count, channels = len(stack), stack.shape[-1]
+    output = np.empty(stack.shape, dtype=np.uint8)
+    flat = stack.reshape(count, -1, channels)
+    for start, pixels in _colour_batches(flat, params, None, max_bytes):
+        output[start:start + len(pixels)] = pixels.reshape(
+            (len(pixels),) + stack.shape[1:]
+        )
+    return output
+
+
+def _distinct_colours(pixels):
+    """
+    Split an ``(H, W, C)`` uint8 array into its distinct colours.
+
+    Returns:
+        tuple: ``(colours, inverse, counts)``: the ``(K, C)`` colours,
+        the index of every pixel's colour and how many pixels have each.
+    """
+    if pixels.shape[-1] == 1:
+        inverse = pixels.reshape(-1)
+        counts = np.bincount(inverse, minlength=256).astype(np.float64)
+        colours = np.arange(256, dtype=np.uint8)[:, np.newaxis]
+        return colours, inverse, counts
+
+    packed = pixels.reshape(-1, 3).astype(np.uint32)
+    packed = (packed[:, 0] << 16) | (packed[:, 1] << 8) | packed[:, 2]
+    keys, inverse, counts = np.unique(
+        packed, return_inverse=True, return_counts=True
+    )
+    colours = np.empty((len(keys), 3), dtype=np.uint8)
+    for channel, shift in enumerate((16, 8, 0)):
+        colours[:, channel] = keys >> shift
+    return colours, inverse.reshape(-1), counts.astype(np.float64)
+
+
+def _pixel_words(colours):
+    """
+    Pack ``(K, C)`` uint8 colours into one word per colour, laid out as
+    Pillow's raw L or RGBX data.
+    """
+    if colours.shape[-1] == 1:
+        return colours[:, 0]
+    words = np.zeros((len(colours), 4), dtype=np.uint8)
+    words[:, :3] = colours
+    return words.view(np.uint32)[:, 0]
+
+
+def _colour_variants(image, params, max_bytes=DEFAULT_BATCH_BYTES,
+                     max_colour_ratio=MAX_COLOUR_RATIO):
+    """
+    Colour-augmented copies of an RGB or L image, one per parameter set.
+
+    Every output pixel only depends on the colour of its source pixel,
+    so the batch is computed on the image's distinct colours (weighted by
+    how often each occurs) and each variant is then one lookup per
+    pixel. Grayscale samples of an RGB image come back as L, like
+    :func:`controllers.random_generator._apply_transformations` returns
+    them.
+
+    Returns:
+        An iterator over the variant images, or None when more than
+        ``max_colour_ratio`` of the pixels have distinct colours and the
+        lookups would not pay off.
+    """
+    if image.mode not in ("RGB", "L"):
+        raise ValueError("Image mode must be RGB or L")
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+
+    colours, inverse, counts = _distinct_colours(pixels)
+    if len(colours) > max_colour_ratio * len(inverse):
+        return None
+    return _lookup_variants(
+        image.size, colours, inverse, counts, params, max_bytes
+    )
+
+
+def _lookup_variants(size, colours, inverse, counts, params, max_bytes):
+    """
+    Yield the images of :func:`_colour_variants`.
+    """
+    stack = np.broadcast_to(colours, (len(params),) + colours.shape)
+    for start, batch in _colour_batches(stack, params, counts, max_bytes):
+        for offset, table in enumerate(batch):
+            if params[start + offset]["grayscale"]:
+                table = table[:, :1]
+            words = np.take(_pixel_words(table), inverse)
+            if table.shape[-1] == 1:
+                yield Image.frombytes("L", size, words)
+            else:
+                yield Image.frombytes("RGB", size, words, "raw", "RGBX")
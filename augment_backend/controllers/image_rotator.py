@@ -1,22 +1,51 @@
 import io
+import math
 import zipfile
 
-from PIL import Image
+from PIL import Image, features
 
+from controllers.basic_aug import _basic_rotate
+from controllers.planner import _to_working_mode
+from controllers.preview import _make_proxy
 
-def _rotate_and_zip(image_file, num_images=36):
+
+# Animated containers a rotation sequence can be written as: Pillow
+# format and MIME type
+ANIMATION_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "gif": ("GIF", "image/gif"),
+    "apng": ("PNG", "image/apng"),
+}
+
+# Lossy WebP quality (0-100) and display time of each frame (ms)
+DEFAULT_FRAME_QUALITY = 75
+DEFAULT_FRAME_DURATION = 100
+
+# The GIF and APNG writers keep every frame until the file is complete,
+# so their sequences are limited to this many pixels in total; WebP
+# frames are encoded one at a time
+MAX_BUFFERED_PIXELS = 256 * 1024 * 1024
+
+
+def _rotate_frames(image, num_images=36, quality=None):
+    """
+    Yield (angle, rotated image) pairs evenly spaced over a full turn.
+    """
+    step = 360 / num_images
+    for i in range(num_images):
+        angle = step * i
+        yield angle, _basic_rotate(image, angle, quality)
+
+
+def _rotate_and_zip(image_file, num_images=36, quality=None):
     """
     Rotate an image multiple times and package into a ZIP file.
     """
-    image = Image.open(image_file).convert('RGB')
+    image = _to_working_mode(Image.open(image_file))
 
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        step = 360 / num_images
-        for i in range(num_images):
-            angle = step * i
-            rotated = image.rotate(angle, expand=True)
-
+        for angle, rotated in _rotate_frames(image, num_images, quality):
             img_bytes = io.BytesIO()
             rotated.save(img_bytes, format='JPEG')
             img_bytes.seek(0)
@@ -24,4 +53,130 @@ def _rotate_and_zip(image_file, num_images=36):
             zipf.writestr(f"rotated_{int(angle)}.jpg", img_bytes.read())
 
     zip_buffer.seek(0)
-    return zip_buffer
\ No newline at end of file
+    return zip_buffer
+
+
+def _canvas_size(size, num_images):
+    """
+    Smallest frame size holding every rotation of ``num_images``.
+
+    Pillow rounds each expanded rotation outwards, by less than one
+    pixel on either side, hence the margin.
+    """
+    width, height = size
+    canvas_width = canvas_height = 0
+    for i in range(num_images):
+        angle = math.radians(360 / num_images * i)
+        cos, sin = abs(math.cos(angle)), abs(math.sin(angle))
+        canvas_width = max(canvas_width, width * cos + height * sin)
+        canvas_height = max(canvas_height, width * sin + height * cos)
+    return math.ceil(canvas_width) + 2, math.ceil(canvas_height) + 2
+
+
+def _animation_frames(image, num_images, quality, canvas):
+    """
+    Yield the rotations of an image centred on frames of size ``canvas``.
+    """
+    for _, rotated in _rotate_frames(image, num_images, quality):
+        if rotated.size == canvas:
+            yield rotated
+            continue
+        frame = Image.new(rotated.mode, canvas)
+        frame.paste(rotated, (
+            (canvas[0] - rotated.width) // 2,
+            (canvas[1] - rotated.height) // 2,
+        ))
+        yield frame
+
+
+def _encode_webp(frames, canvas, frame_quality, frame_duration):
+    """
+    Encode frames as a looping animated WebP, one frame at a time.
+
+    Pillow's ``save_all`` collects every frame first; feeding its
+    animation encoder directly keeps a single frame in memory.
+    """
+    # pylint: disable=import-outside-toplevel,no-name-in-module
+    from PIL import _webp
+
+    # No key frames after the first: they only help seeking, which a
+    # looping preview does not need, and each frame is tried fewer ways
+    encoder = _webp.WebPAnimEncoder(canvas, 0, 0, False, 0, 0, False, False)
+    timestamp = 0
+    for frame in frames:
+        if frame.mode != "RGB":
+            frame = frame.convert("RGB")
+        encoder.add(frame.getim(), timestamp, False, frame_quality, 100, 0)
+        timestamp += frame_duration
+    encoder.add(None, timestamp, False, frame_quality, 100, 0)
+    data = encoder.assemble("", "", "")
+    if data is None:
+        raise OSError("Encoding the WebP animation failed")
+    return io.BytesIO(data)
+
+
+def _gif_frames(image, frames):
+    """
+    Map RGB frames onto one palette built from the source image.
+
+    Rotation only adds the black fill to the source's colours, so a
+    single palette fits every frame; Pillow would otherwise build an
+    adaptive palette per frame, which dominates the encode time.
+    """
+    if image.mode != "RGB":
+        return list(frames)
+    palette = image.quantize(255, method=Image.Quantize.FASTOCTREE)
+    entries = palette.getpalette()[:255 * 3] + [0, 0, 0]
+    palette.putpalette(entries)
+    return [
+        frame.quantize(palette=palette, dither=Image.Dither.NONE)
+        for frame in frames
+    ]
+
+
+def _rotate_and_animate(image_file, num_images=36, quality=None,
+                        container="webp",
+                        frame_quality=DEFAULT_FRAME_QUALITY,
+                        frame_duration=DEFAULT_FRAME_DURATION,
+                        long_edge=None):
+    """
+    Rotate an image multiple times and write the rotations as one
+    looping animation.
+
+    Meant for previewing a rotation set: with ``long_edge`` the frames
+    are rendered from a proxy downscaled to that many pixels (see
+    :func:`controllers.preview._make_proxy`), and the whole set plays
+    from a single file instead of a ZIP of separate JPEGs. Frames share
+    one canvas large enough for every rotation.
+    """
+    if container not in ANIMATION_FORMATS:
+        allowed = ", ".join(ANIMATION_FORMATS)
+        raise ValueError(f"Animation format must be one of {allowed}")
+    if long_edge:
+        image, _ = _make_proxy(image_file, long_edge)
+    else:
+        image = _to_working_mode(Image.open(image_file))
+    canvas = _canvas_size(image.size, num_images)
+    frames = _animation_frames(image, num_images, quality, canvas)
+
+    if container == "webp":
+        if not features.check("webp"):
+            raise ValueError("WebP output is not supported on this server")
+        return _encode_webp(frames, canvas, frame_quality, frame_duration)
+
+    if canvas[0] * canvas[1] * num_images > MAX_BUFFERED_PIXELS:
+        raise ValueError(
+            f"Too many pixels for {container.upper()} output; use webp"
+        )
+    if container == "gif":
+        frames = _gif_frames(image, frames)
+    else:
+        # The APNG writer iterates the frames twice
+        frames = list(frames)
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer, format=ANIMATION_FORMATS[container][0], save_all=True,
+        append_images=frames[1:], duration=frame_duration, loop=0,
+    )
+    buffer.seek(0)
+    return buffer
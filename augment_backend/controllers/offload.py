@@ -0,0 +1,109 @@
+import multiprocessing
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+from controllers.backends import use_backend_table
+from shared_frames import DEFAULT_IDLE_BYTES, FramePool, read_frame
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Segments this process writes frames into: sources in the request
+# process, results in each worker
+_frames = None
+_frames_lock = threading.Lock()
+
+
+def _get_frame_pool(max_idle_bytes=DEFAULT_IDLE_BYTES):
+    """
+    Return this process's frame pool, creating it on first use.
+
+    Its segments are unlinked when the process exits.
+    """
+    global _frames
+    with _frames_lock:
+        if _frames is None:
+            _frames = FramePool(max_idle_bytes)
+            Finalize(_frames, _frames.close, exitpriority=10)
+        return _frames
+
+
+def _init_worker(max_idle_bytes, backend_table):
+    """
+    Prepare a worker process: its own random state, the request
+    process's compute backends and a frame pool for results.
+
+    ``backend_table`` is the request process's resolved table, so
+    workers neither recalibrate nor disagree with it.
+    """
+    random.seed()
+    use_backend_table(backend_table)
+    _get_frame_pool(max_idle_bytes)
+
+
+def _get_process_pool(workers, max_idle_bytes=DEFAULT_IDLE_BYTES,
+                      backend_table=None):
+    """
+    Return the shared process pool, creating it on first use.
+
+    Workers are spawned rather than forked, so they do not inherit the
+    request process's threads or locks.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(max_idle_bytes, backend_table),
+            )
+        return _executor
+
+
+def _run_in_worker(func, ref, info, args, kwargs):
+    """
+    Read a source frame, apply ``func`` and write the resulting image
+    to this worker's frame pool.
+
+    ``func`` returns an image, or a tuple starting with one. Frames hold
+    pixels only, so the source's ``info`` (ICC profile, DPI, ...) is
+    passed alongside and the result's is sent back.
+
+    Returns:
+        tuple: The result's FrameRef, its ``info`` and the rest of
+        ``func``'s tuple (None for a plain image).
+    """
+    # The request process frees the source once this call has returned
+    image = read_frame(ref, release=False)
+    image.info.update(info)
+    result = func(image, *args, **kwargs)
+    extra = None
+    if isinstance(result, tuple):
+        result, extra = result[0], result[1:]
+    return _get_frame_pool().put(result), result.info, extra
+
+
+def _offload(executor, frames, func, image, *args, **kwargs):
+    """
+    Call ``func(image, *args, **kwargs)`` in a worker process.
+
+    The image goes through a segment of the ``frames`` pool and the
+    result comes back through one of the worker's; only frame handles
+    are pickled. ``func`` and its arguments must be picklable.
+    """
+    ref = frames.put(image)
+    try:
+        result_ref, info, extra = executor.submit(
+            _run_in_worker, func, ref, image.info, args, kwargs
+        ).result()
+    finally:
+        frames.release(ref)
+    result = read_frame(result_ref)
+    result.info.update(info)
+    if extra is None:
+        return result
+    return (result,) + extra
@@ -0,0 +1,258 @@
+from collections import namedtuple
+
+from PIL import Image
+
+from controllers.adv_augmentation import (
+    MAX_BLUR_RADIUS, _adjust_brightness, _adjust_contrast,
+    _adjust_saturation, _apply_blur, _to_grayscale
+)
+from controllers.basic_aug import (
+    QUALITY_TIERS, _basic_rotate, _flip_image, _scale_image
+)
+from controllers.planner import _plan, _to_working_mode
+from controllers.random_generator import _apply_random_transformations
+
+
+# Schema for one operation parameter. ``kind`` is "number", "bool" or
+# "choice"; numbers are range checked and choices checked for membership.
+# Parameters whose default is None are optional and may stay None.
+Param = namedtuple(
+    "Param", ["kind", "default", "minimum", "maximum", "choices"],
+    defaults=(None, None, None)
+)
+
+# One pipeline operation: the function applying it and its parameters
+Operation = namedtuple("Operation", ["apply", "params"])
+
+# Resampling tier of a geometric operation; None keeps its historical
+# filter unless the request sets a tier for the whole pipeline
+QUALITY_PARAM = Param("choice", None, choices=tuple(QUALITY_TIERS))
+
+
+OPERATIONS = {
+    "rotate": Operation(
+        lambda img, angle, quality: _basic_rotate(img, angle, quality),
+        {
+            "angle": Param("number", 0.0, 0.0, 360.0),
+            "quality": QUALITY_PARAM,
+        },
+    ),
+    "scale": Operation(
+        lambda img, scale_factor, quality: (
+            _scale_image(img, scale_factor, quality)
+        ),
+        {
+            "scale_factor": Param("number", 1.0, 0.1, 2.0),
+            "quality": QUALITY_PARAM,
+        },
+    ),
+    "flip": Operation(
+        lambda img, direction: _flip_image(img, direction),
+        {"direction": Param(
+            "choice", "horizontal", choices=("horizontal", "vertical")
+        )},
+    ),
+    "brightness": Operation(
+        lambda img, value: _adjust_brightness(img, value),
+        {"value": Param("number", 1.0, 0.1, 3.0)},
+    ),
+    "contrast": Operation(
+        lambda img, value: _adjust_contrast(img, value),
+        {"value": Param("number", 1.0, 0.1, 3.0)},
+    ),
+    "saturation": Operation(
+        lambda img, value: _adjust_saturation(img, value),
+        {"value": Param("number", 1.0, 0.1, 3.0)},
+    ),
+    "blur": Operation(
+        lambda img, enabled, radius: (
+            _apply_blur(img, radius) if enabled else img
+        ),
+        {
+            "enabled": Param("bool", True),
+            # 0 keeps Pillow's fixed kernel, otherwise Gaussian sigma
+            "radius": Param("number", 0.0, 0.0, MAX_BLUR_RADIUS),
+        },
+    ),
+    "grayscale": Operation(
+        lambda img, enabled: _to_grayscale(img) if enabled else img,
+        {"enabled": Param("bool", True)},
+    ),
+    "random": Operation(
+        lambda img, quality: _apply_random_transformations(img, quality),
+        {"quality": QUALITY_PARAM},
+    ),
+}
+
+# Upper bound on pipeline length, to keep a single request bounded
+MAX_STEPS = 32
+
+
+def _coerce(op_type, name, spec, value):
+    """
+    Convert and check one parameter value against its schema.
+    """
+    if value is None and spec.default is None:
+        return None
+
+    if spec.kind == "number":
+        if isinstance(value, bool):
+            raise ValueError(f"{op_type}.{name} must be a number")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{op_type}.{name} must be a number") from None
+        if not spec.minimum <= value <= spec.maximum:
+            raise ValueError(
+                f"{op_type}.{name} must be between {spec.minimum} "
+                f"and {spec.maximum}"
+            )
+        return value
+
+    if spec.kind == "bool":
+        if isinstance(value, str):
+            return value.lower() in ("1", "true", "on", "yes")
+        return bool(value)
+
+    if value not in spec.choices:
+        allowed = ", ".join(f"'{choice}'" for choice in spec.choices)
+        raise ValueError(f"{op_type}.{name} must be one of {allowed}")
+    return value
+
+
+def validate_operations(operations):
+    """
+    Validate a list of operation dicts and return normalized steps.
+
+    Each step is ``(type, params)`` with every parameter present and
+    converted to its schema type. Raises ValueError on the first problem.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("Operations must be a non-empty list")
+    if len(operations) > MAX_STEPS:
+        raise ValueError(f"At most {MAX_STEPS} operations are allowed")
+
+    steps = []
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise ValueError(f"Operation {index} must be an object")
+        op_type = op.get("type")
+        if op_type not in OPERATIONS:
+            allowed = ", ".join(f"'{name}'" for name in OPERATIONS)
+            raise ValueError(
+                f"Invalid operation type: {op_type}. Use {allowed}"
+            )
+
+        schema = OPERATIONS[op_type].params
+        unknown = set(op) - set(schema) - {"type"}
+        if unknown:
+            raise ValueError(
+                f"Unknown parameter(s) for {op_type}: "
+                f"{', '.join(sorted(unknown))}"
+            )
+
+        params = {
+            name: _coerce(op_type, name, spec, op.get(name, spec.default))
+            for name, spec in schema.items()
+        }
+        steps.append((op_type, params))
+    return steps
+
+
+class Pipeline:
+    """
+    Ordered chain of basic, advanced and random operations
+    applied in a single pass over a decoded image.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    @classmethod
+    def from_operations(cls, operations):
+        """
+        Build a pipeline from client-supplied operation dicts.
+        """
+        return cls(validate_operations(operations))
+
+    @property
+    def names(self):
+        """
+        Operation types in execution order.
+        """
+        return [op_type for op_type, _ in self.steps]
+
+    def to_operations(self):
+        """
+        Return the normalized operations as plain dicts.
+        """
+        return [dict(params, type=op_type) for op_type, params in self.steps]
+
+    def with_quality(self, quality):
+        """
+        Return a pipeline whose geometric steps without their own
+        resampling tier use ``quality``.
+        """
+        if quality is None:
+            return self
+        return Pipeline([
+            (op_type, dict(params, quality=quality))
+            if "quality" in params and params["quality"] is None
+            else (op_type, params)
+            for op_type, params in self.steps
+        ])
+
+    def planned(self, mode):
+        """
+        Return the equivalent pipeline for a source worked on in ``mode``
+        (see :func:`controllers.planner._plan`).
+        """
+        steps = _plan(self.steps, mode)
+        if steps is self.steps:
+            return self
+        return Pipeline(steps)
+
+    @property
+    def cacheable_steps(self):
+        """
+        Leading steps whose results are deterministic (up to the first
+        random operation).
+        """
+        for index, (op_type, _) in enumerate(self.steps):
+            if op_type == "random":
+                return self.steps[:index]
+        return self.steps
+
+    def run(self, image, start=0, cache=None, source_key=None):
+        """
+        Apply every step in order and return the resulting image.
+
+        ``start`` skips steps whose result ``image`` already is. With a
+        stage ``cache`` and ``source_key`` the decoded source and every
+        deterministic intermediate result are cached, so a later run
+        differing only in its last steps can resume from them.
+        """
+        cacheable = len(self.cacheable_steps)
+        if start == 0:
+            # L for grayscale sources, RGB otherwise
+            converted = _to_working_mode(image)
+            if converted is not image:
+                image = converted
+            elif cache is not None:
+                # Cached images must not keep the source file open
+                image = image.copy()
+            if cache is not None:
+                cache.put(source_key, [], image)
+        for index in range(start, len(self.steps)):
+            op_type, params = self.steps[index]
+            image = OPERATIONS[op_type].apply(image, **params)
+            if cache is not None and index < cacheable:
+                cache.put(source_key, self.steps[:index + 1], image)
+        return image
+
+
+def _run_pipeline(image: Image.Image, operations) -> Image.Image:
+    """
+    Validate ``operations`` and apply them to ``image`` in one pass.
+    """
+    return Pipeline.from_operations(operations).run(image)
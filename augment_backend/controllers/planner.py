@@ -0,0 +1,99 @@
+# Source modes whose pixels carry a single intensity channel; alpha is
+# dropped, as it is when colour sources are reduced to RGB
+SINGLE_CHANNEL_MODES = ("1", "L", "LA")
+
+# Operations that do nothing to a single-channel image
+COLOUR_ONLY_OPERATIONS = ("saturation", "grayscale")
+
+
+def _is_gray_palette(image):
+    """
+    Check whether a palette image only uses shades of grey.
+
+    Reads the palette parsed with the header, so the image data is not
+    decoded.
+    """
+    palette = image.palette
+    if palette is None or (palette.rawmode or palette.mode) != "RGB":
+        return False
+    data = bytes(palette.palette)
+    return data[0::3] == data[1::3] == data[2::3]
+
+
+def _working_mode(image):
+    """
+    Mode an image is processed in: L for grayscale sources, else RGB
+    """
+    if image.mode in SINGLE_CHANNEL_MODES:
+        return "L"
+    if image.mode == "P" and _is_gray_palette(image):
+        return "L"
+    return "RGB"
+
+
+def _to_working_mode(image, mode=None):
+    """
+    Convert an image to its working mode (or ``mode``) in one step
+
+    Images already in that mode are returned as they are, not copied.
+    """
+    mode = mode or _working_mode(image)
+    if image.mode == mode:
+        return image
+    return image.convert(mode)
+
+
+def _grayscale_split(factors):
+    """
+    How many of a sequence of colour enhancement ``factors`` must run
+    before converting to grayscale
+
+    Factors above 1 can clip a channel, and a clipped colour does not
+    turn into the same grey as the enhanced grey of the original. The
+    others give the same result (up to rounding) on the L image.
+    """
+    return max(
+        (index + 1 for index, factor in enumerate(factors) if factor > 1.0),
+        default=0,
+    )
+
+
+def _step_factor(step):
+    """
+    Enhancement factor of a pipeline step for :func:`_grayscale_split`.
+    """
+    op_type, params = step
+    if op_type == "random":
+        # Draws enhancement factors of its own, up to 3.0
+        return float("inf")
+    if op_type in ("brightness", "contrast", "saturation"):
+        return params["value"]
+    return 0.0
+
+
+def _plan(steps, mode):
+    """
+    Rewrite pipeline steps for a source processed in ``mode``
+
+    On a single-channel source saturation and grayscale change nothing
+    and are dropped. When a colour source is to end up grayscale, the
+    conversion moves as early as it can without changing the result
+    beyond rounding (see :func:`_grayscale_split`), ideally to the
+    front, so the following steps work on one channel instead of three;
+    saturation after the conversion is skipped.
+    """
+    if mode == "L":
+        return [
+            step for step in steps if step[0] not in COLOUR_ONLY_OPERATIONS
+        ]
+    for index, step in enumerate(steps):
+        if step[0] == "grayscale" and step[1]["enabled"]:
+            break
+    else:
+        return steps
+
+    split = _grayscale_split([_step_factor(step) for step in steps[:index]])
+    return steps[:split] + [step] + [
+        later for later in steps[split:]
+        if later[0] not in COLOUR_ONLY_OPERATIONS
+    ]
@@ -0,0 +1,433 @@
+import random
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+from controllers.adv_augmentation import _adjust_saturation
+from controllers.basic_aug import QUALITY_TIERS
+from controllers.colour_batch import _blend_table
+
+
+# One policy operation. ``kind`` is "table" for point-wise operations,
+# which compile to 256-entry lookup tables, and "image" for the others.
+# ``standard`` and ``wide`` are the (low, high) magnitude ranges of the
+# RandAugment and TrivialAugment spaces, split into bins; ``signed``
+# magnitudes are negated half of the time.
+PolicyOp = namedtuple("PolicyOp", ["kind", "standard", "wide", "signed"])
+
+POLICY_OPERATIONS = {
+    "identity": PolicyOp("image", None, None, False),
+    "shear_x": PolicyOp("image", (0.0, 0.3), (0.0, 0.99), True),
+    "shear_y": PolicyOp("image", (0.0, 0.3), (0.0, 0.99), True),
+    # Fractions of the image side: 150px at 331px and 32px at 224px
+    "translate_x": PolicyOp(
+        "image", (0.0, 150 / 331), (0.0, 32 / 224), True
+    ),
+    "translate_y": PolicyOp(
+        "image", (0.0, 150 / 331), (0.0, 32 / 224), True
+    ),
+    "rotate": PolicyOp("image", (0.0, 30.0), (0.0, 135.0), True),
+    "brightness": PolicyOp("table", (0.0, 0.9), (0.0, 0.99), True),
+    "contrast": PolicyOp("table", (0.0, 0.9), (0.0, 0.99), True),
+    "saturation": PolicyOp("image", (0.0, 0.9), (0.0, 0.99), True),
+    "sharpness": PolicyOp("image", (0.0, 0.9), (0.0, 0.99), True),
+    # Bits kept per channel
+    "posterize": PolicyOp("table", (8, 4), (8, 2), False),
+    # Values from this threshold up are inverted
+    "solarize": PolicyOp("table", (255.0, 0.0), (255.0, 0.0), False),
+    "autocontrast": PolicyOp("image", None, None, False),
+    "equalize": PolicyOp("image", None, None, False),
+}
+
+POLICY_TYPES = ("randaugment", "trivialaugment", "autoaugment")
+
+# Magnitude bins per range, and the bounds a policy may choose
+DEFAULT_NUM_BINS = 31
+MAX_NUM_BINS = 101
+
+# Upper bounds keeping a single request bounded
+MAX_NUM_OPS = 8
+MAX_SUB_POLICIES = 64
+
+# Accepted keys per policy type
+POLICY_KEYS = {
+    "randaugment": {
+        "type", "operations", "num_ops", "magnitude", "num_bins",
+        "probability",
+    },
+    "trivialaugment": {"type", "operations", "num_bins"},
+    "autoaugment": {"type", "sub_policies", "num_bins"},
+}
+
+# One operation of an AutoAugment sub-policy
+SubPolicyOp = namedtuple("SubPolicyOp", ["type", "probability", "magnitude"])
+
+# Compiled lookup tables by (operation, value, mean), dropped all at
+# once when there are more than MAX_CACHED_TABLES
+_tables = {}
+MAX_CACHED_TABLES = 4096
+
+
+def _build_table(op_type, value, mean):
+    """
+    Compute the 256-entry uint8 lookup table of a point-wise operation.
+    """
+    if op_type == "brightness":
+        return _blend_table(1.0 + value, 0)
+    if op_type == "contrast":
+        return _blend_table(1.0 + value, mean)
+    values = np.arange(256, dtype=np.uint8)
+    if op_type == "posterize":
+        return values & np.uint8(~(2 ** (8 - value) - 1) & 0xFF)
+    return np.where(values < value, values, 255 - values).astype(np.uint8)
+
+
+def _table(op_type, value, mean=None):
+    """
+    Lookup table of a point-wise operation, compiled once per magnitude
+    (and, for contrast, per image mean).
+    """
+    key = (op_type, value, mean)
+    table = _tables.get(key)
+    if table is None:
+        if len(_tables) >= MAX_CACHED_TABLES:
+            _tables.clear()
+        table = _tables.setdefault(key, _build_table(op_type, value, mean))
+    return table
+
+
+def _apply_table(image, table):
+    """
+    Apply a composed lookup table (if any) to every band of an image.
+    """
+    if table is None:
+        return image
+    return image.point(table.tolist() * len(image.getbands()))
+
+
+def _contrast_mean(image, table=None):
+    """
+    Mean luma that ImageEnhance.Contrast blends towards, for a grey
+    ``image`` once ``table`` is applied, or for a colour ``image``.
+    """
+    gray = image if image.mode == "L" else image.convert("L")
+    histogram = np.array(gray.histogram(), dtype=np.float64)
+    values = np.arange(256) if table is None else table
+    return int(histogram @ values / histogram.sum() + 0.5)
+
+
+def _affine(image, data, resample):
+    """
+    Apply an affine transform mapping output to input coordinates,
+    keeping the image size and filling with black.
+    """
+    return image.transform(
+        image.size, Image.Transform.AFFINE, data, resample
+    )
+
+
+# Operations applied to the image itself, given the signed value and the
+# resampling filter of geometric operations
+IMAGE_OPERATIONS = {
+    "identity": lambda img, value, resample: img,
+    "shear_x": lambda img, value, resample: _affine(
+        img, (1, value, 0, 0, 1, 0), resample
+    ),
+    "shear_y": lambda img, value, resample: _affine(
+        img, (1, 0, 0, value, 1, 0), resample
+    ),
+    "translate_x": lambda img, value, resample: _affine(
+        img, (1, 0, value * img.width, 0, 1, 0), resample
+    ),
+    "translate_y": lambda img, value, resample: _affine(
+        img, (1, 0, 0, 0, 1, value * img.height), resample
+    ),
+    "rotate": lambda img, value, resample: img.rotate(value, resample),
+    "saturation": lambda img, value, resample: (
+        img if img.mode == "L" else _adjust_saturation(img, 1.0 + value)
+    ),
+    "sharpness": lambda img, value, resample: (
+        ImageEnhance.Sharpness(img).enhance(1.0 + value)
+    ),
+    "autocontrast": lambda img, value, resample: ImageOps.autocontrast(img),
+    "equalize": lambda img, value, resample: ImageOps.equalize(img),
+}
+
+
+def _apply_draws(image, draws, quality=None):
+    """
+    Apply drawn policy operations to an RGB or L image.
+
+    Runs of point-wise operations are composed into one lookup table, so
+    each run costs a single pass over the pixels. Geometric operations
+    resample with the rotation filter of the ``quality`` tier (NEAREST
+    by default).
+    """
+    if quality is None:
+        resample = Image.Resampling.NEAREST
+    else:
+        resample = QUALITY_TIERS[quality].rotate
+
+    pending = None
+    for draw in draws:
+        op_type, value = draw["type"], draw["value"]
+        if POLICY_OPERATIONS[op_type].kind == "image":
+            image = _apply_table(image, pending)
+            pending = None
+            image = IMAGE_OPERATIONS[op_type](image, value, resample)
+            continue
+
+        mean = None
+        if op_type == "contrast":
+            # The mean luma of a colour image cannot be read from the
+            # table, so the run so far is applied first
+            if image.mode != "L":
+                image = _apply_table(image, pending)
+                pending = None
+            mean = _contrast_mean(image, pending)
+        table = _table(op_type, value, mean)
+        pending = table if pending is None else table[pending]
+    return _apply_table(image, pending)
+
+
+def _magnitude_value(op_type, magnitude, num_bins, wide=False):
+    """
+    Unsigned value of an operation at a magnitude bin.
+    """
+    spec = POLICY_OPERATIONS[op_type]
+    bounds = spec.wide if wide else spec.standard
+    if bounds is None:
+        return 0.0
+    low, high = bounds
+    value = low + (high - low) * magnitude / max(num_bins - 1, 1)
+    if op_type == "posterize":
+        return int(round(value))
+    return round(value, 6)
+
+
+def _check_int(spec, name, default, minimum, maximum):
+    """
+    Read an integer policy setting and check its range.
+    """
+    value = spec.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name} must be an integer")
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return value
+
+
+def _check_probability(value, name="probability"):
+    """
+    Check that a probability is a number between 0 and 1.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"{name} must be between 0 and 1")
+    return float(value)
+
+
+def _check_operation(op_type):
+    """
+    Check that an operation name is known.
+    """
+    if op_type not in POLICY_OPERATIONS:
+        allowed = ", ".join(f"'{name}'" for name in POLICY_OPERATIONS)
+        raise ValueError(
+            f"Invalid policy operation: {op_type}. Use {allowed}"
+        )
+    return op_type
+
+
+class Policy:
+    """
+    Random augmentation policy defined by the client: RandAugment,
+    TrivialAugment or AutoAugment-style sub-policies.
+    """
+
+    def __init__(self, policy_type, operations=None, num_ops=2,
+                 magnitude=9, num_bins=DEFAULT_NUM_BINS, probability=1.0,
+                 sub_policies=None):
+        self.type = policy_type
+        self.operations = tuple(operations or POLICY_OPERATIONS)
+        self.num_ops = num_ops
+        self.magnitude = magnitude
+        self.num_bins = num_bins
+        self.probability = probability
+        self.sub_policies = sub_policies or []
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Validate a client policy dict and build the policy.
+
+        Raises ValueError on the first problem.
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("Policy must be an object")
+        policy_type = spec.get("type")
+        if policy_type not in POLICY_TYPES:
+            allowed = ", ".join(f"'{name}'" for name in POLICY_TYPES)
+            raise ValueError(
+                f"Invalid policy type: {policy_type}. Use {allowed}"
+            )
+        unknown = set(spec) - POLICY_KEYS[policy_type]
+        if unknown:
+            raise ValueError(
+                f"Unknown setting(s) for {policy_type}: "
+                f"{', '.join(sorted(unknown))}"
+            )
+
+        num_bins = _check_int(
+            spec, "num_bins", DEFAULT_NUM_BINS, 1, MAX_NUM_BINS
+        )
+        if policy_type == "autoaugment":
+            return cls(
+                policy_type, num_bins=num_bins,
+                sub_policies=cls._check_sub_policies(
+                    spec.get("sub_policies"), num_bins
+                ),
+            )
+
+        operations = spec.get("operations")
+        if operations is not None:
+            if not isinstance(operations, list) or not operations:
+                raise ValueError("operations must be a non-empty list")
+            operations = [_check_operation(name) for name in operations]
+        if policy_type == "trivialaugment":
+            return cls(policy_type, operations, num_bins=num_bins)
+
+        return cls(
+            policy_type, operations,
+            num_ops=_check_int(spec, "num_ops", 2, 1, MAX_NUM_OPS),
+            magnitude=_check_int(spec, "magnitude", 9, 0, num_bins - 1),
+            num_bins=num_bins,
+            probability=_check_probability(spec.get("probability", 1.0)),
+        )
+
+    @staticmethod
+    def _check_sub_policies(sub_policies, num_bins):
+        """
+        Validate AutoAugment sub-policies: lists of operations, each with
+        a probability and a magnitude bin.
+        """
+        if not isinstance(sub_policies, list) or not sub_policies:
+            raise ValueError("sub_policies must be a non-empty list")
+        if len(sub_policies) > MAX_SUB_POLICIES:
+            raise ValueError(
+                f"At most {MAX_SUB_POLICIES} sub-policies are allowed"
+            )
+
+        checked = []
+        for index, sub_policy in enumerate(sub_policies):
+            if not isinstance(sub_policy, list) or not sub_policy:
+                raise ValueError(
+                    f"Sub-policy {index} must be a non-empty list"
+                )
+            if len(sub_policy) > MAX_NUM_OPS:
+                raise ValueError(
+                    f"Sub-policy {index} has more than {MAX_NUM_OPS} "
+                    "operations"
+                )
+            ops = []
+            for op in sub_policy:
+                if not isinstance(op, dict):
+                    raise ValueError(
+                        f"Sub-policy {index} operations must be objects"
+                    )
+                unknown = set(op) - {"type", "probability", "magnitude"}
+                if unknown:
+                    raise ValueError(
+                        f"Unknown setting(s) in sub-policy {index}: "
+                        f"{', '.join(sorted(unknown))}"
+                    )
+                ops.append(SubPolicyOp(
+                    _check_operation(op.get("type")),
+                    _check_probability(op.get("probability", 1.0)),
+                    _check_int(op, "magnitude", 0, 0, num_bins - 1),
+                ))
+            checked.append(ops)
+        return checked
+
+    def to_spec(self):
+        """
+        Return the normalized policy as a plain dict.
+        """
+        if self.type == "autoaugment":
+            return {
+                "type": self.type,
+                "num_bins": self.num_bins,
+                "sub_policies": [
+                    [op._asdict() for op in sub_policy]
+                    for sub_policy in self.sub_policies
+                ],
+            }
+        spec = {
+            "type": self.type,
+            "operations": list(self.operations),
+            "num_bins": self.num_bins,
+        }
+        if self.type == "randaugment":
+            spec.update(
+                num_ops=self.num_ops, magnitude=self.magnitude,
+                probability=self.probability,
+            )
+        return spec
+
+    def _draw(self, op_type, magnitude):
+        """
+        Draw the signed value of one operation at a magnitude bin.
+        """
+        value = _magnitude_value(
+            op_type, magnitude, self.num_bins,
+            wide=self.type == "trivialaugment",
+        )
+        if POLICY_OPERATIONS[op_type].signed and random.random() < 0.5:
+            value = -value if value else value
+        return {"type": op_type, "magnitude": magnitude, "value": value}
+
+    def sample(self):
+        """
+        Draw the operations to apply to one image, in order.
+        """
+        if self.type == "trivialaugment":
+            return [self._draw(
+                random.choice(self.operations),
+                random.randrange(self.num_bins),
+            )]
+
+        if self.type == "autoaugment":
+            return [
+                self._draw(op.type, op.magnitude)
+                for op in random.choice(self.sub_policies)
+                if random.random() < op.probability
+            ]
+
+        draws = []
+        for _ in range(self.num_ops):
+            op_type = random.choice(self.operations)
+            if random.random() < self.probability:
+                draws.append(self._draw(op_type, self.magnitude))
+        return draws
+
+    def apply(self, image, quality=None):
+        """
+        Apply one random draw of the policy to an RGB or L image.
+
+        Returns:
+            tuple: The augmented image and the operations applied.
+        """
+        draws = self.sample()
+        return _apply_draws(image, draws, quality), draws
+
+
+def _generate_policy_variants(image, count, policy, quality=None):
+    """
+    Yield (parameters, image) for ``count`` variants of an image drawn
+    from a policy.
+    """
+    for _ in range(count):
+        augmented, draws = policy.apply(image, quality)
+        yield {"policy": policy.type, "operations": draws}, augmented
@@ -0,0 +1,120 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from controllers.planner import _working_mode
+
+
+class ProxyCache:
+    """
+    Least-recently-used cache of downscaled preview proxies
+    keyed by source digest and proxy size.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached ``(proxy, scale)`` pair, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """
+        Store an entry, evicting the least recently used ones.
+        """
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_proxy_cache = None
+_proxy_cache_lock = threading.Lock()
+
+
+def _get_proxy_cache(max_entries):
+    """
+    Return the process-wide proxy cache, creating it on first use.
+    """
+    global _proxy_cache
+    with _proxy_cache_lock:
+        if _proxy_cache is None:
+            _proxy_cache = ProxyCache(max_entries)
+        return _proxy_cache
+
+
+def _source_digest(image_file):
+    """
+    SHA-256 of an uploaded file's bytes; the stream is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    image_file.seek(0)
+    for block in iter(lambda: image_file.read(1024 * 1024), b""):
+        digest.update(block)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def _make_proxy(image_file, long_edge):
+    """
+    Decode a downscaled proxy whose long edge is at most ``long_edge``.
+
+    Returns the proxy, in the source's working mode, and its scale
+    relative to the source. JPEG sources are decoded at reduced size
+    directly by the decoder.
+    """
+    with Image.open(image_file) as image:
+        source_long_edge = max(image.size)
+        mode = _working_mode(image)
+        image.draft(mode, (long_edge, long_edge))
+        # convert() always copies, so the proxy outlives the file
+        proxy = image.convert(mode)
+    proxy.thumbnail(
+        (long_edge, long_edge), Image.Resampling.BILINEAR, reducing_gap=2.0
+    )
+    return proxy, max(proxy.size) / source_long_edge
+
+
+def _get_proxy(image_file, long_edge, max_entries, preview_id=None):
+    """
+    Return ``(proxy, scale, preview_id)`` for a preview render.
+
+    With ``image_file`` the proxy is looked up by the file's digest and
+    built on a miss; with only ``preview_id`` it must already be cached.
+    Returns None when the proxy is no longer cached.
+    """
+    cache = _get_proxy_cache(max_entries)
+    if image_file is not None:
+        preview_id = _source_digest(image_file)
+    entry = cache.get((preview_id, long_edge))
+    if entry is None:
+        if image_file is None:
+            return None
+        entry = _make_proxy(image_file, long_edge)
+        cache.put((preview_id, long_edge), entry)
+    proxy, scale = entry
+    return proxy.copy(), scale, preview_id
+
+
+def _encode_preview(image, quality=80):
+    """
+    Encode a preview render as baseline JPEG (much faster than PNG)
+    """
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    buffer.seek(0)
+    return buffer
@@ -1,16 +1,35 @@
 import io
 import random
 
-from PIL import Image, ImageEnhance
+from PIL import Image
 
+from controllers.adv_augmentation import (
+    _adjust_brightness, _adjust_contrast, _adjust_saturation, _to_grayscale
+)
+from controllers.basic_aug import _basic_rotate, _flip_image, _resize
+from controllers.colour_batch import DEFAULT_BATCH_BYTES, _colour_variants
+from controllers.planner import _grayscale_split, _to_working_mode
 
-def _generate_random_augmentation(image_file):
+
+# Colour adjustments in the order they are applied, by parameter name
+COLOUR_ADJUSTMENTS = (
+    ("brightness", _adjust_brightness),
+    ("contrast", _adjust_contrast),
+    ("saturation", _adjust_saturation),
+)
+
+# Fewest colour variants of one image worth computing as a batch; below
+# this, finding the image's distinct colours costs more than it saves
+MIN_BATCH_VARIANTS = 4
+
+
+def _generate_random_augmentation(image_file, quality=None):
     """
     Apply random augmentation to an uploaded image.
     """
-    original_image = Image.open(image_file).convert('RGB')
+    original_image = _to_working_mode(Image.open(image_file))
 
-    augmented_image = _apply_random_transformations(original_image)
+    augmented_image = _apply_random_transformations(original_image, quality)
     
     img_bytes = io.BytesIO()
     augmented_image.save(img_bytes, format='PNG')
@@ -19,50 +38,133 @@ def _generate_random_augmentation(image_file):
     return img_bytes
 
 
-def _apply_random_transformations(image):
+def _sample_colour_parameters():
     """
-    Apply random transformations to an image.
+    Draw one set of random colour parameters.
     """
-    # Random rotation (0-360 degrees)
-    rotation_angle = random.randint(0, 360)
-    image = image.rotate(rotation_angle, expand=True)
-    
-    # Random scaling (0.1x to 10x)
-    scale_factor = random.uniform(0.1, 10.0)
-    new_width = int(image.width * scale_factor)
-    new_height = int(image.height * scale_factor)
+    return {
+        # Random colour adjustments (0.0 to 3.0)
+        "brightness": random.uniform(0.0, 3.0),
+        "contrast": random.uniform(0.0, 3.0),
+        "saturation": random.uniform(0.0, 3.0),
+        # Random grayscale conversion
+        "grayscale": random.choice([True, False]),
+    }
+
+
+def _sample_random_parameters():
+    """
+    Draw one set of random augmentation parameters.
+    """
+    params = {
+        # Random rotation (0-360 degrees)
+        "rotation_angle": random.randint(0, 360),
+        # Random scaling (0.1x to 10x)
+        "scale_factor": random.uniform(0.1, 10.0),
+        # Random horizontal and vertical flips
+        "flip_horizontal": random.choice([True, False]),
+        "flip_vertical": random.choice([True, False]),
+    }
+    params.update(_sample_colour_parameters())
+    return params
+
+
+def _grayscale_index(params):
+    """
+    Index of the colour adjustment a grayscale variant is converted
+    before (see :func:`controllers.planner._grayscale_split`), or the
+    number of adjustments for colour variants.
+    """
+    if not params["grayscale"]:
+        return len(COLOUR_ADJUSTMENTS)
+    return _grayscale_split(
+        [params[name] for name, _ in COLOUR_ADJUSTMENTS]
+    )
+
+
+def _apply_colour(image, params):
+    """
+    Apply the colour adjustments of a set of random parameters.
+    """
+    split = _grayscale_index(params)
+    for index, (name, adjust) in enumerate(COLOUR_ADJUSTMENTS):
+        if index == split and image.mode != "L":
+            image = _to_grayscale(image)
+        if image.mode != "L" or adjust is not _adjust_saturation:
+            image = adjust(image, params[name])
+
+    if params["grayscale"] and image.mode != "L":
+        image = _to_grayscale(image)
+
+    return image
+
+
+def _apply_transformations(image, params, quality=None):
+    """
+    Apply a set of parameters drawn by _sample_random_parameters.
+
+    Without a resampling ``quality`` tier, rotation uses NEAREST and
+    scaling LANCZOS. Grayscale variants are converted to L as early as
+    :func:`controllers.planner._grayscale_split` allows, so the later
+    steps work on one channel (and saturation is skipped).
+    """
+    if _grayscale_index(params) == 0 and image.mode != "L":
+        image = _to_grayscale(image)
+
+    image = _basic_rotate(image, params["rotation_angle"], quality)
+
+    new_width = int(image.width * params["scale_factor"])
+    new_height = int(image.height * params["scale_factor"])
 
     if new_width > 0 and new_height > 0:
-        image = image.resize(
-            (new_width, new_height),
+        image = _resize(
+            image, (new_width, new_height), quality,
             Image.Resampling.LANCZOS
         )
-    
-    # Random horizontal flip
-    if random.choice([True, False]):
-        image = image.transpose(Image.FLIP_LEFT_RIGHT)
-    
-    # Random vertical flip
-    if random.choice([True, False]):
-        image = image.transpose(Image.FLIP_TOP_BOTTOM)
-    
-    # Random brightness adjustment (0.0 to 3.0)
-    brightness_factor = random.uniform(0.0, 3.0)
-    enhancer = ImageEnhance.Brightness(image)
-    image = enhancer.enhance(brightness_factor)
-    
-    # Random contrast adjustment (0.0 to 3.0)
-    contrast_factor = random.uniform(0.0, 3.0)
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(contrast_factor)
-    
-    # Random saturation adjustment (0.0 to 3.0)
-    saturation_factor = random.uniform(0.0, 3.0)
-    enhancer = ImageEnhance.Color(image)
-    image = enhancer.enhance(saturation_factor)
-    
-    # Random grayscale conversion
-    if random.choice([True, False]):
-        image = image.convert('L').convert('RGB')
-    
-    return image
\ No newline at end of file
+
+    if params["flip_horizontal"]:
+        image = _flip_image(image, "horizontal")
+
+    if params["flip_vertical"]:
+        image = _flip_image(image, "vertical")
+
+    return _apply_colour(image, params)
+
+
+def _apply_random_transformations(image, quality=None):
+    """
+    Apply random transformations to an image.
+    """
+    return _apply_transformations(
+        image, _sample_random_parameters(), quality
+    )
+
+
+def _generate_random_variants(image, count, quality=None):
+    """
+    Yield (parameters, image) for ``count`` random variants of an image.
+    """
+    for _ in range(count):
+        params = _sample_random_parameters()
+        yield params, _apply_transformations(image, params, quality)
+
+
+def _generate_colour_variants(image, count, max_bytes=DEFAULT_BATCH_BYTES):
+    """
+    Yield (parameters, image) for ``count`` random colour variants of an
+    image, keeping its geometry.
+
+    From MIN_BATCH_VARIANTS variants of an RGB or L image on, they are
+    computed together by
+    :func:`controllers.colour_batch._colour_variants`, in batches bounded
+    by ``max_bytes``; the results are the same as adjusting each variant
+    on its own, which is what happens to smaller requests and to images
+    with too many distinct colours.
+    """
+    params = [_sample_colour_parameters() for _ in range(count)]
+    variants = None
+    if count >= MIN_BATCH_VARIANTS and image.mode in ("RGB", "L"):
+        variants = _colour_variants(image, params, max_bytes)
+    if variants is None:
+        variants = (_apply_colour(image, sample) for sample in params)
+    yield from zip(params, variants)
@@ -0,0 +1,92 @@
+import json
+import threading
+from collections import OrderedDict
+
+
+def _image_bytes(image):
+    """
+    Approximate memory held by a decoded image
+    """
+    if image.mode in ("I", "F") or len(image.getbands()) > 1:
+        pixel_size = 4
+    else:
+        pixel_size = 1
+    return image.width * image.height * pixel_size
+
+
+class StageCache:
+    """
+    Byte-bounded LRU of intermediate pipeline results keyed by
+    source digest and the operations applied so far.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(source_key, steps):
+        return source_key, json.dumps(steps, sort_keys=True, default=str)
+
+    def get(self, source_key, steps):
+        """
+        Return the cached result of ``steps`` on the source, or None.
+        """
+        key = self._key(source_key, steps)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, source_key, steps, image):
+        """
+        Cache the result of ``steps``, evicting least recently used ones.
+
+        Cached images are shared, so callers must not modify them.
+        """
+        size = _image_bytes(image)
+        if size > self.max_bytes:
+            return
+        key = self._key(source_key, steps)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (image, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def resume(self, source_key, steps):
+        """
+        Find the longest cached prefix of ``steps``.
+
+        Returns ``(count, image)``: the number of steps already applied
+        and their cached result, or ``(0, None)`` when not even the
+        decoded source is cached.
+        """
+        for count in range(len(steps), -1, -1):
+            image = self.get(source_key, steps[:count])
+            if image is not None:
+                return count, image
+        return 0, None
+
+
+_stage_cache = None
+_stage_cache_lock = threading.Lock()
+
+
+def _get_stage_cache(max_bytes):
+    """
+    Return the process-wide stage cache, creating it on first use.
+    """
+    global _stage_cache
+    with _stage_cache_lock:
+        if _stage_cache is None:
+            _stage_cache = StageCache(max_bytes)
+        return _stage_cache
@@ -0,0 +1,297 @@
+import struct
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from controllers.adv_augmentation import (
+    _adjust_brightness, _adjust_contrast, _adjust_saturation, _apply_blur,
+    _blur_reach, _to_grayscale
+)
+from controllers.planner import _plan, _working_mode
+
+
+# Per-pixel operations that can run tile by tile
+TILE_OPERATIONS = {"brightness", "contrast", "saturation", "blur", "grayscale"}
+
+# Rows converted per strip when spilling a decoded image to disk
+SPILL_ROWS = 256
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """
+    Return the shared tile pool, creating it on first use.
+
+    Kept separate from the batch pool so a batch job running a tiled
+    image never waits on its own pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="augment-tile"
+            )
+        return _executor
+
+
+def _steps_for_augment(brightness=1.0, contrast=1.0, saturation=1.0,
+                       blur=False, grayscale=False, blur_radius=0.0):
+    """
+    Pipeline steps equivalent to ``_augment_image`` with these arguments.
+    """
+    steps = []
+    if brightness != 1.0:
+        steps.append(("brightness", {"value": brightness}))
+    if contrast != 1.0:
+        steps.append(("contrast", {"value": contrast}))
+    if saturation != 1.0:
+        steps.append(("saturation", {"value": saturation}))
+    if blur:
+        steps.append(("blur", {"enabled": True, "radius": blur_radius}))
+    if grayscale:
+        steps.append(("grayscale", {"enabled": True}))
+    return steps
+
+
+def _is_tileable(steps):
+    """
+    Check that every step is a per-pixel operation.
+    """
+    return all(op_type in TILE_OPERATIONS for op_type, _ in steps)
+
+
+def _halo(steps):
+    """
+    Context needed around a tile for ``steps``; blurs stack.
+    """
+    return sum(
+        _blur_reach(params.get("radius", 0.0)) for op_type, params in steps
+        if op_type == "blur" and params["enabled"]
+    )
+
+
+def _tile_boxes(width, height, tile_size):
+    """
+    Yield ``(left, top, right, bottom)`` boxes covering the image.
+    """
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield (
+                left, top,
+                min(left + tile_size, width), min(top + tile_size, height),
+            )
+
+
+def _spill(image_file, buffer, steps):
+    """
+    Decode an image into a memory-mapped ``(H, W, C)`` array.
+
+    The array is in the image's working mode, or L right away when
+    ``steps`` make the result grayscale. Returns the array and the
+    steps still to apply to it. Only the decoder itself holds the full
+    image in memory, and only until this returns; everything after
+    reads from the memory map.
+    """
+    with Image.open(image_file) as image:
+        width, height = image.size
+        mode = _working_mode(image)
+        steps = _plan(steps, mode)
+        if steps and steps[0][0] == "grayscale":
+            # Convert straight to one channel while spilling
+            mode, steps = "L", steps[1:]
+        channels = 1 if mode == "L" else 3
+        source = np.memmap(
+            buffer, dtype=np.uint8, mode="w+",
+            shape=(height, width, channels),
+        )
+        for top in range(0, height, SPILL_ROWS):
+            bottom = min(top + SPILL_ROWS, height)
+            strip = image.crop((0, top, width, bottom)).convert(mode)
+            source[top:bottom] = np.asarray(strip).reshape(
+                bottom - top, width, channels
+            )
+    return source, steps
+
+
+def _read_tile(source, box, halo):
+    """
+    Read a tile plus ``halo`` pixels of context, clipped to the image.
+
+    Returns the tile image and the box of the requested area within it.
+    """
+    height, width = source.shape[:2]
+    left, top, right, bottom = box
+    outer_left, outer_top = max(left - halo, 0), max(top - halo, 0)
+    outer_right = min(right + halo, width)
+    outer_bottom = min(bottom + halo, height)
+    array = source[outer_top:outer_bottom, outer_left:outer_right]
+    if array.shape[2] == 1:
+        array = array[:, :, 0]
+    inner = (
+        left - outer_left, top - outer_top,
+        right - outer_left, bottom - outer_top,
+    )
+    return Image.fromarray(np.ascontiguousarray(array)), inner
+
+
+def _apply_steps(tile, steps, means):
+    """
+    Apply ``steps`` to one tile using precomputed contrast means.
+    """
+    for index, (op_type, params) in enumerate(steps):
+        if op_type == "brightness":
+            tile = _adjust_brightness(tile, params["value"])
+        elif op_type == "contrast":
+            tile = _adjust_contrast(tile, params["value"], means[index])
+        elif op_type == "saturation":
+            tile = _adjust_saturation(tile, params["value"])
+        elif op_type == "blur" and params["enabled"]:
+            tile = _apply_blur(tile, params.get("radius", 0.0))
+        elif op_type == "grayscale" and params["enabled"]:
+            tile = _to_grayscale(tile)
+    return tile
+
+
+def _map_tiles(func, boxes, workers):
+    """
+    Run ``func`` over every tile box, on the tile pool if ``workers > 1``.
+    """
+    if workers <= 1:
+        return [func(box) for box in boxes]
+    return list(_get_executor(workers).map(func, boxes))
+
+
+def _contrast_means(source, steps, tile_size, workers):
+    """
+    Compute the global mean Pillow's contrast uses for each contrast step.
+
+    Contrast blends towards the mean luminance of the whole image as it
+    is at that step, so the preceding steps are run tile by tile and
+    their luminance histograms summed.
+    """
+    height, width = source.shape[:2]
+    means = {}
+    for index, (op_type, _) in enumerate(steps):
+        if op_type != "contrast":
+            continue
+        prefix = steps[:index]
+        halo = _halo(prefix)
+
+        def histogram(box, prefix=prefix, halo=halo):
+            tile, inner = _read_tile(source, box, halo)
+            tile = _apply_steps(tile, prefix, means).crop(inner)
+            return tile.convert("L").histogram()
+
+        totals = np.zeros(256, dtype=np.int64)
+        for counts in _map_tiles(
+            histogram, list(_tile_boxes(width, height, tile_size)), workers
+        ):
+            totals += counts
+        mean = float(np.dot(np.arange(256), totals)) / (width * height)
+        means[index] = int(mean + 0.5)
+    return means
+
+
+def _run_tiled(source, steps, output, tile_size=1024, workers=1):
+    """
+    Apply per-pixel ``steps`` from ``source`` into ``output`` tile by tile.
+
+    Both are ``(H, W, C)`` uint8 arrays, normally memory maps. Peak memory
+    is a few tiles per worker regardless of the image size.
+    """
+    if not _is_tileable(steps):
+        raise ValueError("Only per-pixel operations can run tiled")
+    height, width = source.shape[:2]
+    means = _contrast_means(source, steps, tile_size, workers)
+    halo = _halo(steps)
+
+    def process(box):
+        tile, inner = _read_tile(source, box, halo)
+        tile = _apply_steps(tile, steps, means).crop(inner)
+        left, top, right, bottom = box
+        pixels = np.asarray(tile)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, np.newaxis]
+        output[top:bottom, left:right] = pixels
+
+    _map_tiles(process, list(_tile_boxes(width, height, tile_size)), workers)
+    return output
+
+
+def _png_chunk(tag, data):
+    return (
+        struct.pack(">I", len(data)) + tag + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def _write_png(array, fileobj, rows=256):
+    """
+    Stream an ``(H, W, 1|3)`` uint8 array to ``fileobj`` as PNG.
+
+    Rows are filtered ("Up") and compressed a strip at a time, so the
+    encoder never needs the whole image in memory.
+    """
+    height, width, channels = array.shape
+    color_type = {1: 0, 3: 2}[channels]
+    fileobj.write(b"\x89PNG\r\n\x1a\n")
+    fileobj.write(_png_chunk(b"IHDR", struct.pack(
+        ">IIBBBBB", width, height, 8, color_type, 0, 0, 0
+    )))
+
+    compressor = zlib.compressobj(6)
+    previous = np.zeros((1, width * channels), dtype=np.uint8)
+    for top in range(0, height, rows):
+        strip = np.asarray(array[top:top + rows]).reshape(-1, width * channels)
+        above = np.concatenate((previous, strip[:-1]))
+        filtered = np.empty((len(strip), width * channels + 1), np.uint8)
+        filtered[:, 0] = 2
+        filtered[:, 1:] = strip - above
+        previous = strip[-1:]
+        data = compressor.compress(filtered.tobytes())
+        if data:
+            fileobj.write(_png_chunk(b"IDAT", data))
+    fileobj.write(_png_chunk(b"IDAT", compressor.flush()))
+    fileobj.write(_png_chunk(b"IEND", b""))
+
+
+def _augment_tiled(image_file, steps, tile_size=1024, workers=1,
+                   directory=None):
+    """
+    Apply per-pixel ``steps`` to a very large image with bounded memory.
+
+    The upload is decoded into a memory-mapped scratch file (one channel
+    for grayscale sources or results), processed tile by tile into a
+    second one and streamed out as PNG. Returns an anonymous temporary
+    file holding the PNG, positioned at the start.
+    """
+    with tempfile.TemporaryFile(dir=directory) as source_buffer, \
+            tempfile.TemporaryFile(dir=directory) as output_buffer:
+        source, steps = _spill(image_file, source_buffer, steps)
+        height, width, channels = source.shape
+        if any(
+            op_type == "grayscale" and params["enabled"]
+            for op_type, params in steps
+        ):
+            channels = 1
+        output = np.memmap(
+            output_buffer, dtype=np.uint8, mode="w+",
+            shape=(height, width, channels),
+        )
+        _run_tiled(source, steps, output, tile_size, workers)
+
+        png = tempfile.TemporaryFile(dir=directory)
+        try:
+            _write_png(output, png)
+        except Exception:
+            png.close()
+            raise
+        del source, output
+    png.seek(0)
+    return png
@@ -10,13 +10,16 @@ user_collection = None
 log_collection = None
 
 
-def init_db(app):
+def init_db(app, mongo_client=None):
     """
     Initialize MongoDB connection and collections.
+
+    A pre-built client (e.g. an in-memory stand-in for load tests) can be
+    passed as ``mongo_client`` instead of connecting to ``MONGO_URI``.
     """
     global client, db, user_collection, log_collection
     try:
-        client = MongoClient(
+        client = mongo_client or MongoClient(
             Config.MONGO_URI,
             serverSelectionTimeoutMS=5000
         )
@@ -0,0 +1,117 @@
+"""Boot the Flask app without MongoDB or SMTP for load testing.
+
+The app is created with an in-memory MongoDB stand-in and with Flask-Mail
+sending suppressed, then served from a background thread on a local
+port. JWTs are minted directly with the app's secret, so no user needs to
+register or log in.
+
+The load test replays the same upload, so result, stage and coalescing
+caches are off unless asked for; otherwise it would measure cache hits
+rather than augmentation work.
+"""
+import os
+import threading
+
+from werkzeug.serving import make_server
+
+
+# Settings ``Config`` insists on at import time. Real values from the
+# environment or ``.env`` take precedence.
+STUB_ENVIRONMENT = {
+    "JWT_SECRET_KEY": "loadtest-secret-key-not-for-production-use",
+    "MONGOURI": "mongodb://in-memory",
+    "MAIL_USERNAME": "loadtest@example.com",
+    "MAIL_PASSWORD": "unused",
+}
+
+
+def prepare_environment():
+    """
+    Fill in the environment variables required to import ``Config``.
+    """
+    for key, value in STUB_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+
+
+# Settings that let repeated identical requests skip the work
+CACHES_OFF = {
+    "RESULT_STORE_BYTES": 0,
+    "STAGE_CACHE_BYTES": 0,
+    "COALESCE_REQUESTS": False,
+}
+
+
+def build_app(config_overrides=None, caches=False):
+    """
+    Create the app backed by in-memory collections and a muted mailer.
+
+    With ``caches`` False (the default) the settings in
+    :data:`CACHES_OFF` apply unless ``config_overrides`` sets them.
+
+    Returns:
+        tuple: The Flask app and its ``InMemoryMongoClient``.
+    """
+    prepare_environment()
+
+    # Imported late so the stub environment is in place first
+    # pylint: disable=import-outside-toplevel
+    from app import create_app
+    from loadtest.stubs import InMemoryMongoClient
+
+    mongo_client = InMemoryMongoClient()
+    overrides = {"MAIL_SUPPRESS_SEND": True}
+    if not caches:
+        overrides.update(CACHES_OFF)
+    overrides.update(config_overrides or {})
+    app = create_app(overrides, mongo_client=mongo_client)
+    return app, mongo_client
+
+
+def mint_token(app, email="loadtest@example.com"):
+    """
+    Create an access token for ``email`` without going through /login.
+    """
+    # pylint: disable=import-outside-toplevel
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        return create_access_token(identity=email)
+
+
+class LiveServer:
+    """Serve an app from a background thread on a local port."""
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        self._server = make_server(host, port, app, threaded=True)
+        self.host = host
+        self.port = self._server.server_port
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self):
+        """
+        Base URL of the running server.
+        """
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """
+        Start serving requests.
+        """
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the server and wait for its thread to exit.
+        """
+        self._server.shutdown()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,321 @@
+"""HTTP load test for the augmentation API.
+
+Drives a weighted mix of ``/augment/random``, ``/augment/rotate``,
+``/augment/basic`` and ``/augment/advanced`` requests at a fixed
+concurrency and reports throughput and latency percentiles per route.
+
+By default the app is booted in-process with stubbed MongoDB and mail
+(see :mod:`loadtest.harness`), with the result, stage and coalescing
+caches off so every request does its work; ``--caches`` keeps their
+configured settings. Pass ``--target`` and ``--token`` to load an
+already running deployment instead.
+
+Usage (from ``augment_backend``)::
+
+    python -m loadtest.run --concurrency 8 --duration 30
+    python -m loadtest.run --mix basic=3,advanced=3,random=1,rotate=1
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from benchmarks.corpus import encode_png, synthetic_image
+
+
+DEFAULT_MIX = "random=1,rotate=1,basic=2,advanced=2"
+
+# Form fields sent with each route
+ROUTE_FIELDS = {
+    "random": ("/augment/random", {}),
+    "rotate": ("/augment/rotate", {"num_images": "8"}),
+    "basic": ("/augment/basic", {"operation": "rotate", "angle": "45"}),
+    "advanced": ("/augment/advanced", {
+        "brightness": "1.3",
+        "contrast": "1.1",
+        "saturation": "0.8",
+    }),
+}
+
+
+def parse_mix(text):
+    """
+    Parse ``route=weight,...`` into a dict of positive weights.
+    """
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ROUTE_FIELDS:
+            raise ValueError(f"Unknown route in mix: {name}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("Mix needs at least one positive weight")
+    return mix
+
+
+def encode_multipart(fields, file_field, filename, payload):
+    """
+    Build a multipart/form-data body; returns (body, content_type).
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n".encode()
+        )
+    parts.append(
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{file_field}"; '
+        f'filename="{filename}"\r\n'
+        "Content-Type: image/png\r\n\r\n".encode()
+    )
+    parts.append(payload)
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = int(round(fraction * len(ordered)))
+    return ordered[min(len(ordered) - 1, max(0, rank - 1))]
+
+
+class LoadTest:
+    """Closed-loop load generator with one keep-alive connection per worker."""
+
+    def __init__(self, base_url, token, mix, payload, concurrency,
+                 duration=None, total_requests=None, timeout=120):
+        self.base_url = urlsplit(base_url)
+        if self.base_url.scheme not in ("http", "https"):
+            raise ValueError("Target must start with http:// or https://")
+        self._connection_class = (
+            http.client.HTTPSConnection if self.base_url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total_requests = total_requests
+        self.timeout = timeout
+        self.bodies = {
+            name: encode_multipart(fields, "image", "loadtest.png", payload)
+            for name, (_, fields) in ROUTE_FIELDS.items()
+            if name in mix
+        }
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._deadline = None
+
+    def _connection(self):
+        return self._connection_class(
+            self.base_url.hostname, self.base_url.port, timeout=self.timeout
+        )
+
+    def _next_route(self, rng):
+        """
+        Pick the next route, or None once the run is over.
+        """
+        with self._lock:
+            if self.total_requests is not None:
+                if self._issued >= self.total_requests:
+                    return None
+            elif time.perf_counter() >= self._deadline:
+                return None
+            self._issued += 1
+        names = list(self.mix)
+        return rng.choices(names, weights=[self.mix[n] for n in names])[0]
+
+    def _worker(self, seed):
+        rng = random.Random(seed)
+        connection = self._connection()
+        while True:
+            name = self._next_route(rng)
+            if name is None:
+                break
+            path = ROUTE_FIELDS[name][0]
+            body, content_type = self.bodies[name]
+            headers = dict(self.headers, **{"Content-Type": content_type})
+
+            start = time.perf_counter()
+            try:
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+                received = len(response.read())
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = self._connection()
+                received, status = 0, "conn_error"
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.latencies[name].append(elapsed)
+                self.statuses[name][status] += 1
+                self.bytes_received += received
+        connection.close()
+
+    def run(self):
+        """
+        Run the load test and return a summary dict.
+        """
+        self._deadline = time.perf_counter() + (self.duration or 0)
+        workers = [
+            threading.Thread(target=self._worker, args=(seed,))
+            for seed in range(self.concurrency)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        return self.summary(elapsed)
+
+    def summary(self, elapsed):
+        """
+        Aggregate throughput and latency percentiles per route.
+        """
+        routes = {}
+        all_latencies = []
+        for name, samples in sorted(self.latencies.items()):
+            all_latencies.extend(samples)
+            routes[name] = self._describe(samples, elapsed)
+            routes[name]["statuses"] = {
+                str(code): count for code, count in self.statuses[name].items()
+            }
+        overall = self._describe(all_latencies, elapsed)
+        errors = sum(
+            count
+            for statuses in self.statuses.values()
+            for code, count in statuses.items()
+            if code == "conn_error" or code >= 400
+        )
+        overall.update({
+            "elapsed_seconds": elapsed,
+            "concurrency": self.concurrency,
+            "errors": errors,
+            "bytes_received": self.bytes_received,
+        })
+        return {"overall": overall, "routes": routes}
+
+    @staticmethod
+    def _describe(samples, elapsed):
+        def ms(value):
+            return None if value is None else value * 1000
+
+        return {
+            "requests": len(samples),
+            "throughput_rps": len(samples) / elapsed if elapsed else None,
+            "p50_ms": ms(_percentile(samples, 0.50)),
+            "p90_ms": ms(_percentile(samples, 0.90)),
+            "p99_ms": ms(_percentile(samples, 0.99)),
+            "max_ms": ms(max(samples) if samples else None),
+        }
+
+
+def print_report(report):
+    """
+    Print a summary table of a load-test report.
+    """
+    print(
+        f"{'route':<10}{'requests':>10}{'rps':>10}"
+        f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    )
+    rows = list(report["routes"].items()) + [("TOTAL", report["overall"])]
+    for name, stats in rows:
+        print(
+            f"{name:<10}{stats['requests']:>10}"
+            f"{stats['throughput_rps'] or 0:>10.2f}"
+            f"{stats['p50_ms'] or 0:>10.1f}{stats['p90_ms'] or 0:>10.1f}"
+            f"{stats['p99_ms'] or 0:>10.1f}{stats['max_ms'] or 0:>10.1f}"
+        )
+    overall = report["overall"]
+    print(
+        f"elapsed {overall['elapsed_seconds']:.1f}s, "
+        f"concurrency {overall['concurrency']}, errors {overall['errors']}"
+    )
+    for name, stats in report["routes"].items():
+        print(f"  {name}: statuses {stats['statuses']}")
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int,
+                        help="stop after this many requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="weighted routes, e.g. basic=2,random=1")
+    parser.add_argument("--megapixels", type=float, default=0.3,
+                        help="size of the synthetic upload")
+    parser.add_argument("--mode", default="RGB",
+                        help="mode of the synthetic upload")
+    parser.add_argument("--target",
+                        help="base URL of a running server to load instead")
+    parser.add_argument("--token", help="JWT to use with --target")
+    parser.add_argument("--caches", action="store_true",
+                        help="keep the in-process app's result, stage "
+                             "and coalescing caches on")
+    parser.add_argument("--output", help="write the JSON report here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    args = _parse_args(argv)
+    mix = parse_mix(args.mix)
+    payload = encode_png(synthetic_image(args.megapixels, args.mode)).read()
+    print(f"Upload size: {len(payload) / 1024:.0f} KiB")
+
+    server = None
+    if args.target:
+        if not args.token:
+            print("--token is required with --target", file=sys.stderr)
+            return 2
+        base_url, token = args.target, args.token
+    else:
+        # pylint: disable=import-outside-toplevel
+        from loadtest.harness import LiveServer, build_app, mint_token
+
+        app, _ = build_app(caches=args.caches)
+        token = mint_token(app)
+        server = LiveServer(app).start()
+        base_url = server.url
+
+    try:
+        test = LoadTest(
+            base_url, token, mix, payload, args.concurrency,
+            duration=args.duration, total_requests=args.requests,
+        )
+        report = test.run()
+    finally:
+        if server is not None:
+            server.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""In-memory stand-ins for the MongoDB client used by the app.
+
+Only the parts of the pymongo API that the routes and jobs use are
+implemented: inserts, ``find``/``find_one`` with simple query operators,
+updates with ``$set``/``$unset``, bulk deletes and counting. Collections
+are thread-safe so they can back a multi-threaded server under load.
+"""
+import copy
+import itertools
+import threading
+from types import SimpleNamespace
+
+
+_OPERATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$exists": lambda value, arg: (value is not None) == bool(arg),
+}
+
+
+def _matches(document, query):
+    """
+    Check whether a document satisfies a (flat) MongoDB-style query.
+    """
+    for field, condition in (query or {}).items():
+        value = document.get(field)
+        if isinstance(condition, dict) and condition and all(
+            key.startswith("$") for key in condition
+        ):
+            for operator, argument in condition.items():
+                if operator not in _OPERATORS:
+                    raise NotImplementedError(
+                        f"Unsupported query operator: {operator}"
+                    )
+                if not _OPERATORS[operator](value, argument):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class InMemoryCursor:
+    """Minimal cursor supporting ``sort``, ``limit`` and iteration."""
+
+    def __init__(self, documents):
+        self._documents = documents
+
+    def sort(self, key, direction=1):
+        """
+        Sort by one field (or a list of ``(field, direction)`` pairs).
+        """
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, field_direction in reversed(keys):
+            self._documents.sort(
+                key=lambda doc, name=field: (doc.get(name) is None,
+                                             doc.get(name)),
+                reverse=field_direction < 0,
+            )
+        return self
+
+    def limit(self, count):
+        """
+        Keep at most ``count`` documents (0 means no limit).
+        """
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self._documents)
+
+
+class InMemoryCollection:
+    """Thread-safe list-backed collection."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name):
+        self.name = name
+        self._documents = []
+        self._lock = threading.Lock()
+
+    def insert_one(self, document):
+        """
+        Store a copy of ``document``, assigning an ``_id`` if missing.
+        """
+        with self._lock:
+            document.setdefault("_id", next(self._ids))
+            self._documents.append(copy.deepcopy(document))
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        """
+        Store copies of several documents.
+        """
+        # pylint: disable=unused-argument
+        inserted = [self.insert_one(doc).inserted_id for doc in documents]
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def find(self, query=None, projection=None):
+        """
+        Return a cursor over copies of the matching documents.
+        """
+        with self._lock:
+            matches = [
+                copy.deepcopy(doc) for doc in self._documents
+                if _matches(doc, query)
+            ]
+        if projection:
+            keep = {key for key, flag in projection.items() if flag}
+            if keep:
+                keep.add("_id")
+                matches = [
+                    {k: v for k, v in doc.items() if k in keep}
+                    for doc in matches
+                ]
+        return InMemoryCursor(matches)
+
+    def find_one(self, query=None):
+        """
+        Return a copy of the first matching document, or None.
+        """
+        for document in self.find(query):
+            return document
+        return None
+
+    def update_one(self, query, update):
+        """
+        Apply ``$set``/``$unset`` to the first matching document.
+        """
+        with self._lock:
+            for document in self._documents:
+                if _matches(document, query):
+                    document.update(update.get("$set", {}))
+                    for field in update.get("$unset", {}):
+                        document.pop(field, None)
+                    return SimpleNamespace(matched_count=1, modified_count=1)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    def delete_many(self, query):
+        """
+        Remove every matching document.
+        """
+        with self._lock:
+            kept = [doc for doc in self._documents if not _matches(doc, query)]
+            deleted = len(self._documents) - len(kept)
+            self._documents = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def count_documents(self, query):
+        """
+        Count matching documents.
+        """
+        with self._lock:
+            return sum(1 for doc in self._documents if _matches(doc, query))
+
+
+class InMemoryDatabase:
+    """Lazily creates collections on first access."""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = InMemoryCollection(name)
+            return self._collections[name]
+
+
+class _Admin:
+    """Answers the connectivity ``ping`` issued by ``init_db``."""
+
+    def command(self, name):
+        """
+        Accept ``ping`` like a healthy server.
+        """
+        if name != "ping":
+            raise NotImplementedError(f"Unsupported admin command: {name}")
+        return {"ok": 1.0}
+
+
+class InMemoryMongoClient:
+    """Drop-in for ``pymongo.MongoClient`` backed by process memory."""
+
+    def __init__(self):
+        self.admin = _Admin()
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase()
+        return self._databases[name]
+
+    def close(self):
+        """
+        Nothing to release; present for API compatibility.
+        """
@@ -0,0 +1,457 @@
+"""Archival of old request logs from MongoDB to local files.
+
+Every augmentation route appends to the ``logs`` collection, which would
+otherwise grow without bound next to the user documents that auth
+lookups need. :func:`archive_logs` moves entries older than a cut-off, a
+batch at a time, into day-partitioned files under ``LOG_ARCHIVE_DIR``::
+
+    day=2026-01-31/part-<digest>.parquet      (or .jsonl.gz)
+    day=2026-01-31/part-<digest>.stats.json
+
+and only then deletes them from MongoDB with one bulk delete per batch.
+Files are Parquet (zstd) when :mod:`pyarrow` is installed and gzip JSON
+lines otherwise. A file is named after the ids it holds, so a run
+interrupted between writing and deleting rewrites the same file rather
+than duplicating entries.
+
+:func:`query_logs` reads the archives back. Day partitions outside the
+requested dates are never listed, the per-file stats skip files without
+the requested user or dates, and Parquet files are read with the filters
+pushed down to their row groups (rows are sorted by user within a file).
+
+Usage (from ``augment_backend``)::
+
+    python log_archive.py archive --older-than-days 30
+    python log_archive.py query --start 2026-01-01 --user a@example.com
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+
+from pymongo import MongoClient
+
+from config import Config
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; archives fall back to JSONL
+    pa = pq = None
+
+try:
+    import fcntl
+except ImportError:  # No cross-process run lock on Windows
+    fcntl = None
+
+
+# Columns of an archived entry; other fields of a log document are kept
+# as a JSON object in ``details``
+COLUMNS = ("log_id", "timestamp", "user_email", "action", "filename",
+           "details")
+
+FORMATS = {"parquet": ".parquet", "jsonl": ".jsonl.gz"}
+
+# Rows per Parquet row group, the unit that filters can skip
+ROW_GROUP_ROWS = 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _utc(timestamp):
+    """
+    Naive UTC datetime, as MongoDB returns them.
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc)
+    return timestamp.replace(tzinfo=None)
+
+
+def _row(document):
+    """
+    Flatten a log document into the archive columns.
+    """
+    details = {
+        key: value for key, value in document.items()
+        if key not in COLUMNS and key != "_id"
+    }
+    return {
+        "log_id": str(document["_id"]),
+        "timestamp": _utc(document["timestamp"]),
+        "user_email": document.get("user_email"),
+        "action": document.get("action"),
+        "filename": document.get("filename"),
+        "details": (
+            json.dumps(details, sort_keys=True, default=str)
+            if details else None
+        ),
+    }
+
+
+def _document(row):
+    """
+    Rebuild a log entry from an archived row.
+    """
+    entry = json.loads(row["details"]) if row.get("details") else {}
+    entry.update(
+        (name, row[name]) for name in COLUMNS if name != "details"
+    )
+    return entry
+
+
+def resolve_format(name):
+    """Return the archive format to write.
+
+    ``auto`` picks Parquet when pyarrow is installed and gzip JSON lines
+    otherwise.
+
+    Raises:
+        ValueError: If the format is unknown, or Parquet is requested
+            without pyarrow.
+    """
+    if name == "auto":
+        return "parquet" if pq is not None else "jsonl"
+    if name not in FORMATS:
+        raise ValueError(
+            f"Archive format must be auto, {', '.join(FORMATS)}"
+        )
+    if name == "parquet" and pq is None:
+        raise ValueError("Parquet archives need pyarrow installed")
+    return name
+
+
+def _schema():
+    return pa.schema([
+        ("log_id", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("user_email", pa.string()),
+        ("action", pa.string()),
+        ("filename", pa.string()),
+        ("details", pa.string()),
+    ])
+
+
+def _write_rows(path, rows, archive_format):
+    """
+    Write rows to ``path`` through a temporary file renamed into place.
+    """
+    temp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        if archive_format == "parquet":
+            pq.write_table(
+                pa.Table.from_pylist(rows, schema=_schema()), temp,
+                compression="zstd", row_group_size=ROW_GROUP_ROWS,
+            )
+        else:
+            with gzip.open(temp, "wt", encoding="utf-8") as handle:
+                for row in rows:
+                    row = dict(row, timestamp=row["timestamp"].isoformat())
+                    handle.write(json.dumps(row) + "\n")
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _write_partition(directory, day, rows, archive_format):
+    """
+    Write one day's rows of a batch and their stats sidecar.
+    """
+    rows.sort(key=lambda row: (row["user_email"] or "", row["timestamp"]))
+    digest = hashlib.sha256(
+        "\n".join(row["log_id"] for row in rows).encode()
+    ).hexdigest()[:16]
+    partition = os.path.join(directory, f"day={day.isoformat()}")
+    os.makedirs(partition, exist_ok=True)
+    base = os.path.join(partition, f"part-{digest}")
+
+    stats = {
+        "rows": len(rows),
+        "min_timestamp": min(row["timestamp"] for row in rows).isoformat(),
+        "max_timestamp": max(row["timestamp"] for row in rows).isoformat(),
+        "users": sorted({row["user_email"] or "" for row in rows}),
+    }
+    with open(f"{base}.stats.json.tmp", "w", encoding="utf-8") as handle:
+        json.dump(stats, handle)
+    os.replace(f"{base}.stats.json.tmp", f"{base}.stats.json")
+    _write_rows(base + FORMATS[archive_format], rows, archive_format)
+
+
+def archive_logs(collection, directory, older_than, batch_size=5000,
+                 archive_format="auto", now=None):
+    """Move log entries older than ``older_than`` into archive files.
+
+    Entries are read oldest first, ``batch_size`` at a time, so a batch
+    spans few days (an index on ``timestamp`` serves the query). Each
+    batch is written (one file per day it covers) before it is deleted,
+    so a failure can only leave entries both archived and in MongoDB,
+    and the next run then rewrites the same files. Only one run at a
+    time works on a directory; a concurrent call returns at once.
+
+    Returns:
+        dict: Counts of ``archived`` entries, ``files`` and ``batches``.
+    """
+    archive_format = resolve_format(archive_format)
+    now = now or datetime.datetime.utcnow()
+    cutoff = _utc(now) - older_than
+    summary = {"archived": 0, "files": 0, "batches": 0}
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w",
+              encoding="utf-8") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Log archival already running in %s", directory)
+                return summary
+
+        while True:
+            documents = list(
+                collection.find({"timestamp": {"$lt": cutoff}})
+                .sort([("timestamp", 1), ("_id", 1)])
+                .limit(batch_size)
+            )
+            if not documents:
+                break
+
+            days = {}
+            for document in documents:
+                row = _row(document)
+                days.setdefault(row["timestamp"].date(), []).append(row)
+            for day, rows in sorted(days.items()):
+                _write_partition(directory, day, rows, archive_format)
+
+            collection.delete_many(
+                {"_id": {"$in": [document["_id"] for document in documents]}}
+            )
+            summary["archived"] += len(documents)
+            summary["files"] += len(days)
+            summary["batches"] += 1
+            if len(documents) < batch_size:
+                break
+
+    if summary["archived"]:
+        logger.info(
+            "Archived %d log entries into %d files",
+            summary["archived"], summary["files"],
+        )
+    return summary
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return _utc(value)
+    return datetime.datetime.combine(value, datetime.time())
+
+
+def _archive_files(directory, start, end, user_email):
+    """
+    Yield the data files that may hold matching entries.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("day="):
+            continue
+        day = datetime.date.fromisoformat(name[len("day="):])
+        if start is not None and day < start.date():
+            continue
+        if end is not None and _as_datetime(day) >= end:
+            continue
+
+        partition = os.path.join(directory, name)
+        for filename in sorted(os.listdir(partition)):
+            if not filename.endswith(tuple(FORMATS.values())):
+                continue
+            path = os.path.join(partition, filename)
+            base = path[:-len(FORMATS[_format_of(filename)])]
+            try:
+                with open(f"{base}.stats.json", encoding="utf-8") as handle:
+                    stats = json.load(handle)
+            except (OSError, ValueError):
+                stats = None
+            if stats is not None and not _may_match(
+                stats, start, end, user_email
+            ):
+                continue
+            yield path
+
+
+def _format_of(filename):
+    for name, extension in FORMATS.items():
+        if filename.endswith(extension):
+            return name
+    raise ValueError(f"Not an archive file: {filename}")
+
+
+def _may_match(stats, start, end, user_email):
+    """
+    Check a file's stats against the query before reading it.
+    """
+    if user_email is not None and user_email not in stats["users"]:
+        return False
+    low = datetime.datetime.fromisoformat(stats["min_timestamp"])
+    high = datetime.datetime.fromisoformat(stats["max_timestamp"])
+    if start is not None and high < start:
+        return False
+    return end is None or low < end
+
+
+def _read_rows(path, start, end, user_email, action):
+    """
+    Yield the rows of one file that match the query.
+    """
+    if _format_of(path) == "parquet":
+        if pq is None:
+            raise RuntimeError(f"Reading {path} needs pyarrow installed")
+        filters = []
+        if start is not None:
+            filters.append(("timestamp", ">=", start))
+        if end is not None:
+            filters.append(("timestamp", "<", end))
+        if user_email is not None:
+            filters.append(("user_email", "==", user_email))
+        if action is not None:
+            filters.append(("action", "==", action))
+        yield from pq.read_table(path, filters=filters or None).to_pylist()
+        return
+
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            row = json.loads(line)
+            row["timestamp"] = datetime.datetime.fromisoformat(
+                row["timestamp"]
+            )
+            if start is not None and row["timestamp"] < start:
+                continue
+            if end is not None and row["timestamp"] >= end:
+                continue
+            if user_email is not None and row["user_email"] != user_email:
+                continue
+            if action is not None and row["action"] != action:
+                continue
+            yield row
+
+
+def query_logs(directory, start=None, end=None, user_email=None,
+               action=None):
+    """Yield archived log entries, day by day.
+
+    ``start`` (inclusive) and ``end`` (exclusive) are dates or naive UTC
+    datetimes; ``user_email`` and ``action`` match exactly. Entries come
+    back as they were logged, with ``log_id`` holding the original id.
+    """
+    start = _as_datetime(start) if start is not None else None
+    end = _as_datetime(end) if end is not None else None
+    for path in _archive_files(directory, start, end, user_email):
+        for row in _read_rows(path, start, end, user_email, action):
+            yield _document(row)
+
+
+def start_archiver(config, get_collection):
+    """Run :func:`archive_logs` every ``LOG_ARCHIVE_INTERVAL`` seconds.
+
+    Starts a daemon thread when the interval is set; ``get_collection``
+    returns the logs collection. Failed runs are logged and retried at
+    the next interval.
+
+    Returns:
+        threading.Event: Set it to stop the thread, or None when the
+        job is disabled.
+    """
+    interval = config["LOG_ARCHIVE_INTERVAL"]
+    if interval <= 0:
+        return None
+    # Fail at startup rather than in the background thread
+    resolve_format(config["LOG_ARCHIVE_FORMAT"])
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            try:
+                archive_logs(
+                    get_collection(),
+                    config["LOG_ARCHIVE_DIR"],
+                    datetime.timedelta(days=config["LOG_ARCHIVE_AFTER_DAYS"]),
+                    config["LOG_ARCHIVE_BATCH"],
+                    config["LOG_ARCHIVE_FORMAT"],
+                )
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                logger.exception("Log archival failed")
+            # pylint: enable=broad-exception-caught
+
+    threading.Thread(target=run, name="log-archiver", daemon=True).start()
+    return stopped
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python log_archive.py", description=__doc__.split("\n")[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser(
+        "archive", help="move old entries out of MongoDB"
+    )
+    archive.add_argument("--older-than-days", type=float)
+    archive.add_argument("--batch-size", type=int)
+    archive.add_argument("--format", choices=("auto",) + tuple(FORMATS))
+    archive.add_argument("--directory")
+
+    query = commands.add_parser(
+        "query", help="print archived entries as JSON lines"
+    )
+    query.add_argument("--start", type=datetime.datetime.fromisoformat)
+    query.add_argument("--end", type=datetime.datetime.fromisoformat)
+    query.add_argument("--user", dest="user_email")
+    query.add_argument("--action")
+    query.add_argument("--directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    """
+    args = _parse_args(argv)
+    directory = args.directory or Config.LOG_ARCHIVE_DIR
+
+    if args.command == "query":
+        for entry in query_logs(
+            directory, args.start, args.end, args.user_email, args.action
+        ):
+            print(json.dumps(entry, default=str))
+        return 0
+
+    days = args.older_than_days
+    if days is None:
+        days = Config.LOG_ARCHIVE_AFTER_DAYS
+    client = MongoClient(Config.MONGO_URI, serverSelectionTimeoutMS=5000)
+    try:
+        summary = archive_logs(
+            client["users"]["logs"],
+            directory,
+            datetime.timedelta(days=days),
+            args.batch_size or Config.LOG_ARCHIVE_BATCH,
+            args.format or Config.LOG_ARCHIVE_FORMAT,
+        )
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    finally:
+        client.close()
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
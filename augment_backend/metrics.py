@@ -0,0 +1,356 @@
+"""Request instrumentation and Prometheus text exposition.
+
+Metrics are kept in process memory and rendered on demand by the
+``/metrics`` route. Each augmentation route is wrapped with
+:func:`instrumented`, and the handlers mark their decode, augment, encode
+and log phases with :func:`stage` so the time spent in each one can be
+told apart.
+"""
+import bisect
+import functools
+import io
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from werkzeug.wsgi import ClosingIterator
+
+
+# Latency buckets in seconds, tuned for image work (5ms .. 30s)
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# Megapixel buckets covering thumbnails up to large scans
+MEGAPIXEL_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 12.0, 25.0, 50.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """
+    Render a label set as ``{name="value",...}``.
+    """
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    rendered = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in pairs
+    )
+    return "{" + rendered + "}"
+
+
+def _format_value(value):
+    """
+    Format a sample value the way Prometheus expects it.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        """
+        Increase the counter for the given label values.
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self):
+        """
+        Return exposition lines for this counter.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative bucket histogram, optionally split by labels."""
+
+    def __init__(self, name, documentation, label_names=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Record one observation for the given label values.
+        """
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+                self._series[key] = series
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def collect(self):
+        """
+        Return exposition lines for this histogram.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            items = sorted(
+                (key, dict(series, counts=list(series["counts"])))
+                for key, series in self._series.items()
+            )
+        for key, series in items:
+            cumulative = 0
+            bounds = list(self.buckets) + [float("inf")]
+            for bound, count in zip(bounds, series["counts"]):
+                cumulative += count
+                labels = _format_labels(
+                    self.label_names, key, [("le", _format_value(bound))]
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(
+                f"{self.name}_sum{labels} {_format_value(series['sum'])}"
+            )
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on ``/metrics``."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Add a metric to the registry and return it.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render every registered metric in text exposition format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "augment_request_duration_seconds",
+    "Total handler time per augmentation route.",
+    ("route",),
+))
+STAGE_LATENCY = registry.register(Histogram(
+    "augment_stage_duration_seconds",
+    "Time spent in each processing stage per augmentation route.",
+    ("route", "stage"),
+))
+REQUESTS = registry.register(Counter(
+    "augment_requests_total",
+    "Augmentation requests handled, by route and HTTP status.",
+    ("route", "status"),
+))
+ERRORS = registry.register(Counter(
+    "augment_errors_total",
+    "Augmentation requests that ended in an error status.",
+    ("route", "status"),
+))
+BYTES_IN = registry.register(Counter(
+    "augment_bytes_in_total",
+    "Request body bytes received per augmentation route.",
+    ("route",),
+))
+BYTES_OUT = registry.register(Counter(
+    "augment_bytes_out_total",
+    "Response body bytes produced per augmentation route.",
+    ("route",),
+))
+MEGAPIXELS = registry.register(Counter(
+    "augment_megapixels_total",
+    "Source image megapixels processed per augmentation route.",
+    ("route",),
+))
+COALESCED = registry.register(Counter(
+    "augment_coalesced_total",
+    "Requests served by waiting on an identical in-flight request.",
+    ("route",),
+))
+IMAGE_MEGAPIXELS = registry.register(Histogram(
+    "augment_image_megapixels",
+    "Distribution of source image sizes per augmentation route.",
+    ("route",),
+    buckets=MEGAPIXEL_BUCKETS,
+))
+
+
+def _current_route():
+    """
+    Return the route label of the request being instrumented, if any.
+    """
+    if not has_app_context():
+        return None
+    return getattr(g, "metrics_route", None)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block of handler code as one named stage of the current route.
+    """
+    route = _current_route()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if route is not None:
+            STAGE_LATENCY.observe(
+                time.perf_counter() - start, route=route, stage=name
+            )
+
+
+def record_image(image):
+    """
+    Record the megapixels of a decoded (or header-parsed) source image.
+    """
+    route = _current_route()
+    if route is None:
+        return
+    width, height = image.size
+    megapixels = (width * height) / 1_000_000
+    MEGAPIXELS.inc(megapixels, route=route)
+    IMAGE_MEGAPIXELS.observe(megapixels, route=route)
+
+
+def record_bytes_out(buffer):
+    """
+    Record the size of a response buffer or temporary file.
+    """
+    route = _current_route()
+    if route is None:
+        return
+    if hasattr(buffer, "getbuffer"):
+        size = buffer.getbuffer().nbytes
+    else:
+        position = buffer.tell()
+        size = buffer.seek(0, io.SEEK_END)
+        buffer.seek(position)
+    BYTES_OUT.inc(size, route=route)
+
+
+def record_coalesced():
+    """
+    Record a request answered by an identical in-flight request.
+    """
+    route = _current_route()
+    if route is not None:
+        COALESCED.inc(1, route=route)
+
+
+def instrumented(route):
+    """
+    Decorator recording latency, status and streaming time for a route.
+
+    The wrapped view may return a response object or a ``(body, status)``
+    tuple, as the augmentation handlers do. Applied above
+    ``jwt_required``, so rejected tokens are counted too: exceptions are
+    passed to the app's error handlers here, as Flask would, and the
+    status they produce is recorded.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.metrics_route = route
+            BYTES_IN.inc(request.content_length or 0, route=route)
+            start = time.perf_counter()
+            try:
+                try:
+                    result = view(*args, **kwargs)
+                # pylint: disable=broad-exception-caught
+                except Exception as error:
+                    result = current_app.handle_user_exception(error)
+                # pylint: enable=broad-exception-caught
+            except Exception:
+                REQUESTS.inc(route=route, status=500)
+                ERRORS.inc(route=route, status=500)
+                raise
+            finally:
+                REQUEST_LATENCY.observe(
+                    time.perf_counter() - start, route=route
+                )
+
+            if isinstance(result, tuple):
+                status = result[1] if len(result) > 1 else 200
+                response = result[0]
+            else:
+                response = result
+                # Unhandled HTTP exceptions carry ``code`` instead
+                status = getattr(
+                    result, "status_code", getattr(result, "code", 200)
+                )
+
+            REQUESTS.inc(route=route, status=status)
+            if int(status) >= 400:
+                ERRORS.inc(route=route, status=status)
+
+            # Time from handler return until the body is fully sent
+            if hasattr(response, "call_on_close"):
+                stream_start = time.perf_counter()
+
+                def on_close():
+                    STAGE_LATENCY.observe(
+                        time.perf_counter() - stream_start,
+                        route=route,
+                        stage="stream",
+                    )
+
+                # send_file responses bypass close hooks, so wrap the body
+                if response.direct_passthrough:
+                    response.response = ClosingIterator(
+                        response.response, on_close
+                    )
+                else:
+                    response.call_on_close(on_close)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,379 @@
+"""Opt-in profiling of augmentation controller calls.
+
+A request is profiled when it is picked by ``PROFILE_SAMPLE_RATE`` or, if
+``PROFILE_ALLOW_HEADER`` is enabled, when it carries an ``X-Profile: 1``
+header. Route handlers run their controller calls through
+:func:`profile_call` (or :func:`profile_iter` for results streamed after
+the view returns); for requests that are not profiled these are plain
+calls. Profiles are written to ``PROFILE_DIR`` together with the
+operation parameters and image dimensions they were captured with.
+
+Only one cProfile session runs at a time (Python 3.12+ allows a single
+active profiler per process); requests sampled while one is active are
+profiled with the stack sampler instead. Work a controller hands to a
+process or thread pool is invisible to both, so such calls are marked
+``offloaded`` in the metadata.
+"""
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import get_jwt_identity
+from PIL import Image
+
+
+PROFILE_HEADER = "X-Profile"
+
+logger = logging.getLogger(__name__)
+
+# Held by the request whose session uses cProfile
+_cprofile_lock = threading.Lock()
+
+
+class _StackSampler:
+    """Collect collapsed call stacks of one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._active = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._active.wait()
+            if self._stopped.is_set():
+                break
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(
+                        f"{code.co_name} "
+                        f"({os.path.basename(code.co_filename)}:"
+                        f"{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+            time.sleep(self.interval)
+
+    def enable(self):
+        """
+        Start sampling the target thread.
+        """
+        self._active.set()
+
+    def disable(self):
+        """
+        Pause sampling until the next enable.
+        """
+        self._active.clear()
+
+    def stop(self):
+        """
+        Stop the sampling thread for good.
+        """
+        self._stopped.set()
+        self._active.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """
+        Write stacks in collapsed format, ready for flame graph tools.
+        """
+        with open(path, "w", encoding="utf-8") as handle:
+            for stack, count in self.stacks.most_common():
+                handle.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    """Profiler state and captured metadata for one request."""
+
+    def __init__(self, route, mode, interval):
+        self.profile_id = uuid.uuid4().hex
+        self.route = route
+        self.calls = []
+        self.annotations = {}
+        self.started = time.perf_counter()
+        self._offloaded = None
+        if mode != "sampling" and not _cprofile_lock.acquire(blocking=False):
+            # Another request is being profiled with cProfile
+            mode = "sampling"
+            self.annotations["requested_mode"] = "cprofile"
+        self.mode = mode
+        if mode == "sampling":
+            self.profiler = _StackSampler(threading.get_ident(), interval)
+        else:
+            self.profiler = cProfile.Profile()
+
+    def close(self):
+        """
+        Release the profiler; the session is not used afterwards.
+        """
+        if self.mode == "sampling":
+            self.profiler.stop()
+        else:
+            _cprofile_lock.release()
+
+    def note_offloaded(self, pool):
+        """
+        Mark the running (or next) call as handing its work to ``pool``.
+        """
+        self._offloaded = pool
+
+    def _record(self, func, args, kwargs, start):
+        call = {
+            "function": func.__name__,
+            "args": [_describe(arg) for arg in args],
+            "kwargs": {
+                key: _describe(value) for key, value in kwargs.items()
+            },
+            "duration_seconds": time.perf_counter() - start,
+        }
+        if self._offloaded is not None:
+            call["offloaded"] = self._offloaded
+            self._offloaded = None
+        self.calls.append(call)
+
+    def run(self, func, args, kwargs):
+        """
+        Call ``func`` with the profiler enabled and record its arguments.
+        """
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+            self._record(func, args, kwargs, start)
+
+    def iterate(self, func, args, kwargs):
+        """
+        Iterate over ``func(*args, **kwargs)`` with the profiler enabled
+        while each item is produced, recording the call once.
+        """
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            iterator = iter(func(*args, **kwargs))
+        finally:
+            self.profiler.disable()
+        try:
+            while True:
+                self.profiler.enable()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.profiler.disable()
+                yield item
+        finally:
+            self._record(func, args, kwargs, start)
+
+    def save(self, directory, user_email=None):
+        """
+        Write the profile and its metadata to ``directory``.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == "sampling":
+            profile_name = f"{self.profile_id}.collapsed.txt"
+            self.profiler.dump(os.path.join(directory, profile_name))
+        else:
+            profile_name = f"{self.profile_id}.prof"
+            self.profiler.create_stats()
+            with open(os.path.join(directory, profile_name), "wb") as handle:
+                marshal.dump(self.profiler.stats, handle)
+
+        metadata = {
+            "profile_id": self.profile_id,
+            "route": self.route,
+            "mode": self.mode,
+            "profile_file": profile_name,
+            "user_email": user_email,
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "duration_seconds": time.perf_counter() - self.started,
+            "calls": self.calls,
+            **self.annotations,
+        }
+        meta_path = os.path.join(directory, f"{self.profile_id}.json")
+        with open(meta_path, "w", encoding="utf-8") as handle:
+            json.dump(metadata, handle, indent=2, default=str)
+        return metadata
+
+
+def _describe(value):
+    """
+    Turn a controller argument into something JSON serialisable.
+    """
+    if isinstance(value, Image.Image):
+        return {"image_size": list(value.size), "mode": value.mode}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_describe(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _describe(item) for key, item in value.items()}
+    filename = getattr(value, "filename", None)
+    if filename:
+        return {"file": filename}
+    return type(value).__name__
+
+
+def _should_profile(config):
+    """
+    Decide whether the current request is profiled.
+    """
+    if (
+        config.get("PROFILE_ALLOW_HEADER")
+        and request.headers.get(PROFILE_HEADER, "").lower()
+        in ("1", "true", "yes")
+    ):
+        return True
+    rate = config.get("PROFILE_SAMPLE_RATE", 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _current_session():
+    """
+    Return the profiling session of the current request, if any.
+    """
+    if not has_app_context():
+        return None
+    return g.get("profile_session")
+
+
+def profile_call(func, *args, **kwargs):
+    """
+    Call a controller function, under the profiler if the request is sampled.
+    """
+    session = _current_session()
+    if session is None:
+        return func(*args, **kwargs)
+    return session.run(func, args, kwargs)
+
+
+def profile_iter(func, *args, **kwargs):
+    """
+    Iterate over a controller generator, under the profiler while each
+    item is produced if the request is sampled.
+    """
+    session = _current_session()
+    if session is None:
+        return func(*args, **kwargs)
+    return session.iterate(func, args, kwargs)
+
+
+def note_offloaded(pool):
+    """
+    Mark the running (or next) profiled controller call as handing its
+    work to a ``pool`` ("process" or "thread"), which the profiler only
+    sees as time spent waiting.
+    """
+    session = _current_session()
+    if session is not None:
+        session.note_offloaded(pool)
+
+
+def annotate_profile(**fields):
+    """
+    Attach extra metadata (e.g. image dimensions) to the current profile.
+    """
+    session = _current_session()
+    if session is not None:
+        session.annotations.update(
+            {key: _describe(value) for key, value in fields.items()}
+        )
+
+
+def _prune(directory, max_stored):
+    """
+    Delete the oldest stored profiles beyond ``max_stored``.
+    """
+    metas = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in metas[:max(0, len(metas) - max_stored)]:
+        profile_id = entry.name[:-len(".json")]
+        for name in os.listdir(directory):
+            if name.startswith(profile_id):
+                os.remove(os.path.join(directory, name))
+
+
+def _store(session, config, user_email):
+    """
+    Save a finished session and prune old profiles; failures are logged.
+    """
+    directory = config["PROFILE_DIR"]
+    try:
+        session.close()
+        session.save(directory, user_email)
+        _prune(directory, config.get("PROFILE_MAX_STORED", 200))
+        logger.info(
+            "Stored profile %s for route %s",
+            session.profile_id, session.route
+        )
+    # pylint: disable=broad-exception-caught
+    except Exception as exc:
+        logger.error("Failed to store profile: %s", exc)
+    # pylint: enable=broad-exception-caught
+
+
+def profiled(route):
+    """
+    Decorator opening a profiling session for sampled requests.
+
+    Responses streamed from a generator (batch archives) do their work
+    after the view returns, so their session is stored once the body
+    has been sent.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if not _should_profile(config):
+                return view(*args, **kwargs)
+
+            session = ProfileSession(
+                route,
+                config.get("PROFILE_MODE", "cprofile"),
+                config.get("PROFILE_SAMPLE_INTERVAL", 0.005),
+            )
+            user_email = get_jwt_identity()
+            g.profile_session = session
+            deferred = False
+            try:
+                result = view(*args, **kwargs)
+                response = result[0] if isinstance(result, tuple) else result
+                if (
+                    getattr(response, "is_streamed", False)
+                    and not response.direct_passthrough
+                ):
+                    response.call_on_close(
+                        lambda: _store(session, config, user_email)
+                    )
+                    deferred = True
+                return result
+            finally:
+                if not deferred:
+                    g.profile_session = None
+                    _store(session, config, user_email)
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+"""Content-addressed augmentation results for HTTP caching.
+
+A deterministic result is identified by a hash of what produces it: the
+endpoint, the SHA-256 of the source bytes, the normalized parameters, the
+Pillow version and the compute backend table (backends agree with Pillow
+only within tolerance). The same hash is the result's ETag, so clients
+can revalidate with ``If-None-Match`` and the server can answer before
+decoding anything.
+
+Large results (rotation sets and batch archives) are also kept in
+``RESULT_DIR`` under that id, up to ``RESULT_STORE_BYTES`` with the least
+recently used evicted first. They are served from disk with ``Range``
+support, so an interrupted download resumes instead of starting over and
+a repeated request is not recomputed. Knowing a result id requires the
+source image, so ids are not scoped to a user.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import PIL
+
+from controllers.backends import backend_table
+
+
+def result_etag(*parts):
+    """
+    Deterministic id of a result from JSON-serializable ``parts``, for
+    this process's Pillow version and compute backends.
+    """
+    payload = json.dumps(
+        [PIL.__version__, backend_table(), *parts],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class PendingResult:
+    """A result being written; visible in the store once committed."""
+
+    def __init__(self, store, result_id, mimetype, download_name):
+        self._store = store
+        self._result_id = result_id
+        self._meta = {
+            "result_id": result_id,
+            "mimetype": mimetype,
+            "download_name": download_name,
+        }
+        self._temp = os.path.join(
+            store.directory, f"{result_id}.{uuid.uuid4().hex}.tmp"
+        )
+        # pylint: disable=consider-using-with
+        self._handle = open(self._temp, "wb")
+        self.size = 0
+
+    def write(self, data):
+        """
+        Append a chunk of the result.
+        """
+        self._handle.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """
+        Publish the result and evict old ones over the store's budget.
+
+        Returns:
+            bool: False if the result alone exceeds the budget and was
+            dropped.
+        """
+        self._handle.close()
+        if self.size > self._store.max_bytes:
+            os.remove(self._temp)
+            return False
+        self._meta["size"] = self.size
+        self._meta["created"] = time.time()
+        self._store.save_meta(self._meta)
+        os.replace(self._temp, self._store.data_path(self._result_id))
+        self._store.evict()
+        return True
+
+    def discard(self):
+        """
+        Drop a result that was not completed.
+        """
+        self._handle.close()
+        if os.path.exists(self._temp):
+            os.remove(self._temp)
+
+
+class ResultStore:
+    """Stored results, one data file and one metadata file each."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the store configured for the running application.
+        """
+        return cls(config["RESULT_DIR"], config["RESULT_STORE_BYTES"])
+
+    @property
+    def enabled(self):
+        """
+        Whether results are stored at all.
+        """
+        return self.max_bytes > 0
+
+    def data_path(self, result_id):
+        """
+        Path of a result's data file.
+        """
+        return os.path.join(self.directory, f"{result_id}.bin")
+
+    def _meta_path(self, result_id):
+        return os.path.join(self.directory, f"{result_id}.json")
+
+    def save_meta(self, meta):
+        """
+        Write a result's metadata atomically.
+        """
+        path = self._meta_path(meta["result_id"])
+        with open(path + ".tmp", "w", encoding="utf-8") as handle:
+            json.dump(meta, handle)
+        os.replace(path + ".tmp", path)
+
+    def get(self, result_id):
+        """
+        Return a stored result's metadata, with its data file under
+        ``path``, or None if it is not stored.
+        """
+        if not self.enabled or not result_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(result_id), encoding="utf-8") as handle:
+                meta = json.load(handle)
+            path = self.data_path(result_id)
+            # Reads count as use for eviction
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        meta["path"] = path
+        return meta
+
+    def open(self, result_id, mimetype, download_name):
+        """
+        Start writing a result; returns a :class:`PendingResult`, or
+        None when storing is disabled.
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        return PendingResult(self, result_id, mimetype, download_name)
+
+    def put(self, result_id, data, mimetype, download_name):
+        """
+        Store a complete result held in memory.
+
+        Returns:
+            bool: Whether the result was stored.
+        """
+        pending = self.open(result_id, mimetype, download_name)
+        if pending is None:
+            return False
+        try:
+            pending.write(data)
+        except BaseException:
+            pending.discard()
+            raise
+        return pending.commit()
+
+    def evict(self):
+        """
+        Remove the least recently used results while the store holds
+        more than ``max_bytes``.
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".bin"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            result_id = name[:-len(".bin")]
+            paths = (self._meta_path(result_id), self.data_path(result_id))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
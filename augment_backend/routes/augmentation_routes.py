@@ -1,52 +1,398 @@
 """Image augmentation routes for various transformation operations."""
 import datetime
 import io
+import json
 import logging
 
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, current_app, g, jsonify, request, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from PIL import Image
 
-from controllers.adv_augmentation import _augment_image
-from controllers.basic_aug import _basic_rotate, _scale_image, _flip_image
-from controllers.image_rotator import _rotate_and_zip
-from controllers.random_generator import _generate_random_augmentation
+from controllers.adv_augmentation import MAX_BLUR_RADIUS, _augment_image
+from controllers.backends import backend_table
+from controllers.basic_aug import _check_quality
+from controllers.image_rotator import (
+    ANIMATION_FORMATS, DEFAULT_FRAME_DURATION, DEFAULT_FRAME_QUALITY,
+    _rotate_and_animate, _rotate_and_zip,
+)
+from controllers.offload import _get_frame_pool, _get_process_pool, _offload
+from controllers.pipeline import Pipeline
+from controllers.planner import _to_working_mode, _working_mode
+from controllers.policy import Policy
+from controllers.preview import _encode_preview, _get_proxy, _source_digest
+from controllers.random_generator import _apply_random_transformations
+from controllers.stage_cache import _get_stage_cache
+from controllers.tiled import (
+    _augment_tiled, _is_tileable, _steps_for_augment
+)
 from database import get_log_collection
-from utils import allowed_file, error_response, validate_image_size
+from coalescing import SingleFlight
+from metrics import (
+    instrumented, record_bytes_out, record_coalesced, record_image, stage
+)
+from profiling import (
+    annotate_profile, note_offloaded, profile_call, profiled
+)
+from results import ResultStore, result_etag
+from uploads import UploadStore
+from utils import (
+    allowed_file, cache_headers, error_response, not_modified,
+    validate_image_size,
+)
 
 
 augmentation_bp = Blueprint('augmentation', __name__)
 logger = logging.getLogger(__name__)
 
+# Identical requests computed concurrently in this process
+_single_flight = SingleFlight()
+
+
+@augmentation_bp.teardown_request
+def _close_stored_uploads(exc):
+    for image_file in g.pop("stored_uploads", []):
+        image_file.close()
+
+
+def _source_file():
+    """Return the image to augment and the size limit that applies to it.
+
+    The image is the multipart ``image`` file or, when an ``upload_id``
+    is sent (form field or JSON), a completed chunked upload read from
+    disk. The third item is an error response, or None.
+
+    Returns:
+        tuple: ``(image_file, max_size, error)``; ``image_file`` is None
+        when no image was sent.
+    """
+    upload_id = request.form.get("upload_id")
+    if upload_id is None:
+        upload_id = (request.get_json(silent=True) or {}).get("upload_id")
+    if upload_id is None:
+        return request.files.get("image"), None, None
+
+    store = UploadStore.from_config(current_app.config)
+    try:
+        image_file = store.open(str(upload_id), get_jwt_identity())
+    except LookupError as le:
+        return None, None, error_response(str(le), 404)
+    except ValueError as ve:
+        return None, None, error_response(str(ve), 400)
+    g.setdefault("stored_uploads", []).append(image_file)
+    return image_file, store.max_size, None
+
+
+def _preview_requested():
+    """
+    Check whether the client asked for a low-resolution preview render.
+    """
+    value = request.form.get("preview", request.args.get("preview"))
+    if value is None:
+        value = (request.get_json(silent=True) or {}).get("preview")
+    return str(value).lower() in ("1", "true", "on", "yes")
+
+
+def _resample_quality():
+    """Return the resampling quality tier for geometric operations.
+
+    Read from the ``quality`` form field, query parameter or JSON key
+    (``fast``, ``balanced`` or ``best``), defaulting to
+    ``RESAMPLE_QUALITY``.
+
+    Returns:
+        str: The tier, or None to keep each operation's own filter.
+
+    Raises:
+        ValueError: If the tier is unknown.
+    """
+    quality = request.form.get("quality", request.args.get("quality"))
+    if quality is None:
+        quality = (request.get_json(silent=True) or {}).get("quality")
+    if quality is None:
+        quality = current_app.config["RESAMPLE_QUALITY"]
+    return _check_quality(quality)
+
+
+def _random_policy():
+    """Return the augmentation policy a random request asks for.
+
+    Read as a JSON object from the ``policy`` form field, or from the
+    ``policy`` key of a JSON body (see :class:`controllers.policy.Policy`).
+
+    Returns:
+        Policy: The validated policy, or None for the built-in chain.
+
+    Raises:
+        ValueError: If the policy is not valid JSON or not a valid policy.
+    """
+    spec = request.form.get("policy")
+    if spec is not None:
+        try:
+            spec = json.loads(spec)
+        except json.JSONDecodeError:
+            raise ValueError("Policy must be valid JSON") from None
+    else:
+        spec = (request.get_json(silent=True) or {}).get("policy")
+    if spec is None:
+        return None
+    return Policy.from_spec(spec)
+
+
+def _preview_source(image_file):
+    """Return the cached downscaled proxy for a preview render.
+
+    The proxy is found by the uploaded image's digest or, when no image
+    is sent, by the ``preview_id`` returned from an earlier preview, so
+    slider moves need not upload the image again.
+
+    Returns:
+        tuple: ``(proxy, scale, preview_id)``, or None if the proxy for
+        ``preview_id`` is no longer cached.
+    """
+    preview_id = request.form.get("preview_id")
+    if preview_id is None:
+        preview_id = (request.get_json(silent=True) or {}).get("preview_id")
+    return _get_proxy(
+        image_file,
+        current_app.config["PREVIEW_LONG_EDGE"],
+        current_app.config["PREVIEW_CACHE_ENTRIES"],
+        preview_id,
+    )
+
+
+def _preview_response(image, preview_id):
+    """
+    Encode a preview render and send it inline with its preview id.
+    """
+    with stage("encode"):
+        img_buffer = _encode_preview(
+            image, current_app.config["PREVIEW_QUALITY"]
+        )
+    record_bytes_out(img_buffer)
+    response = send_file(img_buffer, mimetype="image/jpeg")
+    response.headers["X-Preview-Id"] = preview_id
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _rotation_output():
+    """Return the container and encoding settings of a rotation set.
+
+    ``format`` is ``zip`` (separate JPEGs, the default) or an animated
+    ``webp``, ``gif`` or ``apng``. Animations take ``frame_quality``
+    (lossy WebP quality, 1-100), ``frame_duration`` (milliseconds per
+    frame, 20-10000) and ``long_edge`` (frame size in pixels, 0 for full
+    resolution, default ``ROTATE_ANIMATION_LONG_EDGE``).
+
+    Returns:
+        dict: The validated settings; empty for ``zip``.
+
+    Raises:
+        ValueError: If a setting is unknown or out of range.
+    """
+    container = request.form.get("format", "zip").lower()
+    if container == "zip":
+        return {}
+    if container not in ANIMATION_FORMATS:
+        allowed = ", ".join(("zip",) + tuple(ANIMATION_FORMATS))
+        raise ValueError(f"format must be one of {allowed}")
+
+    settings = {"container": container}
+    limits = {
+        "frame_quality": (DEFAULT_FRAME_QUALITY, 1, 100),
+        "frame_duration": (DEFAULT_FRAME_DURATION, 20, 10000),
+        "long_edge": (
+            current_app.config["ROTATE_ANIMATION_LONG_EDGE"], 0, 16384
+        ),
+    }
+    for name, (default, low, high) in limits.items():
+        try:
+            value = int(request.form.get(name, default))
+        except ValueError:
+            raise ValueError(f"{name} must be an integer") from None
+        if not low <= value <= high:
+            raise ValueError(f"{name} must be between {low} and {high}")
+        settings[name] = value
+    return settings
+
+
+def _source_key(image_file):
+    """
+    SHA-256 of the source bytes, computed once per request.
+    """
+    digests = g.setdefault("source_digests", {})
+    if id(image_file) not in digests:
+        digests[id(image_file)] = _source_digest(image_file)
+    return digests[id(image_file)]
+
+
+def _result_etag(image_file, params):
+    """
+    ETag of this endpoint's result for the source and normalized
+    ``params`` (see :func:`results.result_etag`).
+    """
+    return result_etag(request.endpoint, _source_key(image_file), params)
+
+
+def _augment_in_pool(func, image, *args, **kwargs):
+    """Call an augmentation in the process pool, if one is configured.
+
+    With ``PROCESS_WORKERS`` set, the decoded ``image`` is handed to a
+    worker process through shared memory and the result comes back the
+    same way; otherwise ``func`` runs in this process. ``func`` must
+    work on the image's working mode, which is what is handed over:
+    frames hold 8-bit pixels without a palette, so palette, 1-bit and
+    16-bit sources are converted first.
+
+    Returns:
+        Whatever ``func`` returns.
+    """
+    config = current_app.config
+    if not config["PROCESS_WORKERS"]:
+        return func(image, *args, **kwargs)
+    image = _to_working_mode(image)
+    note_offloaded("process")
+    executor = _get_process_pool(
+        config["PROCESS_WORKERS"], config["SHARED_FRAME_BYTES"],
+        backend_table(),
+    )
+    frames = _get_frame_pool(config["SHARED_FRAME_BYTES"])
+    return _offload(executor, frames, func, image, *args, **kwargs)
+
+
+def _render_png(image, pipeline, image_file):
+    """Run ``pipeline`` on a header-parsed image and encode it as PNG.
+
+    The pipeline is first planned for the source's working mode, so
+    grayscale sources and results are processed in one channel. Resumes
+    from the longest prefix of the pipeline already cached for this
+    source, so re-renders that only change later steps skip the decode
+    and the unchanged (typically geometric) steps. Without a stage cache
+    the pipeline may run in the process pool (see
+    :func:`_augment_in_pool`).
+
+    Returns:
+        bytes: Encoded PNG.
+    """
+    pipeline = pipeline.planned(_working_mode(image))
+    max_bytes = current_app.config["STAGE_CACHE_BYTES"]
+    cache = source_key = None
+    start, result = 0, None
+    if max_bytes:
+        cache = _get_stage_cache(max_bytes)
+        source_key = _source_key(image_file)
+        start, result = cache.resume(source_key, pipeline.cacheable_steps)
+
+    if result is None:
+        with stage("decode"):
+            image.load()
+        result = image
+
+    with stage("augment"):
+        if cache is None:
+            result = profile_call(_augment_in_pool, pipeline.run, result)
+        else:
+            result = profile_call(
+                pipeline.run, result,
+                start=start, cache=cache, source_key=source_key,
+            )
+    annotate_profile(resumed_steps=start)
+
+    with stage("encode"):
+        img_buffer = io.BytesIO()
+        result.save(img_buffer, format="PNG")
+    return img_buffer.getvalue()
+
+
+def _coalesced(image_file, params, render):
+    """Render a response body once for identical concurrent requests.
+
+    Requests to the same endpoint with the same source bytes and the
+    same normalized ``params`` share one call to ``render`` while it is
+    running; later requests compute afresh. Only deterministic renders
+    may be coalesced.
+
+    Returns:
+        BytesIO: This request's own buffer over the rendered bytes.
+    """
+    if not current_app.config["COALESCE_REQUESTS"]:
+        return io.BytesIO(render())
+
+    key = _result_etag(image_file, params)
+    data, shared = _single_flight.do(key, render)
+    if shared:
+        record_coalesced()
+        annotate_profile(coalesced=True)
+    return io.BytesIO(data)
+
+
+def _use_tiled(image, steps):
+    """
+    Check whether a header-parsed image should be processed tile by tile.
+    """
+    width, height = image.size
+    threshold = current_app.config["TILE_THRESHOLD_MEGAPIXELS"]
+    return _is_tileable(steps) and width * height >= threshold * 1_000_000
+
+
+def _augment_upload_tiled(image_file, steps):
+    """
+    Run ``steps`` over an upload with the tiled engine.
+
+    Returns:
+        file: Temporary file holding the encoded PNG.
+    """
+    image_file.seek(0)
+    if current_app.config["TILE_WORKERS"] > 1:
+        note_offloaded("thread")
+    return profile_call(
+        _augment_tiled,
+        image_file,
+        steps,
+        tile_size=current_app.config["TILE_SIZE"],
+        workers=current_app.config["TILE_WORKERS"],
+        directory=current_app.config["TILE_DIR"],
+    )
 
 
 @augmentation_bp.route("/augment/random", methods=["POST"])
+@instrumented("random")
 @jwt_required()
+@profiled("random")
 def random_augmentation():
     """Apply random augmentations to an uploaded image.
     
     Receives an image file via POST request, applies random augmentations,
-    and returns the augmented image to the frontend.
+    and returns the augmented image to the frontend. An optional
+    ``policy`` (see :func:`_random_policy`) replaces the built-in chain
+    with a RandAugment, TrivialAugment or AutoAugment-style policy.
     
     Returns:
         Response: Augmented image file or error JSON.
     """
     # File validation
-    if "image" not in request.files:
+    image_file, max_size, error = _source_file()
+    if error is not None:
+        return error
+    if image_file is None:
         return jsonify({"error": "no image uploaded"}), 400
-        
-    image_file = request.files['image']
     
     # Empty file validation
     if not image_file or image_file.filename == "":
         return jsonify({"Error": "No image file is uploaded"}), 400
     
     # Size validation
-    is_valid, error_msg = validate_image_size(image_file)
+    is_valid, error_msg = validate_image_size(image_file, max_size)
     
     if not is_valid:
         return jsonify({"error": error_msg}), 400
     
+    try:
+        quality = _resample_quality()
+        policy = _random_policy()
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+
     user_email = get_jwt_identity()
     logs = get_log_collection()
 
@@ -56,44 +402,77 @@ def random_augmentation():
     )
 
     try:
-        img_buffer = _generate_random_augmentation(image_file)
-        
-        logs.insert_one({
-            "user_email": user_email,
-            "action": "RANDOM_AUGMENTATION",
-            "filename": image_file.filename,
-            "timestamp": datetime.datetime.utcnow()
-        })
-
-        return send_file(
+        with stage("decode"):
+            original_image = _to_working_mode(Image.open(image_file))
+            original_image.load()
+        record_image(original_image)
+
+        with stage("augment"):
+            if policy is None:
+                augmented_image = profile_call(
+                    _augment_in_pool, _apply_random_transformations,
+                    original_image, quality
+                )
+            else:
+                augmented_image, draws = profile_call(
+                    _augment_in_pool, policy.apply, original_image, quality
+                )
+
+        with stage("encode"):
+            img_buffer = io.BytesIO()
+            augmented_image.save(img_buffer, format='PNG')
+            img_buffer.seek(0)
+        record_bytes_out(img_buffer)
+
+        with stage("log"):
+            entry = {
+                "user_email": user_email,
+                "action": "RANDOM_AUGMENTATION",
+                "filename": image_file.filename,
+                "timestamp": datetime.datetime.utcnow()
+            }
+            if policy is not None:
+                entry["policy"] = policy.to_spec()
+                entry["operations"] = draws
+            logs.insert_one(entry)
+
+        response = send_file(
             img_buffer,
             mimetype='image/png',
             as_attachment=True,
             download_name='random_augmented_image.png'
         )
+        response.headers["Cache-Control"] = "no-store"
+        return response
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @augmentation_bp.route("/augment/rotate", methods=["POST"])
+@instrumented("rotate")
 @jwt_required()
+@profiled("rotate")
 def rotate_batch_image():
     """Rotate an image multiple times and return as ZIP file.
     
     Receives an image file and num_images via POST request, applies batch
     processing logic, and returns batches of rotated images to frontend.
+    With ``format`` set to ``webp``, ``gif`` or ``apng`` the rotations
+    come back as one looping animation instead, for previews (see
+    :func:`_rotation_output`).
     
     Returns:
-        Response: ZIP file containing rotated images or error JSON.
+        Response: ZIP file or animation of rotated images, or error JSON.
     """
     # File validation
-    if "image" not in request.files:
+    image_file, max_size, error = _source_file()
+    if error is not None:
+        return error
+    if image_file is None:
         return jsonify({"error": "no image uploaded"}), 400
-        
-    image_file = request.files['image']
     
     # File size validation
-    is_valid, error_msg = validate_image_size(image_file)
+    is_valid, error_msg = validate_image_size(image_file, max_size)
     
     if not is_valid:
         return jsonify({"error": error_msg}), 400
@@ -120,54 +499,130 @@ def rotate_batch_image():
             "error": f"num_images must be between {MIN_IMAGES} "
                      f"and {MAX_IMAGES}"
         }), 400
+
+    try:
+        quality = _resample_quality()
+        output = _rotation_output()
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     
     user_email = get_jwt_identity()
     logs = get_log_collection()
+
+    if output:
+        container = output["container"]
+        mimetype = ANIMATION_FORMATS[container][1]
+        download_name = f"augmented_rotation.{container}"
+    else:
+        mimetype = 'application/zip'
+        download_name = 'augmented_rotated_images.zip'
     
     # Batch processing and error handling
     try:
-        zip_buffer = _rotate_and_zip(image_file, num_images)
+        params = dict(output, num_images=num_images, quality=quality)
+        etag = _result_etag(image_file, params)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        # Sets rendered before are served from the result store
+        store = ResultStore.from_config(current_app.config)
+        stored = store.get(etag)
+        outcome = {"stored": stored is not None}
+        if stored is not None:
+            annotate_profile(stored_result=True)
+            zip_buffer = stored["path"]
+            with open(zip_buffer, "rb") as handle:
+                record_bytes_out(handle)
+        else:
+            # Header-only parse; the controller performs the full decode
+            source = Image.open(image_file)
+            record_image(source)
+            annotate_profile(image_size=source.size, image_mode=source.mode)
+            image_file.seek(0)
 
-        logs.insert_one({
-            "user_email": user_email,
-            "action": "ROTATE_BATCH_IMAGE",
-            "filename": image_file.filename,
-            "timestamp": datetime.datetime.utcnow()
-        })
+            def render():
+                data = profile_call(
+                    _rotate_and_animate if output else _rotate_and_zip,
+                    image_file, num_images, quality, **output
+                ).getvalue()
+                # Requests coalesced onto this render never learn the
+                # outcome and go without Content-Location
+                outcome["stored"] = store.put(
+                    etag, data, mimetype, download_name
+                )
+                return data
 
-        return send_file(
+            # Rotation and encoding are interleaved per frame
+            with stage("augment"):
+                zip_buffer = _coalesced(image_file, params, render)
+            record_bytes_out(zip_buffer)
+
+        with stage("log"):
+            logs.insert_one({
+                "user_email": user_email,
+                "action": "ROTATE_BATCH_IMAGE",
+                "filename": image_file.filename,
+                "timestamp": datetime.datetime.utcnow()
+            })
+
+        response = cache_headers(send_file(
             zip_buffer,
-            mimetype='application/zip',
+            mimetype=mimetype,
             as_attachment=True,
-            download_name='augmented_rotated_images.zip'
-        )
+            download_name=download_name,
+        ), etag)
+        if outcome["stored"]:
+            # Resumable, Range-capable copy of the same result
+            response.headers["Content-Location"] = f"/results/{etag}"
+        return response
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
     
 
 @augmentation_bp.route("/augment/basic", methods=["POST"])
+@instrumented("basic")
 @jwt_required()
+@profiled("basic")
 def basic_augmentation():
     """Perform basic image augmentations.
     
-    Supports rotate, scale, and flip operations on uploaded images.
+    Supports rotate, scale, and flip operations on uploaded images;
+    ``quality`` selects the resampling tier (see :func:`_resample_quality`).
+    With ``preview`` set, renders a JPEG against a cached downscaled
+    proxy instead (see :func:`_preview_source`); previews are not logged.
+    Sending the same request without ``preview`` renders the final
+    image at full resolution.
     
     Returns:
         Response: Augmented image file or error JSON.
     """
-    if "image" not in request.files:
+    preview = _preview_requested()
+    image_file, _, error = _source_file()
+    if error is not None:
+        return error
+    if image_file is None and not preview:
         return error_response("No image uploaded", 400)
 
-    image_file = request.files["image"]
-
-    if not allowed_file(image_file.filename):
+    if image_file is not None and not allowed_file(image_file.filename):
         return error_response("Invalid file type. Use PNG/JPG/JPEG", 400)
 
     try:
-        image = Image.open(image_file)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        if preview:
+            with stage("decode"):
+                source = _preview_source(image_file)
+            if source is None:
+                return error_response(
+                    "Preview expired or no image uploaded", 404
+                )
+            image, _, preview_id = source
+        else:
+            # Header only; the full decode happens in render()
+            image = Image.open(image_file)
+        record_image(image)
 
         # Load operations list from JSON body or single form parameter
         json_data = request.get_json(silent=True)
@@ -202,8 +657,9 @@ def basic_augmentation():
                     "Invalid operation. Use 'rotate', 'scale', or 'flip'.", 400
                 )
 
-        # Apply operations sequentially
-        op_names = []
+        # Validate every operation before any work is done
+        quality = _resample_quality()
+        steps = []
         for op in operations:
             op_type = op.get("type")
 
@@ -213,8 +669,10 @@ def basic_augmentation():
                     return error_response(
                         "Angle must be between 0 and 360 degrees.", 400
                     )
-                image = _basic_rotate(image, angle)
-                op_names.append("rotate")
+                steps.append(("rotate", {
+                    "angle": angle,
+                    "quality": _check_quality(op.get("quality", quality)),
+                }))
 
             elif op_type == "scale":
                 scale_factor = float(op.get("scale_factor", 1.0))
@@ -222,82 +680,110 @@ def basic_augmentation():
                     return error_response(
                         "Scale factor must be between 0.1 and 2.0.", 400
                     )
-                image = _scale_image(image, scale_factor)
-                op_names.append("scale")
+                steps.append(("scale", {
+                    "scale_factor": scale_factor,
+                    "quality": _check_quality(op.get("quality", quality)),
+                }))
 
             elif op_type == "flip":
                 direction = op.get("direction", "horizontal")
                 if direction not in ["horizontal", "vertical"]:
                     return error_response(
-                        "Direction must be 'horizontal' or 'vertical'.", 400
+                        "Direction must be 'horizontal' or 'vertical'.",
+                        400
                     )
-                image = _flip_image(image, direction)
-                op_names.append("flip")
+                steps.append(("flip", {"direction": direction}))
 
             else:
-                return error_response(f"Invalid operation type: {op_type}.", 400)
+                return error_response(
+                    f"Invalid operation type: {op_type}.", 400
+                )
+        pipeline = Pipeline(steps)
+        op_names = pipeline.names
+
+        if preview:
+            # Apply operations sequentially
+            with stage("augment"):
+                result = profile_call(pipeline.run, image)
+            return _preview_response(result, preview_id)
+
+        etag = _result_etag(image_file, steps)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
 
         # Prepare image for response
         filename_suffix = "_".join(op_names) if op_names else "basic"
-        img_buffer = io.BytesIO()
-        image.save(img_buffer, format="PNG")
-        img_buffer.seek(0)
+        img_buffer = _coalesced(
+            image_file, steps,
+            lambda: _render_png(image, pipeline, image_file),
+        )
+        record_bytes_out(img_buffer)
 
         user_email = get_jwt_identity()
         logs = get_log_collection()
 
-        logs.insert_one({
-            "user_email": user_email,
-            "action": f"{filename_suffix}_BASIC_AUGMENTATION",
-            "filename": image_file.filename,
-            "timestamp": datetime.datetime.utcnow()
-        })
+        with stage("log"):
+            logs.insert_one({
+                "user_email": user_email,
+                "action": f"{filename_suffix}_BASIC_AUGMENTATION",
+                "filename": image_file.filename,
+                "timestamp": datetime.datetime.utcnow()
+            })
 
-        return send_file(
+        return cache_headers(send_file(
             img_buffer,
             mimetype="image/png",
             as_attachment=True,
             download_name=f"basic_augmented_{filename_suffix}.png",
-        )
+        ), etag)
 
     except ValueError as val_err:
         return error_response(str(val_err), 400)
     
     
 @augmentation_bp.route("/augment/advanced", methods=["POST"])
+@instrumented("advanced")
 @jwt_required()
+@profiled("advanced")
 def advanced_augmentation():
     """Handle advanced image augmentation with multiple operations.
     
     Supports brightness, contrast, saturation, blur, and grayscale
-    adjustments on uploaded images.
+    adjustments on uploaded images. With ``preview`` set, renders a JPEG
+    against a cached downscaled proxy instead, with blur radii scaled to
+    match; previews are not logged. Sending the same request without
+    ``preview`` renders the final image at full resolution.
     
     Returns:
         Response: Augmented image file or error JSON.
     """
-    if "image" not in request.files:
+    preview = _preview_requested()
+    image_file, max_size, error = _source_file()
+    if error is not None:
+        return error
+    if image_file is None and not preview:
         return error_response("No image uploaded", 400)
 
-    image_file = request.files["image"]
-    if not allowed_file(image_file.filename):
-        return error_response("Invalid file type. Use PNG/JPG/JPEG", 400)
+    if image_file is not None:
+        if not allowed_file(image_file.filename):
+            return error_response(
+                "Invalid file type. Use PNG/JPG/JPEG", 400
+            )
 
-    # Add size validation (consistent with other endpoints)
-    is_valid, error_msg = validate_image_size(image_file)
-    if not is_valid:
-        return error_response(error_msg, 400)
+        # Add size validation (consistent with other endpoints)
+        is_valid, error_msg = validate_image_size(image_file, max_size)
+        if not is_valid:
+            return error_response(error_msg, 400)
 
     try:
-        image = Image.open(image_file)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
         # Default advanced parameters
         advanced_params = {
             "brightness": 1.0,
             "contrast": 1.0,
             "saturation": 1.0,
             "blur": False,
+            "blur_radius": 0.0,
             "grayscale": False,
         }
 
@@ -343,6 +829,14 @@ def advanced_augmentation():
 
                 elif op_type == "blur":
                     advanced_params["blur"] = bool(op.get("enabled", True))
+                    radius = float(op.get("radius", 0.0))
+                    if not 0.0 <= radius <= MAX_BLUR_RADIUS:
+                        return error_response(
+                            "Blur radius must be between 0 and "
+                            f"{MAX_BLUR_RADIUS}",
+                            400
+                        )
+                    advanced_params["blur_radius"] = radius
 
                 elif op_type == "grayscale":
                     advanced_params["grayscale"] = bool(
@@ -386,44 +880,187 @@ def advanced_augmentation():
                 )
 
             advanced_params["blur"] = request.form.get("blur") == "on"
+            # A radius selects a Gaussian blur instead of the fixed kernel
+            advanced_params["blur_radius"] = float(
+                request.form.get("blur_radius") or 0.0
+            )
+            if not 0.0 <= advanced_params["blur_radius"] <= MAX_BLUR_RADIUS:
+                return error_response(
+                    f"Blur radius must be between 0 and {MAX_BLUR_RADIUS}",
+                    400
+                )
             advanced_params["grayscale"] = (
                 request.form.get("grayscale") == "on"
             )
 
-        # Apply augmentations
-        augmented_image = _augment_image(
-            image=image,
-            brightness=advanced_params["brightness"],
-            contrast=advanced_params["contrast"],
-            saturation=advanced_params["saturation"],
-            blur=advanced_params["blur"],
-            grayscale=advanced_params["grayscale"],
-        )
+        if preview:
+            with stage("decode"):
+                source = _preview_source(image_file)
+            if source is None:
+                return error_response(
+                    "Preview expired or no image uploaded", 404
+                )
+            proxy, scale, preview_id = source
+            record_image(proxy)
 
-        # Prepare image for sending
-        img_buffer = io.BytesIO()
-        augmented_image.save(img_buffer, format="PNG")
-        img_buffer.seek(0)
+            # Blur radii are given in source pixels
+            preview_params = dict(
+                advanced_params,
+                blur_radius=advanced_params["blur_radius"] * scale,
+            )
+            with stage("augment"):
+                preview_image = profile_call(
+                    _augment_image, image=proxy, **preview_params
+                )
+            return _preview_response(preview_image, preview_id)
+
+        # Very large images are only header-parsed here and processed
+        # tile by tile, so they are never held in memory as a whole
+        etag = _result_etag(image_file, advanced_params)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        steps = _steps_for_augment(**advanced_params)
+        image = Image.open(image_file)
+        tiled = _use_tiled(image, steps)
+        record_image(image)
+
+        if tiled:
+            with stage("augment"):
+                img_buffer = _augment_upload_tiled(image_file, steps)
+        else:
+            # Same operations, in the same order, as _augment_image
+            pipeline = Pipeline(steps)
+            img_buffer = _coalesced(
+                image_file, advanced_params,
+                lambda: _render_png(image, pipeline, image_file),
+            )
+        record_bytes_out(img_buffer)
 
         user_email = get_jwt_identity()
         logs = get_log_collection()
 
-        logs.insert_one({
-            "user_email": user_email,
-            "action": "ADVANCE_AUGMENTATION",
-            "filename": image_file.filename,
-            "timestamp": datetime.datetime.utcnow()
-        })
+        with stage("log"):
+            logs.insert_one({
+                "user_email": user_email,
+                "action": "ADVANCE_AUGMENTATION",
+                "filename": image_file.filename,
+                "timestamp": datetime.datetime.utcnow()
+            })
 
-        return send_file(
+        return cache_headers(send_file(
             img_buffer,
             mimetype="image/png",
             as_attachment=True,
             download_name="advanced_augmented_image.png",
-        )
+        ), etag)
 
     except ValueError as ve:
         return error_response(str(ve), 400)
     except Exception as e:
         logger.error(f"Advanced augmentation error: {e}")
-        return error_response(str(e), 500)
\ No newline at end of file
+        return error_response(str(e), 500)
+
+
+@augmentation_bp.route("/augment/pipeline", methods=["POST"])
+@instrumented("pipeline")
+@jwt_required()
+@profiled("pipeline")
+def pipeline_augmentation():
+    """Apply an ordered list of mixed operations in a single pass.
+    
+    Accepts any sequence of basic (rotate, scale, flip), advanced
+    (brightness, contrast, saturation, blur, grayscale) and random
+    operations. The list is sent as a JSON string in the ``operations``
+    form field (or as ``operations`` in a JSON body) and is validated
+    before the image is decoded. The image is decoded and encoded once.
+    An optional ``quality`` tier sets the resampling filter of geometric
+    steps that do not choose their own.
+    
+    Returns:
+        Response: Augmented image file or error JSON.
+    """
+    image_file, max_size, error = _source_file()
+    if error is not None:
+        return error
+    if image_file is None:
+        return error_response("No image uploaded", 400)
+
+    if not allowed_file(image_file.filename):
+        return error_response("Invalid file type. Use PNG/JPG/JPEG", 400)
+
+    is_valid, error_msg = validate_image_size(image_file, max_size)
+    if not is_valid:
+        return error_response(error_msg, 400)
+
+    operations = request.form.get("operations")
+    if operations is not None:
+        try:
+            operations = json.loads(operations)
+        except json.JSONDecodeError:
+            return error_response("Operations must be valid JSON", 400)
+    else:
+        json_data = request.get_json(silent=True) or {}
+        operations = json_data.get("operations")
+
+    try:
+        pipeline = Pipeline.from_operations(operations).with_quality(
+            _resample_quality()
+        )
+
+        # Random output differs per request, so it has no ETag
+        etag = None
+        if "random" not in pipeline.names:
+            etag = _result_etag(image_file, pipeline.to_operations())
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+
+        image = Image.open(image_file)
+        tiled = _use_tiled(image, pipeline.steps)
+        record_image(image)
+
+        def render():
+            return _render_png(image, pipeline, image_file)
+
+        if tiled:
+            with stage("augment"):
+                img_buffer = _augment_upload_tiled(image_file, pipeline.steps)
+        elif etag is None:
+            # Random output differs per request, so never share it
+            img_buffer = io.BytesIO(render())
+        else:
+            img_buffer = _coalesced(
+                image_file, pipeline.to_operations(), render
+            )
+        record_bytes_out(img_buffer)
+
+        user_email = get_jwt_identity()
+        logs = get_log_collection()
+
+        with stage("log"):
+            logs.insert_one({
+                "user_email": user_email,
+                "action": "PIPELINE_AUGMENTATION",
+                "operations": pipeline.to_operations(),
+                "filename": image_file.filename,
+                "timestamp": datetime.datetime.utcnow()
+            })
+
+        response = send_file(
+            img_buffer,
+            mimetype="image/png",
+            as_attachment=True,
+            download_name=f"pipeline_{'_'.join(pipeline.names)}.png",
+        )
+        if etag is None:
+            response.headers["Cache-Control"] = "no-store"
+            return response
+        return cache_headers(response, etag)
+
+    except ValueError as ve:
+        return error_response(str(ve), 400)
+    except Exception as e:
+        logger.error(f"Pipeline augmentation error: {e}")
+        return error_response(str(e), 500)
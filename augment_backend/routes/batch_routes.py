@@ -0,0 +1,291 @@
+"""Batch augmentation routes processing many uploads per request."""
+import datetime
+import hashlib
+import io
+import json
+import logging
+
+from flask import (
+    Blueprint, Response, current_app, request, send_file,
+    stream_with_context,
+)
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from controllers.basic_aug import _check_quality
+from controllers.batch import _output_name, _process_batch, _stream_zip
+from controllers.pipeline import Pipeline
+from database import get_log_collection
+from metrics import instrumented
+from profiling import (
+    annotate_profile, note_offloaded, profile_iter, profiled
+)
+from results import ResultStore, result_etag
+from utils import (
+    allowed_file, cache_headers, error_response, not_modified,
+    validate_image_size,
+)
+
+
+batch_bp = Blueprint('batch', __name__)
+logger = logging.getLogger(__name__)
+
+BASIC_OPERATIONS = {"rotate", "scale", "flip"}
+ADVANCED_OPERATIONS = {
+    "brightness", "contrast", "saturation", "blur", "grayscale"
+}
+
+
+def _load_json_field(name):
+    """
+    Parse a JSON-encoded form field; returns None when it is absent.
+    """
+    raw = request.form.get(name)
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError(f"'{name}' must be valid JSON") from None
+
+
+def _build_pipeline(operations, allowed):
+    """
+    Validate operations for a batch route and build their pipeline.
+    """
+    pipeline = Pipeline.from_operations(operations)
+    invalid = [name for name in pipeline.names if name not in allowed]
+    if invalid:
+        raise ValueError(
+            f"Invalid operation type: {invalid[0]}. "
+            f"Use {', '.join(sorted(repr(name) for name in allowed))}"
+        )
+    return pipeline
+
+
+def _collect_files():
+    """
+    Return validated uploads from the ``images`` field.
+    """
+    files = request.files.getlist("images")
+    if not files:
+        raise ValueError("No images uploaded")
+
+    max_files = current_app.config["BATCH_MAX_FILES"]
+    if len(files) > max_files:
+        raise ValueError(f"At most {max_files} images per batch")
+
+    for image_file in files:
+        if not allowed_file(image_file.filename):
+            raise ValueError(
+                f"Invalid file type for {image_file.filename}. "
+                "Use PNG/JPG/JPEG"
+            )
+        is_valid, error_msg = validate_image_size(image_file)
+        if not is_valid:
+            raise ValueError(f"{image_file.filename}: {error_msg}")
+    return files
+
+
+def _batch_response(action, allowed, default_operations=None):
+    """Validate a batch upload and stream back a ZIP of results.
+
+    The ``operations`` form field (JSON list) applies to every file;
+    ``per_file_operations`` (JSON object keyed by filename) overrides it
+    for individual files, and the ``quality`` field sets the resampling
+    tier of geometric operations. Images are processed on the shared
+    worker pool and written to the archive as they finish, in upload
+    order. Files that fail are listed in ``errors.json`` inside the
+    archive. All log entries are written with a single bulk insert once
+    the archive is complete.
+
+    Batches without random operations are deterministic: the archive is
+    sent with an ETag over every file's bytes and operations, kept in the
+    result store once fully streamed, and served from there (with a
+    ``Content-Location`` for Range downloads) when requested again.
+
+    Returns:
+        Response: Streamed ZIP archive or error JSON.
+    """
+    # Batches may exceed the single-image request limit
+    request.max_content_length = current_app.config[
+        "BATCH_MAX_CONTENT_LENGTH"
+    ]
+
+    try:
+        files = _collect_files()
+
+        if default_operations is not None:
+            operations = default_operations
+        else:
+            operations = _load_json_field("operations")
+        per_file = _load_json_field("per_file_operations") or {}
+        if not isinstance(per_file, dict):
+            raise ValueError("'per_file_operations' must be an object")
+
+        quality = _check_quality(request.form.get(
+            "quality", current_app.config["RESAMPLE_QUALITY"]
+        ))
+
+        default_pipeline = None
+        if operations is not None:
+            default_pipeline = _build_pipeline(
+                operations, allowed
+            ).with_quality(quality)
+
+        pipelines = {
+            filename: _build_pipeline(ops, allowed).with_quality(quality)
+            for filename, ops in per_file.items()
+        }
+        jobs = []
+        for image_file in files:
+            pipeline = pipelines.get(image_file.filename, default_pipeline)
+            if pipeline is None:
+                raise ValueError(
+                    f"No operations given for {image_file.filename}"
+                )
+            # Upload streams are closed once the view returns, before the
+            # archive is streamed, so keep the encoded bytes
+            jobs.append(
+                (image_file.filename, io.BytesIO(image_file.read()), pipeline)
+            )
+    except ValueError as ve:
+        return error_response(str(ve), 400)
+
+    user_email = get_jwt_identity()
+    workers = current_app.config["BATCH_WORKERS"]
+    annotate_profile(batch_size=len(jobs))
+    download_name = f"{action.lower()}.zip"
+
+    etag = store = None
+    if not any("random" in pipeline.names for _, _, pipeline in jobs):
+        etag = result_etag(request.endpoint, [
+            (
+                filename,
+                hashlib.sha256(data.getbuffer()).hexdigest(),
+                pipeline.to_operations(),
+            )
+            for filename, data, pipeline in jobs
+        ])
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        store = ResultStore.from_config(current_app.config)
+        stored = store.get(etag)
+        if stored is not None:
+            get_log_collection().insert_many([
+                {
+                    "user_email": user_email,
+                    "action": action,
+                    "filename": filename,
+                    "timestamp": datetime.datetime.utcnow()
+                }
+                for filename, _, _ in jobs
+            ])
+            response = send_file(
+                stored["path"],
+                mimetype="application/zip",
+                as_attachment=True,
+                download_name=download_name,
+            )
+            response.headers["Content-Location"] = f"/results/{etag}"
+            return cache_headers(response, etag)
+
+    def generate():
+        errors = []
+        log_entries = []
+
+        def entries():
+            note_offloaded("thread")
+            results = profile_iter(_process_batch, jobs, workers)
+            for index, (filename, data, error) in enumerate(results):
+                if error is not None:
+                    logger.error("Batch item %s failed: %s", filename, error)
+                    errors.append({"filename": filename, "error": error})
+                    continue
+                log_entries.append({
+                    "user_email": user_email,
+                    "action": action,
+                    "filename": filename,
+                    "timestamp": datetime.datetime.utcnow()
+                })
+                yield _output_name(filename, index), data
+            if errors:
+                yield "errors.json", json.dumps(errors, indent=2).encode()
+
+        # The archive is kept only if the client received all of it
+        pending = None
+        if store is not None:
+            pending = store.open(etag, "application/zip", download_name)
+        complete = False
+        try:
+            for chunk in _stream_zip(entries()):
+                if pending is not None:
+                    pending.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            if pending is not None:
+                if complete:
+                    pending.commit()
+                else:
+                    pending.discard()
+
+        if log_entries:
+            get_log_collection().insert_many(log_entries)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={download_name}"
+        },
+    )
+    if etag is None:
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    return cache_headers(response, etag)
+
+
+@batch_bp.route("/augment/basic/batch", methods=["POST"])
+@instrumented("basic_batch")
+@jwt_required()
+@profiled("basic_batch")
+def basic_batch_augmentation():
+    """Apply basic operations (rotate, scale, flip) to many images.
+
+    Returns:
+        Response: Streamed ZIP archive or error JSON.
+    """
+    return _batch_response("BASIC_BATCH_AUGMENTATION", BASIC_OPERATIONS)
+
+
+@batch_bp.route("/augment/advanced/batch", methods=["POST"])
+@instrumented("advanced_batch")
+@jwt_required()
+@profiled("advanced_batch")
+def advanced_batch_augmentation():
+    """Apply advanced colour operations to many images.
+
+    Returns:
+        Response: Streamed ZIP archive or error JSON.
+    """
+    return _batch_response(
+        "ADVANCE_BATCH_AUGMENTATION", ADVANCED_OPERATIONS
+    )
+
+
+@batch_bp.route("/augment/random/batch", methods=["POST"])
+@instrumented("random_batch")
+@jwt_required()
+@profiled("random_batch")
+def random_batch_augmentation():
+    """Apply an independent random augmentation to each of many images.
+
+    Returns:
+        Response: Streamed ZIP archive or error JSON.
+    """
+    return _batch_response(
+        "RANDOM_BATCH_AUGMENTATION", {"random"},
+        default_operations=[{"type": "random"}],
+    )
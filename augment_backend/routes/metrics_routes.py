@@ -0,0 +1,20 @@
+"""Metrics route exposing request instrumentation to Prometheus."""
+from flask import Blueprint, Response
+
+from metrics import registry
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose collected metrics in Prometheus text exposition format.
+    
+    Returns:
+        Response: Plain-text metrics payload.
+    """
+    return Response(
+        registry.render(),
+        mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,77 @@
+"""Routes for listing and downloading stored request profiles."""
+import json
+import os
+
+from flask import Blueprint, current_app, jsonify, send_file
+from flask_jwt_extended import get_jwt_identity, jwt_required
+
+from utils import error_response
+
+
+profile_bp = Blueprint('profiles', __name__)
+
+
+def _load_metadata(directory, profile_id):
+    """
+    Load the metadata stored alongside a profile, or None if it is
+    missing or belongs to another user.
+    """
+    path = os.path.join(directory, f"{profile_id}.json")
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as handle:
+        metadata = json.load(handle)
+    # Profiles record the request's parameters and filenames
+    if metadata.get("user_email") != get_jwt_identity():
+        return None
+    return metadata
+
+
+@profile_bp.route("/profiles", methods=["GET"])
+@jwt_required()
+def list_profiles():
+    """List the caller's stored profiles, newest first.
+    
+    Returns:
+        tuple: JSON list of profile metadata and HTTP status code.
+    """
+    directory = current_app.config["PROFILE_DIR"]
+    if not os.path.isdir(directory):
+        return jsonify({"profiles": []}), 200
+
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            metadata = _load_metadata(directory, name[:-len(".json")])
+            if metadata:
+                profiles.append(metadata)
+
+    profiles.sort(key=lambda item: item.get("timestamp", ""), reverse=True)
+    return jsonify({"profiles": profiles}), 200
+
+
+@profile_bp.route("/profiles/<profile_id>", methods=["GET"])
+@jwt_required()
+def download_profile(profile_id):
+    """Download one of the caller's stored profiles.
+    
+    cProfile results are pstats-compatible ``.prof`` files; sampling
+    results are collapsed stacks suitable for flame graph tools.
+    
+    Returns:
+        Response: Profile file or error JSON.
+    """
+    if not profile_id.isalnum():
+        return error_response("Invalid profile id", 400)
+
+    directory = current_app.config["PROFILE_DIR"]
+    metadata = _load_metadata(directory, profile_id)
+    if metadata is None:
+        return error_response("Profile not found", 404)
+
+    return send_file(
+        os.path.join(directory, metadata["profile_file"]),
+        mimetype="application/octet-stream",
+        as_attachment=True,
+        download_name=metadata["profile_file"],
+    )
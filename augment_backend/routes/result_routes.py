@@ -0,0 +1,38 @@
+"""Routes for downloading stored augmentation results."""
+from flask import Blueprint, current_app, send_file
+from flask_jwt_extended import jwt_required
+
+from results import ResultStore
+from utils import cache_headers, error_response
+
+
+result_bp = Blueprint('results', __name__)
+
+
+@result_bp.route("/results/<result_id>", methods=["GET"])
+@jwt_required()
+def download_result(result_id):
+    """Download a stored rotation set or batch archive.
+
+    The id is the ETag the result was first sent with (and its
+    ``Content-Location``). Supports ``Range`` requests, so interrupted
+    downloads can resume, and ``If-None-Match``/``If-Range``
+    revalidation.
+
+    Returns:
+        Response: The result (whole or partial) or error JSON.
+    """
+    meta = ResultStore.from_config(current_app.config).get(result_id)
+    if meta is None:
+        return error_response("Result not found", 404)
+
+    response = send_file(
+        meta["path"],
+        mimetype=meta["mimetype"],
+        as_attachment=True,
+        download_name=meta["download_name"],
+        conditional=True,
+        etag=result_id,
+        max_age=None,
+    )
+    return cache_headers(response, result_id)
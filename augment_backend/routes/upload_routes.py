@@ -0,0 +1,170 @@
+"""Routes for resumable chunked uploads of large source images."""
+import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from database import get_log_collection
+from uploads import OffsetMismatch, UploadBusy, UploadStore
+from utils import allowed_file, error_response
+
+
+upload_bp = Blueprint('uploads', __name__)
+
+OFFSET_HEADER = "Upload-Offset"
+CHUNK_CHECKSUM_HEADER = "X-Chunk-SHA256"
+
+
+def _status(store, meta):
+    """
+    JSON body and headers describing an upload's progress.
+    """
+    offset = store.offset(meta)
+    body = jsonify({
+        "upload_id": meta["upload_id"],
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "offset": offset,
+        "completed": meta["completed"],
+        "chunk_size": current_app.config["UPLOAD_CHUNK_SIZE"],
+    })
+    body.headers[OFFSET_HEADER] = str(offset)
+    body.headers["Upload-Length"] = str(meta["size"])
+    return body
+
+
+def _lookup(upload_id):
+    """
+    Return the store and the caller's upload, or None for the upload.
+    """
+    store = UploadStore.from_config(current_app.config)
+    return store, store.get(upload_id, get_jwt_identity())
+
+
+@upload_bp.route("/uploads", methods=["POST"])
+@jwt_required()
+def create_upload():
+    """Start a chunked upload.
+
+    Expects JSON with ``filename``, the total ``size`` in bytes and
+    optionally the ``sha256`` hex digest of the whole file.
+
+    Returns:
+        tuple: JSON upload status and HTTP status code.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get("filename") or ""
+    if not allowed_file(filename):
+        return error_response("Invalid file type. Use PNG/JPG/JPEG", 400)
+
+    store = UploadStore.from_config(current_app.config)
+    try:
+        meta = store.create(
+            get_jwt_identity(), filename, data.get("size"),
+            data.get("sha256"),
+        )
+    except ValueError as ve:
+        return error_response(str(ve), 400)
+    return _status(store, meta), 201
+
+
+@upload_bp.route("/uploads/<upload_id>", methods=["GET"])
+@jwt_required()
+def upload_status(upload_id):
+    """Report how much of an upload has been received.
+
+    Also answers ``HEAD`` requests, with the offset to resume from in
+    the ``Upload-Offset`` header.
+
+    Returns:
+        tuple: JSON upload status and HTTP status code.
+    """
+    store, meta = _lookup(upload_id)
+    if meta is None:
+        return error_response("Upload not found", 404)
+    return _status(store, meta), 200
+
+
+@upload_bp.route("/uploads/<upload_id>", methods=["PATCH"])
+@jwt_required()
+def upload_chunk(upload_id):
+    """Append a chunk to an upload.
+
+    The raw request body is the chunk; the ``Upload-Offset`` header must
+    equal the number of bytes already received. An optional
+    ``X-Chunk-SHA256`` header is checked before the chunk is kept.
+
+    Returns:
+        tuple: JSON upload status and HTTP status code.
+    """
+    # Chunks have their own limit, independent of single-image uploads
+    request.max_content_length = current_app.config["UPLOAD_CHUNK_SIZE"]
+
+    store, meta = _lookup(upload_id)
+    if meta is None:
+        return error_response("Upload not found", 404)
+
+    try:
+        offset = int(request.headers[OFFSET_HEADER])
+    except (KeyError, ValueError):
+        return error_response(f"{OFFSET_HEADER} header required", 400)
+    length = request.content_length
+    if length is None:
+        return error_response("Content-Length header required", 411)
+
+    try:
+        store.append(
+            meta, offset, request.stream, length,
+            request.headers.get(CHUNK_CHECKSUM_HEADER),
+        )
+    except OffsetMismatch as mismatch:
+        response = error_response(str(mismatch), 409)
+        response[0].headers[OFFSET_HEADER] = str(mismatch.offset)
+        return response
+    except UploadBusy as busy:
+        return error_response(str(busy), 409)
+    except ValueError as ve:
+        return error_response(str(ve), 400)
+    return _status(store, meta), 200
+
+
+@upload_bp.route("/uploads/<upload_id>/complete", methods=["POST"])
+@jwt_required()
+def complete_upload(upload_id):
+    """Verify a fully received upload and make it usable.
+
+    Returns:
+        tuple: JSON upload status and HTTP status code.
+    """
+    store, meta = _lookup(upload_id)
+    if meta is None:
+        return error_response("Upload not found", 404)
+
+    try:
+        meta = store.complete(meta)
+    except ValueError as ve:
+        return error_response(str(ve), 400)
+
+    get_log_collection().insert_one({
+        "user_email": meta["owner"],
+        "action": "CHUNKED_UPLOAD",
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "timestamp": datetime.datetime.utcnow()
+    })
+    return _status(store, meta), 200
+
+
+@upload_bp.route("/uploads/<upload_id>", methods=["DELETE"])
+@jwt_required()
+def delete_upload(upload_id):
+    """Discard an upload.
+
+    Returns:
+        tuple: Empty body and HTTP status code.
+    """
+    store, meta = _lookup(upload_id)
+    if meta is None:
+        return error_response("Upload not found", 404)
+    store.delete(meta)
+    return "", 204
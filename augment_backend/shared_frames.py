@@ -0,0 +1,210 @@
+"""Shared-memory handoff of decoded images between processes.
+
+A :class:`FramePool` owns ``multiprocessing.shared_memory`` segments and
+writes frames (raw pixel data) into them. A frame crosses a process
+boundary as a :class:`FrameRef` of a few dozen bytes, and the receiving
+process reads the pixels straight from the shared pages, so no image
+data is pickled or pushed through a pipe.
+
+Every segment starts with a state byte: the owner marks it busy when it
+writes a frame, and the reader (or the owner, once it knows the reader
+is done) marks it free again. Free segments are reused for later frames
+of up to their size, so steady traffic maps no new memory; idle
+segments beyond the pool's budget are unlinked. Segments are unlinked
+for good by :meth:`FramePool.close`, and by the multiprocessing
+resource tracker if the owner dies first.
+"""
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+
+# Modes a frame can hold: one byte per band, no palette
+FRAME_MODES = {"L": 1, "LA": 2, "RGB": 3, "RGBA": 4}
+
+# State byte at the start of every segment (the header keeps the pixel
+# data aligned)
+HEADER_BYTES = 64
+FREE, BUSY = 0, 1
+
+# Segment sizes are rounded up to this, so they fit frames of similar size
+SEGMENT_ALIGN = 1024 * 1024
+
+# Pixel bytes converted per step when writing a frame; small enough to
+# stay in cache, so no full-size temporary copy is made
+WRITE_CHUNK_BYTES = 256 * 1024
+
+# Idle segment bytes a pool keeps for reuse by default
+DEFAULT_IDLE_BYTES = 256 * 1024 * 1024
+
+# Handle of a frame in shared memory
+FrameRef = namedtuple("FrameRef", ["name", "mode", "size"])
+
+
+def _frame_bytes(mode, size):
+    """
+    Bytes of raw pixel data of a frame.
+    """
+    if mode not in FRAME_MODES:
+        allowed = ", ".join(FRAME_MODES)
+        raise ValueError(f"Frame mode must be one of {allowed}")
+    width, height = size
+    return width * height * FRAME_MODES[mode]
+
+
+def _write_pixels(image, view):
+    """
+    Copy an image's raw pixel data into a buffer, chunk by chunk.
+    """
+    encoder = Image._getencoder(image.mode, "raw", image.mode)
+    encoder.setimage(image.im)
+    offset = 0
+    while True:
+        _, status, chunk = encoder.encode(WRITE_CHUNK_BYTES)
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+        if status:
+            break
+    if status < 0:
+        raise OSError(f"Writing the frame failed (error {status})")
+
+
+class FramePool:
+    """Shared-memory segments owned by this process, reused for frames
+    once their readers release them."""
+
+    def __init__(self, max_idle_bytes=DEFAULT_IDLE_BYTES):
+        self.max_idle_bytes = max_idle_bytes
+        self._segments = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self, nbytes):
+        """
+        Return a free segment of at least ``nbytes`` payload bytes,
+        marked busy, creating one when none fits.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Frame pool is closed")
+            self._trim()
+            fitting = [
+                segment for segment in self._segments.values()
+                if segment.buf[0] == FREE
+                and segment.size >= HEADER_BYTES + nbytes
+            ]
+            if fitting:
+                segment = min(fitting, key=lambda item: item.size)
+            else:
+                size = HEADER_BYTES + nbytes
+                size = -(-size // SEGMENT_ALIGN) * SEGMENT_ALIGN
+                segment = shared_memory.SharedMemory(create=True, size=size)
+                self._segments[segment.name] = segment
+            segment.buf[0] = BUSY
+            return segment
+
+    def _trim(self):
+        """
+        Unlink free segments, largest first, while more than
+        ``max_idle_bytes`` of them are idle. Called with the lock held.
+        """
+        idle = sorted(
+            (segment for segment in self._segments.values()
+             if segment.buf[0] == FREE),
+            key=lambda item: item.size, reverse=True,
+        )
+        idle_bytes = sum(segment.size for segment in idle)
+        for segment in idle:
+            if idle_bytes <= self.max_idle_bytes:
+                break
+            idle_bytes -= segment.size
+            del self._segments[segment.name]
+            segment.close()
+            segment.unlink()
+
+    def put(self, image):
+        """
+        Write an image into a pool segment.
+
+        Returns:
+            FrameRef: The handle to pass to the reading process.
+        """
+        nbytes = _frame_bytes(image.mode, image.size)
+        image.load()
+        segment = self._acquire(nbytes)
+        try:
+            view = segment.buf[HEADER_BYTES:HEADER_BYTES + nbytes]
+            try:
+                _write_pixels(image, view)
+            finally:
+                view.release()
+        except Exception:
+            segment.buf[0] = FREE
+            raise
+        return FrameRef(segment.name, image.mode, image.size)
+
+    def release(self, ref):
+        """
+        Mark the segment of a frame written by this pool as free.
+        """
+        with self._lock:
+            segment = self._segments.get(ref.name)
+            if segment is not None:
+                segment.buf[0] = FREE
+
+    def stats(self):
+        """
+        Return the number and total bytes of segments, and how many of
+        them are busy.
+        """
+        with self._lock:
+            segments = list(self._segments.values())
+            return {
+                "segments": len(segments),
+                "bytes": sum(segment.size for segment in segments),
+                "busy": sum(segment.buf[0] == BUSY for segment in segments),
+            }
+
+    def close(self):
+        """
+        Unlink every segment. Frames not read yet are lost.
+        """
+        with self._lock:
+            self._closed = True
+            segments, self._segments = self._segments, {}
+        for segment in segments.values():
+            segment.close()
+            segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_frame(ref, release=True):
+    """
+    Read a frame from another process's pool into a new image.
+
+    The pixels are copied once, from the shared pages into the image.
+    With ``release`` the segment is handed back to its owner afterwards,
+    so the frame must not be read again.
+    """
+    nbytes = _frame_bytes(ref.mode, ref.size)
+    segment = shared_memory.SharedMemory(name=ref.name)
+    try:
+        if segment.buf[0] != BUSY:
+            raise ValueError(f"Frame {ref.name} was already released")
+        view = segment.buf[HEADER_BYTES:HEADER_BYTES + nbytes]
+        try:
+            image = Image.frombytes(ref.mode, ref.size, view)
+        finally:
+            view.release()
+        if release:
+            segment.buf[0] = FREE
+    finally:
+        segment.close()
+    return image
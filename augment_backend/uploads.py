@@ -0,0 +1,261 @@
+"""Resumable chunked uploads assembled on disk.
+
+Clients create an upload with its total size (and optionally the SHA-256
+of the whole file), send the bytes in order with ``PATCH`` requests that
+carry their starting offset, and complete the upload once every byte has
+arrived. Chunks are streamed straight from the request body into a file
+in ``UPLOAD_DIR``, so neither the multipart parser nor the worker's
+memory ever holds the image. After an interruption the client asks for
+the current offset and continues from there.
+
+Completed uploads are passed to the augmentation routes with an
+``upload_id`` form field instead of an ``image`` file.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from werkzeug.datastructures import FileStorage
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class OffsetMismatch(ValueError):
+    """A chunk did not start at the upload's current offset."""
+
+    def __init__(self, offset):
+        super().__init__(f"Chunk must start at offset {offset}")
+        self.offset = offset
+
+
+class UploadBusy(ValueError):
+    """Another request is currently writing to the same upload."""
+
+
+def _copy_stream(stream, handle, length, digest):
+    """
+    Copy up to ``length`` bytes from ``stream`` into ``handle``.
+
+    Returns the number of bytes copied; fewer than ``length`` when the
+    client disconnected.
+    """
+    copied = 0
+    while copied < length:
+        block = stream.read(min(COPY_BUFFER_SIZE, length - copied))
+        if not block:
+            break
+        handle.write(block)
+        digest.update(block)
+        copied += len(block)
+    return copied
+
+
+class UploadStore:
+    """Uploads of all users, one data file and one metadata file each."""
+
+    def __init__(self, directory, max_size, ttl):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the store configured for the running application.
+        """
+        return cls(
+            config["UPLOAD_DIR"], config["UPLOAD_MAX_SIZE"],
+            config["UPLOAD_TTL"],
+        )
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _save(self, meta):
+        path = self._meta_path(meta["upload_id"])
+        with open(path + ".tmp", "w", encoding="utf-8") as handle:
+            json.dump(meta, handle)
+        os.replace(path + ".tmp", path)
+
+    def get(self, upload_id, owner):
+        """
+        Return an upload's metadata, or None if it does not exist or
+        belongs to someone else.
+        """
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(upload_id), encoding="utf-8") as handle:
+                meta = json.load(handle)
+        except FileNotFoundError:
+            return None
+        if meta["owner"] != owner:
+            return None
+        return meta
+
+    def offset(self, meta):
+        """
+        Return how many bytes of an upload have been received.
+        """
+        try:
+            return os.path.getsize(self._data_path(meta["upload_id"]))
+        except FileNotFoundError:
+            return 0
+
+    def create(self, owner, filename, size, sha256=None):
+        """
+        Start a new upload and return its metadata.
+        """
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise ValueError("size must be a positive integer")
+        if size > self.max_size:
+            raise ValueError(
+                f"Upload exceeds the maximum size of {self.max_size} bytes"
+            )
+        if sha256 is not None:
+            sha256 = str(sha256).lower()
+            if len(sha256) != 64 or not all(
+                char in "0123456789abcdef" for char in sha256
+            ):
+                raise ValueError("sha256 must be a hex digest")
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.purge_expired()
+        meta = {
+            "upload_id": uuid.uuid4().hex,
+            "owner": owner,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256,
+            "completed": False,
+            "created_at": time.time(),
+        }
+        open(self._data_path(meta["upload_id"]), "wb").close()
+        self._save(meta)
+        return meta
+
+    def append(self, meta, offset, stream, length, chunk_sha256=None):
+        """
+        Write a chunk read from ``stream`` at ``offset``.
+
+        The offset must equal the bytes received so far. When
+        ``chunk_sha256`` is given and does not match, the chunk is
+        discarded. Returns the new offset; after a client disconnect this
+        covers the bytes that did arrive.
+        """
+        if meta["completed"]:
+            raise ValueError("Upload is already complete")
+        if offset + length > meta["size"]:
+            raise ValueError("Chunk extends past the declared upload size")
+
+        with open(self._data_path(meta["upload_id"]), "r+b") as handle:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadBusy("Upload is being written") from None
+
+            current = handle.seek(0, os.SEEK_END)
+            if offset != current:
+                raise OffsetMismatch(current)
+
+            digest = hashlib.sha256()
+            copied = _copy_stream(stream, handle, length, digest)
+            if chunk_sha256 is not None and (
+                copied != length or digest.hexdigest() != chunk_sha256.lower()
+            ):
+                handle.truncate(offset)
+                raise ValueError("Chunk checksum does not match")
+            handle.flush()
+            os.fsync(handle.fileno())
+            return offset + copied
+
+    def complete(self, meta):
+        """
+        Verify size and checksum of a fully received upload.
+        """
+        if meta["completed"]:
+            return meta
+        path = self._data_path(meta["upload_id"])
+        received = self.offset(meta)
+        if received != meta["size"]:
+            raise ValueError(
+                f"Upload incomplete: {received} of {meta['size']} bytes"
+            )
+        if meta["sha256"]:
+            digest = hashlib.sha256()
+            with open(path, "rb") as handle:
+                for block in iter(
+                    lambda: handle.read(COPY_BUFFER_SIZE), b""
+                ):
+                    digest.update(block)
+            if digest.hexdigest() != meta["sha256"]:
+                # The client has to start over; keep nothing corrupt
+                self.delete(meta)
+                raise ValueError("Upload checksum does not match")
+        meta["completed"] = True
+        self._save(meta)
+        return meta
+
+    def open(self, upload_id, owner):
+        """
+        Open a completed upload as a file the augmentation routes accept.
+
+        The returned file reads from disk, so large sources are never
+        loaded into memory as a whole; ``path`` is exposed for callers
+        that want to memory-map it.
+        """
+        meta = self.get(upload_id, owner)
+        if meta is None:
+            raise LookupError("Upload not found")
+        if not meta["completed"]:
+            raise ValueError("Upload is not complete")
+        path = self._data_path(upload_id)
+        image_file = FileStorage(
+            stream=open(path, "rb"), filename=meta["filename"]
+        )
+        image_file.path = path
+        return image_file
+
+    def delete(self, meta):
+        """
+        Remove an upload and its data.
+        """
+        for path in (
+            self._data_path(meta["upload_id"]),
+            self._meta_path(meta["upload_id"]),
+        ):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self, now=None):
+        """
+        Remove uploads older than the configured time to live.
+        """
+        now = now or time.time()
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name),
+                          encoding="utf-8") as handle:
+                    meta = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            if now - meta.get("created_at", now) > self.ttl:
+                self.delete(meta)
@@ -1,7 +1,7 @@
 """Utility functions for file validation and error handling."""
 import io
 
-from flask import jsonify
+from flask import current_app, jsonify, request
 
 from config import Config
 
@@ -26,9 +26,33 @@ def error_response(message, status_code=400):
     return jsonify({"error": message}), status_code
 
 
-def validate_image_size(image_file):
+def cache_headers(response, etag):
+    """
+    Mark a response with its result's ETag and the configured
+    Cache-Control policy.
+    """
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = current_app.config[
+        "RESULT_CACHE_CONTROL"
+    ]
+    return response
+
+
+def not_modified(etag):
+    """
+    Return a 304 response if the request's If-None-Match already names
+    ``etag``, else None.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return cache_headers(current_app.response_class(status=304), etag)
+
+
+def validate_image_size(image_file, max_size=None):
     """
     Validate the size of an uploaded image file.
+
+    ``max_size`` defaults to the single-request upload limit.
     """
     # Seek to end to get file size
     image_file.seek(0, io.SEEK_END)
@@ -41,7 +65,7 @@ def validate_image_size(image_file):
         return False, "Uploaded image is empty"
     
     # Check file size limit
-    if file_size > Config.MAX_CONTENT_LENGTH:
+    if file_size > (max_size or Config.MAX_CONTENT_LENGTH):
         return False, "Uploaded file is too large"
     
     # No error found